@@ -1,6 +1,7 @@
 import pygame
 import numpy as np
 import random
+from backend.core.physics import first_hit, first_exit, overlap_range, clip, is_whole
 
 class Paddle:
     
@@ -18,7 +19,7 @@ class Paddle:
    
 
     def draw(self, screen):
-        pygame.draw.rect(screen, self.paddle_color, (self.rect.x, self.rect.y, self.width, self.height))
+        return pygame.draw.rect(screen, self.paddle_color, (self.rect.x, self.rect.y, self.width, self.height))
 
 
     def move(self, direction):
@@ -40,7 +41,7 @@ class Paddle:
 
 class Ball:
     
-    def __init__(self, window_height, window_width, player_1_paddle, player_2_paddle, width=10, height=10):
+    def __init__(self, window_height, window_width, player_1_paddle, player_2_paddle, width=10, height=10, rng=None):
         self.height = height
         self.width = width
         self.window_height = window_height
@@ -50,7 +51,10 @@ class Ball:
         self.ball_color = (255, 255, 255)
         self.max_speed = 15
 
-        self.last_serve_left = random.choice([True, False])
+        # Pong passes its own random.Random so every game has its own stream.
+        self.rng = random if rng is None else rng
+
+        self.last_serve_left = self.rng.choice([True, False])
 
         self.spawn()
 
@@ -58,13 +62,13 @@ class Ball:
         self.x = self.window_width / 2
         self.y = self.window_height / 2
 
-        speed = random.choice([4, 5, 6])
+        speed = self.rng.choice([4, 5, 6])
 
         # Flip X velocity every spawn
         self.last_serve_left = not self.last_serve_left
         self.vx = -speed if self.last_serve_left else speed
 
-        self.vy = random.choice([-3, -2, -1, 1, 2, 3])
+        self.vy = self.rng.choice([-3, -2, -1, 1, 2, 3])
 
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
 
@@ -77,9 +81,75 @@ class Ball:
 
 
     def draw(self, screen):
-        pygame.draw.rect(screen, self.ball_color, (self.rect.x, self.rect.y, self.width, self.height))
+        return pygame.draw.rect(screen, self.ball_color, (self.rect.x, self.rect.y, self.width, self.height))
 
     def move(self):
+        # Same result and random draws as move_stepwise(), but the wall and
+        # paddle contact pixels are solved in closed form instead of testing
+        # a new Rect for every pixel.
+        if not is_whole(self.x, self.y):
+            return self.move_stepwise()
+
+        x_step = self.get_step_increment(self.vx)
+        y_step = self.get_step_increment(self.vy)
+        paddles = (self.player_1_paddle.rect, self.player_2_paddle.rect)
+
+        early_collision_detected = (self.rect.colliderect(self.player_1_paddle) or
+                                    self.rect.colliderect(self.player_2_paddle))
+
+        new_x = self.x
+        new_y = self.y
+
+        y_pixels = abs(int(self.vy))
+
+        paddle_hit = y_pixels + 1
+        for paddle in paddles:
+            x_lo, x_hi = overlap_range(paddle.x, paddle.width, self.width)
+            if x_lo <= new_x <= x_hi:
+                y_lo, y_hi = overlap_range(paddle.y, paddle.height, self.height)
+                paddle_hit = min(paddle_hit, first_hit(new_y, y_step, y_pixels, y_lo, y_hi))
+
+        wall_hit = y_pixels + 1
+        if not early_collision_detected:
+            wall_hit = first_exit(new_y, y_step, y_pixels, 0, self.window_height - self.height)
+
+        # The wall test runs before the paddle test on the same pixel.
+        if wall_hit <= y_pixels and wall_hit <= paddle_hit:
+            new_y = new_y + y_step * wall_hit
+            self.vy = clip((self.vy * -1) + self.rng.choice([-1, 1]), self.max_speed)
+        elif paddle_hit <= y_pixels:
+            new_y = new_y + y_step * paddle_hit
+            self.vy = clip(self.vy + self.rng.choice([-1, 1]), self.max_speed)
+        else:
+            new_y = new_y + y_step * y_pixels
+
+        x_pixels = abs(int(self.vx))
+
+        if early_collision_detected:
+            new_x = new_x + x_step * x_pixels
+        else:
+            paddle_hit = x_pixels + 1
+            for paddle in paddles:
+                y_lo, y_hi = overlap_range(paddle.y, paddle.height, self.height)
+                if y_lo <= new_y <= y_hi:
+                    x_lo, x_hi = overlap_range(paddle.x, paddle.width, self.width)
+                    paddle_hit = min(paddle_hit, first_hit(new_x, x_step, x_pixels, x_lo, x_hi))
+
+            if paddle_hit <= x_pixels:
+                new_x = new_x + x_step * paddle_hit
+                # Invert the ball direction and speed up the ball slightly
+                self.vx = clip((self.vx + x_step) * -1, self.max_speed)
+                self.vy = clip(self.vy + self.rng.choice([-1, 1]), self.max_speed)
+            else:
+                new_x = new_x + x_step * x_pixels
+
+        self.x = new_x
+        self.y = new_y
+        self.rect = pygame.Rect(new_x, new_y, self.width, self.height)
+
+
+    def move_stepwise(self):
+        # Reference per-pixel implementation, move() must match it exactly.
         new_x = self.x
         new_y = self.y
         x_step = self.get_step_increment(self.vx)
@@ -97,7 +167,7 @@ class Ball:
 
             if not early_collision_detected:
                 if(not (0 <= new_y <= (self.window_height - self.height))):
-                    self.vy = np.clip((self.vy * -1) + random.choice([-1, 1]), -self.max_speed, self.max_speed)
+                    self.vy = np.clip((self.vy * -1) + self.rng.choice([-1, 1]), -self.max_speed, self.max_speed)
                     break
 
            
@@ -105,7 +175,7 @@ class Ball:
 
             if(new_rect.colliderect(self.player_1_paddle) or 
                    new_rect.colliderect(self.player_2_paddle)):
-                self.vy = np.clip(self.vy + random.choice([-1, 1]), -self.max_speed, self.max_speed)
+                self.vy = np.clip(self.vy + self.rng.choice([-1, 1]), -self.max_speed, self.max_speed)
                 break
 
 
@@ -119,7 +189,7 @@ class Ball:
                    new_rect.colliderect(self.player_2_paddle)):
                     # Invert the ball direction and speed up the ball slightly
                     self.vx = np.clip((self.vx + x_step) * -1, -self.max_speed, self.max_speed)
-                    self.vy = np.clip(self.vy + random.choice([-1, 1]), -self.max_speed, self.max_speed)
+                    self.vy = np.clip(self.vy + self.rng.choice([-1, 1]), -self.max_speed, self.max_speed)
                     break
 
         self.x = new_x
@@ -0,0 +1,187 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import traceback
+import numpy as np
+
+
+def _worker(index, remote, parent_remote, shm_name, ring_shape, env_kwargs, seed):
+    parent_remote.close()
+
+    # Imported here so the parent never has to initialise pygame for the workers.
+    from backend.core.game import Pong
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+    final_slot = ring_shape[0] - 1
+
+    env = Pong(**env_kwargs)
+    if seed is not None:
+        env.reset(seed=seed + index)
+
+    try:
+        while True:
+            command, data = remote.recv()
+
+            if command == "reset":
+                obs, info = env.reset()
+                ring[data, index] = obs
+                remote.send(None)
+
+            elif command == "step":
+                slot, player_1_action, player_2_action = data
+
+                obs, player_1_reward, player_2_reward, done, truncated, info = env.step(player_1_action=player_1_action,
+                                                                                        player_2_action=player_2_action)
+
+                if done or truncated:
+                    ring[final_slot, index] = obs
+                    obs, _ = env.reset()
+
+                ring[slot, index] = obs
+                remote.send((player_1_reward, player_2_reward, done, truncated))
+
+            elif command == "close":
+                break
+
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        remote.send(RuntimeError(f"Pong worker {index} failed:\n{traceback.format_exc()}"))
+    finally:
+        del ring
+        shm.close()
+        remote.close()
+
+
+class AsyncVectorPong:
+
+    # Runs one Pong per worker process. Observations are written by the workers
+    # into a shared-memory ring of (ring_size, N, 1, 84, 84) uint8 frames, only
+    # actions and rewards travel through the pipes. The observation returned by
+    # step_wait() is a view into the ring and stays valid for ring_size - 1
+    # further steps.
+
+    def __init__(self, num_envs, ring_size=2, context="spawn", obs_shape=(1, 84, 84), seed=None, **env_kwargs):
+
+        self.num_envs = num_envs
+        self.ring_size = ring_size
+        self.slot = 0
+        self.waiting = False
+        self.closed = False
+
+        env_kwargs.setdefault("render_mode", "rgb_array")
+
+        # One extra slot holds the last frame of games that auto-reset.
+        ring_shape = (ring_size + 1, num_envs, *obs_shape)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(ring_shape)))
+        self.ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.ring[:] = 0
+
+        ctx = mp.get_context(context)
+
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.processes = []
+
+        for index, (work_remote, remote) in enumerate(zip(work_remotes, self.remotes)):
+            process = ctx.Process(target=_worker,
+                                  args=(index, work_remote, remote, self.shm.name, ring_shape, env_kwargs, seed),
+                                  daemon=True)
+            process.start()
+            work_remote.close()
+            self.processes.append(process)
+
+
+    def _receive(self, indices):
+        results = []
+
+        for i in indices:
+            result = self.remotes[i].recv()
+            if isinstance(result, Exception):
+                self.close()
+                raise result
+            results.append(result)
+
+        return results
+
+
+    def reset(self, mask=None):
+        indices = range(self.num_envs) if mask is None else np.flatnonzero(mask)
+
+        for i in indices:
+            self.remotes[i].send(("reset", self.slot))
+
+        self._receive(indices)
+
+        return self.ring[self.slot], {}
+
+
+    def step_async(self, actions):
+        # actions is (N, 2) with one column per player, -1 lets the bot play that side.
+        if self.waiting:
+            raise RuntimeError("step_async called again before step_wait")
+
+        self.slot = (self.slot + 1) % self.ring_size
+
+        for remote, (player_1_action, player_2_action) in zip(self.remotes, np.asarray(actions).tolist()):
+            remote.send(("step", (self.slot,
+                                  None if player_1_action < 0 else player_1_action,
+                                  None if player_2_action < 0 else player_2_action)))
+
+        self.waiting = True
+
+
+    def step_wait(self):
+        if not self.waiting:
+            raise RuntimeError("step_wait called without step_async")
+
+        results = self._receive(range(self.num_envs))
+        self.waiting = False
+
+        player_1_reward, player_2_reward, done, truncated = (np.array(x) for x in zip(*results))
+
+        info = {}
+        finished = done | truncated
+
+        if finished.any():
+            info["final_observation"] = self.ring[-1]
+            info["_final_observation"] = finished
+
+        return self.ring[self.slot], player_1_reward, player_2_reward, done, truncated, info
+
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+
+    def close(self):
+        if self.closed or not hasattr(self, "processes"):
+            return
+
+        if self.waiting:
+            try:
+                self._receive(range(self.num_envs))
+            except Exception:
+                pass
+
+        for remote, process in zip(self.remotes, self.processes):
+            if process.is_alive():
+                try:
+                    remote.send(("close", None))
+                except (BrokenPipeError, EOFError):
+                    pass
+
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+
+    def __del__(self):
+        self.close()
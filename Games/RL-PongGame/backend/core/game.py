@@ -3,33 +3,62 @@ import sys
 import gymnasium as gym
 import os
 import time
+import random
+from collections import namedtuple
 from backend.core.assets import *
-import cv2
+from backend.core.observation import ObservationRaster, ObservationEncoder, encode_state
+from backend.core.render import TextCache
 import numpy as np
 import torch
 
+# Everything that evolves during a game, enough to branch it with set_state().
+PongState = namedtuple("PongState", ["player_1_y", "player_2_y", "ball_x", "ball_y", "ball_vx", "ball_vy",
+                                     "last_serve_left", "player_1_score", "player_2_score", "rng_state"])
+
+
 class Pong(gym.Env):
 
     def __init__(self, window_width=1280, window_height=960, fps=60, player1="ai", player2="bot",
-                 render_mode="rgb_array", step_repeat=4, bot_difficulty="hard", ai_agent=None):
+                 render_mode="rgb_array", step_repeat=4, bot_difficulty="hard", ai_agent=None, obs_mode="pixels"):
 
         for p in [player1, player2]:
             if p not in {"ai", "bot", "human"}:
                 raise ValueError(f"All players must be ai, bots, or humans")
 
+        if obs_mode not in {"pixels", "state"}:
+            raise ValueError(f"Unknown obs_mode {obs_mode}, expected pixels or state")
+
         self.window_width = window_width
         self.window_height = window_height
         self.step_repeat = step_repeat
         self.render_mode = render_mode
+
+        # "pixels" observes the 84x84 screen, "state" a (1, STATE_DIM) float
+        # vector of the ball and paddle coordinates (see encode_state).
+        self.obs_mode = obs_mode
         
         if(self.render_mode != "human"):
             os.environ["SDL_VIDEODRIVER"] = "dummy"
 
-        pygame.init()
-        pygame.display.set_caption("Pong")
+        # Headless mode never touches a display surface, the 84x84 observation
+        # is written straight from the paddle and ball coordinates.
+        self.headless = (self.render_mode == "headless")
+
+        if self.headless:
+            pygame.font.init()
+            self.screen = None
+            self.raster = ObservationRaster(self.window_width, self.window_height)
+        else:
+            pygame.init()
+            if(self.render_mode == "human"):
+                pygame.display.set_caption("Pong")
+                self.screen = pygame.display.set_mode((self.window_width, self.window_height))
+            else:
+                # Off-screen games each get their own surface, the display one is shared per process.
+                self.screen = pygame.Surface((self.window_width, self.window_height))
+            self.encoder = ObservationEncoder(self.window_width, self.window_height)
 
         self.clock = pygame.time.Clock()
-        self.screen = pygame.display.set_mode((self.window_width, self.window_height))
         self.fps = fps
 
         self.player_1_color = (50, 205, 50)
@@ -45,6 +74,15 @@ class Pong(gym.Env):
         self.font = pygame.font.SysFont(None, 70)
         self.announcement_font = pygame.font.SysFont(None, 150)
 
+        self.score_text = TextCache(self.font)
+        self.announcement_text = TextCache(self.announcement_font)
+
+        # Rects drawn by the last rendered frame, only these get cleared on the next one.
+        self.dirty_rects = []
+        self.previous_rects = []
+        if self.screen is not None:
+            self.screen.fill(self.background_color)
+
         self.player1 = player1
         self.player2 = player2
         
@@ -52,6 +90,9 @@ class Pong(gym.Env):
 
         self.ai_agent = ai_agent
 
+        # Per-game stream for serves, bounces and bots, seeded through reset(seed=...).
+        self.rng = random.Random()
+
         print("Creating new Pong game")
         print("Players:")
         print("Player 1: ", player1)
@@ -60,7 +101,11 @@ class Pong(gym.Env):
 
         self.reset()
 
-    def reset(self):
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        if seed is not None:
+            self.rng.seed(seed)
+
         self.player_1_score = 0
         self.player_2_score = 0
 
@@ -85,51 +130,119 @@ class Pong(gym.Env):
                          height=20,
                          width=20,
                          player_1_paddle=self.player_1_paddle,
-                         player_2_paddle=self.player_2_paddle)
+                         player_2_paddle=self.player_2_paddle,
+                         rng=self.rng)
+
+        if not self.headless:
+            # Full redraw, otherwise pixels outside the last frame's dirty rects survive into the new game.
+            self.dirty_rects = []
+            self.previous_rects = []
+            self.screen.fill(self.background_color)
+            self.render_frame()
+
+            if(self.render_mode == "human"):
+                pygame.display.flip()
+
+        self.observation = self._get_obs()
+
+        return self.observation, {}
+
+
+    def get_state(self):
+        return PongState(player_1_y=self.player_1_paddle.y,
+                         player_2_y=self.player_2_paddle.y,
+                         ball_x=self.ball.x,
+                         ball_y=self.ball.y,
+                         ball_vx=int(self.ball.vx),
+                         ball_vy=int(self.ball.vy),
+                         last_serve_left=self.ball.last_serve_left,
+                         player_1_score=self.player_1_score,
+                         player_2_score=self.player_2_score,
+                         rng_state=self.rng.getstate())
+
+
+    def set_state(self, state):
+        # Restores a get_state() snapshot, the game then plays on exactly as it
+        # would have from that point. Returns the observation of the restored frame.
+        for paddle, y in ((self.player_1_paddle, state.player_1_y), (self.player_2_paddle, state.player_2_y)):
+            paddle.y = y
+            paddle.rect.topleft = (paddle.x, paddle.y)
+
+        self.ball.x = state.ball_x
+        self.ball.y = state.ball_y
+        self.ball.vx = state.ball_vx
+        self.ball.vy = state.ball_vy
+        self.ball.last_serve_left = state.last_serve_left
+        self.ball.rect = pygame.Rect(self.ball.x, self.ball.y, self.ball.width, self.ball.height)
+
+        self.player_1_score = state.player_1_score
+        self.player_2_score = state.player_2_score
+
+        self.rng.setstate(state.rng_state)
+
+        if not self.headless:
+            self.render_frame()
+
+        self.observation = self._get_obs()
+
+        return self.observation
 
-        return self._get_obs(), {}
-        
 
     def _get_obs(self):
-        screen_array = pygame.surfarray.pixels3d(self.screen)
+        if self.obs_mode == "state":
+            return self._get_state_obs()
 
-        screen_array = np.transpose(screen_array, (1, 0, 2))
+        if self.headless:
+            return self._get_headless_obs()
 
-        downscaled_image = cv2.resize(screen_array, (84, 84), interpolation=cv2.INTER_NEAREST)
+        return torch.from_numpy(self.encoder.encode(self.screen))
 
-        grayscale = cv2.cvtColor(downscaled_image, cv2.COLOR_RGB2GRAY)
 
-        grayscale[grayscale != 0] = 255
+    def _get_state_obs(self):
+        state = encode_state(self.ball.x, self.ball.y, self.ball.vx, self.ball.vy,
+                             self.player_1_paddle.y, self.player_2_paddle.y,
+                             self.window_width, self.window_height, self.ball.width,
+                             self.paddle_height, self.ball.max_speed)
 
-        observation = torch.from_numpy(grayscale).float().unsqueeze(0)
+        return torch.from_numpy(state).unsqueeze(0)
 
-        return observation
+
+    def _get_headless_obs(self):
+        grayscale = np.zeros((self.raster.obs_height, self.raster.obs_width), dtype=np.uint8)
+
+        self.raster.draw_text(grayscale, self.font, f'Score: {self.player_1_score}',
+                              self.player_1_color, (self.window_width / 2) + 20, 10)
+        self.raster.draw_text(grayscale, self.font, f'Score: {self.player_2_score}',
+                              self.player_2_color, (self.window_width / 2) - 20, 10, align="right")
+
+        self.raster.draw_rect(grayscale, self.player_1_paddle.rect)
+        self.raster.draw_rect(grayscale, self.player_2_paddle.rect)
+        self.raster.draw_rect(grayscale, self.ball.rect)
+
+        return torch.from_numpy(grayscale).unsqueeze(0)
 
 
     def fill_background(self):
-        self.screen.fill(self.background_color)
+        # Clears only what the previous frame drew instead of the whole screen.
+        self.previous_rects = self.dirty_rects
 
-        player_1_score_surface = self.font.render(f'Score: {self.player_1_score}', 
-                                                  True,
-                                                  self.player_1_color)
-        
-        player_2_score_surface = self.font.render(f'Score: {self.player_2_score}', 
-                                                  True,
-                                                  self.player_2_color)
+        for rect in self.previous_rects:
+            self.screen.fill(self.background_color, rect)
 
-        self.screen.blit(player_1_score_surface, ((self.window_width / 2) + 20, 10))
-        self.screen.blit(player_2_score_surface, ((self.window_width / 2) - player_2_score_surface.get_width() - 20, 10))
+        player_1_score_surface = self.score_text.render(f'Score: {self.player_1_score}', self.player_1_color)
+        player_2_score_surface = self.score_text.render(f'Score: {self.player_2_score}', self.player_2_color)
+
+        self.dirty_rects = [
+            self.screen.blit(player_1_score_surface, ((self.window_width / 2) + 20, 10)),
+            self.screen.blit(player_2_score_surface, ((self.window_width / 2) - player_2_score_surface.get_width() - 20, 10))
+        ]
 
 
     def game_over(self):
         if(self.player_1_score >= self.top_score):
-            game_over_surface = self.announcement_font.render('Player 1 Won', 
-                                                              True,
-                                                              self.player_1_color)
+            game_over_surface = self.announcement_text.render('Player 1 Won', self.player_1_color)
         if(self.player_2_score >= self.top_score):
-            game_over_surface = self.announcement_font.render('Player 2 Won', 
-                                                              True,
-                                                              self.player_2_color)
+            game_over_surface = self.announcement_text.render('Player 2 Won', self.player_2_color)
         game_over_rect = game_over_surface.get_rect(center=(self.window_width // 2,
                                                     self.window_height // 2))
 
@@ -177,10 +290,15 @@ class Pong(gym.Env):
             if self.player2 == "bot":
                 player_2_action = self.get_bot_move(player=2)
 
+            # Both AI players share one frame stack update per frame.
+            ai_obs = None
+            if "ai" in (self.player1, self.player2):
+                ai_obs = self.ai_agent.process_observation(self.observation)
+
             if self.player1 == "ai":
-                player_1_action = self.get_ai_move(player=1)
+                player_1_action = self.get_ai_move(player=1, obs=ai_obs)
             if self.player2 == "ai":
-                player_2_action = self.get_ai_move(player=2)
+                player_2_action = self.get_ai_move(player=2, obs=ai_obs)
 
             observation, player_1_reward, player_2_reward, done, truncated, info = self.step(player_1_action=player_1_action,
                       player_2_action=player_2_action)
@@ -199,16 +317,16 @@ class Pong(gym.Env):
         player_y = self.player_1_paddle.y if player == 1 else self.player_2_paddle.y
 
         if(self.bot_difficulty == "easy"):
-            if random.random() <= random_target:
-                next_move = random.randint(0, 2)
+            if self.rng.random() <= random_target:
+                next_move = self.rng.randint(0, 2)
             else:
                 if(self.ball.vy > 0):
                     next_move = 2
                 else: 
                     next_move = 1
         elif(self.bot_difficulty == "hard"):
-            if random.random() <= random_target:
-                next_move = random.randint(0, 2)
+            if self.rng.random() <= random_target:
+                next_move = self.rng.randint(0, 2)
             else:
                 if(self.ball.y > (player_y + 60)):
                     next_move = 2
@@ -218,15 +336,16 @@ class Pong(gym.Env):
         return next_move
 
 
-    def get_ai_move(self, player):
+    def get_ai_move(self, player, obs=None):
 
         if self.ai_agent == None:
             raise Exception("Can't make an AI move without an AI")
         elif player not in [1, 2]:
             raise Exception("Only players 1 and 2 are valid")
 
-        obs = self._get_obs()
-        obs = self.ai_agent.process_observation(obs)
+        # Reuses the observation returned by the last step instead of rendering another one.
+        if obs is None:
+            obs = self.ai_agent.process_observation(self.observation)
 
         action = None
 
@@ -251,11 +370,14 @@ class Pong(gym.Env):
         if(player_2_action is None):
             player_2_action = self.get_bot_move(2)
 
+        # Outside human mode only the last sub-step's pixels are ever observed.
         for i in range(self.step_repeat):
             self._step(player_1_action=player_1_action,
-                       player_2_action=player_2_action)
+                       player_2_action=player_2_action,
+                       render=(self.render_mode == "human" or i == self.step_repeat - 1))
 
         observation = self._get_obs()
+        self.observation = observation
 
         ball_center = self.ball.x + (self.ball.width / 2)
 
@@ -281,24 +403,27 @@ class Pong(gym.Env):
         return observation, player_1_reward, player_2_reward, done, truncated, info
 
     
-    def _step(self, player_1_action=0, player_2_action=0):
+    def _step(self, player_1_action=0, player_2_action=0, render=True):
         
         self.player_1_paddle.move(player_1_action)
         self.player_2_paddle.move(player_2_action)
-
-        self.fill_background()
-
-        self.player_1_paddle.draw(screen=self.screen)
-        self.player_2_paddle.draw(screen=self.screen)
         self.ball.move()
-        self.ball.draw(screen=self.screen)
+
+        if self.headless or not render:
+            return
 
         if(self.render_mode == "human"):
             self.clock.tick(self.fps)
-            pygame.display.flip()
 
+        self.render_frame()
 
-    
 
+    def render_frame(self):
+        self.fill_background()
 
+        self.dirty_rects.append(self.player_1_paddle.draw(screen=self.screen))
+        self.dirty_rects.append(self.player_2_paddle.draw(screen=self.screen))
+        self.dirty_rects.append(self.ball.draw(screen=self.screen))
 
+        if(self.render_mode == "human"):
+            pygame.display.update(self.previous_rects + self.dirty_rects)
@@ -0,0 +1,185 @@
+import pygame
+import numpy as np
+import torch
+
+
+def nearest_indices(src_size, dst_size):
+    # Source pixels picked by cv2.resize(..., interpolation=cv2.INTER_NEAREST)
+    return np.floor(np.arange(dst_size) * (src_size / dst_size)).astype(np.int64)
+
+
+def is_lit(rgb):
+    # Fixed point luma from cv2.COLOR_RGB2GRAY, only its zero / non-zero split matters here.
+    rgb = rgb.astype(np.uint32)
+    gray = (rgb[..., 0] * 4899 + rgb[..., 1] * 9617 + rgb[..., 2] * 1868 + (1 << 13)) >> 14
+    return gray != 0
+
+
+class ObservationRaster:
+
+    def __init__(self, window_width, window_height, obs_width=84, obs_height=84):
+        self.obs_width = obs_width
+        self.obs_height = obs_height
+
+        self.rows = nearest_indices(window_height, obs_height)
+        self.cols = nearest_indices(window_width, obs_width)
+
+        self.text_cache = {}
+
+
+    def span(self, samples, start, length):
+        # pygame.Rect truncates float coordinates, the sample grid is sorted.
+        start = int(start)
+        end = start + int(length)
+
+        return np.searchsorted(samples, start), np.searchsorted(samples, end)
+
+
+    def rect_span(self, x, y, width, height):
+        row_start, row_end = self.span(self.rows, y, height)
+        col_start, col_end = self.span(self.cols, x, width)
+
+        return row_start, row_end, col_start, col_end
+
+
+    def draw_rect(self, obs, rect):
+        row_start, row_end, col_start, col_end = self.rect_span(rect.x, rect.y, rect.width, rect.height)
+        obs[row_start:row_end, col_start:col_end] = 255
+
+
+    def text_mask(self, font, text, color, x, y, align="left"):
+        key = (id(font), text, color, x, y, align)
+
+        if key not in self.text_cache:
+            text_surface = font.render(text, True, color)
+
+            if align == "right":
+                x = x - text_surface.get_width()
+
+            # Blit onto black first so anti-aliased edges resolve exactly like on the screen.
+            canvas = pygame.Surface(text_surface.get_size())
+            canvas.blit(text_surface, (0, 0))
+            lit = is_lit(np.transpose(pygame.surfarray.array3d(canvas), (1, 0, 2)))
+
+            x, y = int(x), int(y)
+            row_start, row_end, col_start, col_end = self.rect_span(x, y, *text_surface.get_size())
+
+            mask = lit[np.ix_(self.rows[row_start:row_end] - y, self.cols[col_start:col_end] - x)]
+
+            self.text_cache[key] = (row_start, row_end, col_start, col_end, mask)
+
+        return self.text_cache[key]
+
+
+    def draw_text(self, obs, font, text, color, x, y, align="left"):
+        row_start, row_end, col_start, col_end, mask = self.text_mask(font, text, color, x, y, align)
+        obs[row_start:row_end, col_start:col_end][mask] = 255
+
+
+class ObservationEncoder:
+
+    # Nearest-neighbour downscale + grayscale + threshold of a rendered surface
+    # in one gather. The sampled rows / columns are computed once, so each call
+    # only reads the obs_height x obs_width pixels cv2.resize would have kept.
+    # With channel=None the lit test is the exact cv2 luma, with a channel index
+    # it reads that channel alone (exact as long as every drawn colour lights it).
+
+    def __init__(self, window_width, window_height, obs_width=84, obs_height=84, channel=None):
+        self.obs_width = obs_width
+        self.obs_height = obs_height
+        self.channel = channel
+
+        # surfarray views are indexed [x, y], so columns come first.
+        self.cols, self.rows = np.ix_(nearest_indices(window_width, obs_width),
+                                      nearest_indices(window_height, obs_height))
+
+
+    def lit(self, surface):
+        if surface.get_bytesize() != 4:
+            pixels = pygame.surfarray.pixels3d(surface)
+            rgb = pixels[self.cols, self.rows]
+            del pixels
+        else:
+            # Gathering packed 32-bit pixels is ~4x cheaper than a pixels3d gather,
+            # the channels are split afterwards on the 84x84 samples only.
+            pixels = pygame.surfarray.pixels2d(surface)
+            mapped = pixels[self.cols, self.rows].astype(np.uint32)
+            del pixels
+
+            masks = surface.get_masks()
+            shifts = surface.get_shifts()
+
+            if self.channel is not None:
+                return (mapped & masks[self.channel] != 0).T
+
+            rgb = np.stack([(mapped & masks[c]) >> shifts[c] for c in range(3)], axis=-1)
+
+        if self.channel is None:
+            lit = is_lit(rgb)
+        else:
+            lit = rgb[..., self.channel] != 0
+
+        return lit.T
+
+
+    def encode(self, surface, out=None):
+        # (1, obs_height, obs_width) uint8 frame of 0 / 255.
+        if out is None:
+            out = np.empty((1, self.obs_height, self.obs_width), dtype=np.uint8)
+
+        np.multiply(self.lit(surface), 255, out=out[0], casting="unsafe")
+
+        return out
+
+
+    def encode_batch(self, surfaces, out=None):
+        # (N, 1, obs_height, obs_width) frames for N surfaces of the same size.
+        if out is None:
+            out = np.empty((len(surfaces), 1, self.obs_height, self.obs_width), dtype=np.uint8)
+
+        for i, surface in enumerate(surfaces):
+            self.encode(surface, out=out[i])
+
+        return out
+
+
+# obs_mode="state" describes a frame by the game's own coordinates instead of
+# pixels: ball centre x / y, ball vx / vy, then the centre y of the right
+# (player 1) and left (player 2) paddle. Positions are scaled to [-1, 1]
+# around the middle of the window and velocities by the ball's max speed, so
+# mirroring the screen is just a sign flip on x / vx and a paddle swap.
+STATE_DIM = 6
+
+
+def encode_state(ball_x, ball_y, ball_vx, ball_vy, player_1_y, player_2_y,
+                 window_width, window_height, ball_size, paddle_height, max_speed):
+    # Scalars give a (STATE_DIM,) vector, (N,) arrays an (N, STATE_DIM) batch.
+    return np.stack([(ball_x + ball_size / 2) / window_width * 2 - 1,
+                     (ball_y + ball_size / 2) / window_height * 2 - 1,
+                     np.asarray(ball_vx) / max_speed,
+                     np.asarray(ball_vy) / max_speed,
+                     (player_1_y + paddle_height / 2) / window_height * 2 - 1,
+                     (player_2_y + paddle_height / 2) / window_height * 2 - 1], axis=-1).astype(np.float32)
+
+
+def mirror_state(obs):
+    # State vectors (..., STATE_DIM) as seen on the mirrored screen.
+    return torch.stack([-obs[..., 0], obs[..., 1], -obs[..., 2], obs[..., 3], obs[..., 5], obs[..., 4]], dim=-1)
+
+
+def mirror_observation(obs, obs_mode="pixels"):
+    # Player 2 plays on the mirrored screen, works for single stacks and batches.
+    if obs_mode == "state":
+        return mirror_state(obs)
+
+    return torch.flip(obs, dims=[-1])
+
+
+def frame_spec(obs_mode="pixels"):
+    # Shape and dtype of one frame, as FrameStack kwargs.
+    if obs_mode == "state":
+        return {"frame_shape": (STATE_DIM,), "dtype": torch.float32}
+    if obs_mode == "pixels":
+        return {"frame_shape": (84, 84), "dtype": torch.uint8}
+
+    raise ValueError(f"Unknown obs_mode {obs_mode}, expected pixels or state")
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+# Closed-form contact times for a ball that moves one whole pixel at a time.
+# pos is the current coordinate, step is +1 or -1, pixels the distance moved
+# this frame. The result is the 1-based pixel at which the event happens, or
+# pixels + 1 when it does not happen this frame. Coordinates are whole pixels
+# (the ball spawns at window / 2 and only ever moves by whole pixels), so
+# pygame.Rect truncation never changes them.
+
+
+def first_hit(pos, step, pixels, lo, hi):
+    # First k with lo <= pos + step * k <= hi, e.g. the ball overlapping a paddle.
+    if step > 0:
+        k = max(1, lo - pos)
+        last = min(pixels, hi - pos)
+    else:
+        k = max(1, pos - hi)
+        last = min(pixels, pos - lo)
+
+    return int(k) if k <= last else pixels + 1
+
+
+def first_exit(pos, step, pixels, lo, hi):
+    # First k with pos + step * k outside [lo, hi], e.g. the ball leaving the court.
+    if step > 0:
+        k = 1 if pos + 1 < lo else max(1, hi - pos + 1)
+    else:
+        k = 1 if pos - 1 > hi else max(1, pos - lo + 1)
+
+    return int(k) if k <= pixels else pixels + 1
+
+
+def first_hit_array(pos, step, pixels, lo, hi):
+    k = np.where(step > 0, np.maximum(1, lo - pos), np.maximum(1, pos - hi))
+    last = np.where(step > 0, np.minimum(pixels, hi - pos), np.minimum(pixels, pos - lo))
+
+    return np.where(k <= last, k, pixels + 1).astype(np.int64)
+
+
+def first_exit_array(pos, step, pixels, lo, hi):
+    k = np.where(step > 0,
+                 np.where(pos + 1 < lo, 1, np.maximum(1, hi - pos + 1)),
+                 np.where(pos - 1 > hi, 1, np.maximum(1, pos - lo + 1)))
+
+    return np.where(k <= pixels, k, pixels + 1).astype(np.int64)
+
+
+def overlap_range(paddle_pos, paddle_size, ball_size):
+    # Ball coordinates whose rect overlaps the paddle's along one axis (pygame's strict overlap test).
+    return paddle_pos - ball_size + 1, paddle_pos + paddle_size - 1
+
+
+def clip(value, limit):
+    # np.clip for a Python scalar without the NumPy call overhead.
+    return min(max(value, -limit), limit)
+
+
+def is_whole(*values):
+    return all(float(value).is_integer() for value in values)
@@ -0,0 +1,182 @@
+import contextlib
+import cProfile
+import functools
+import os
+import time
+from collections import defaultdict
+
+
+NULL_TIMER = contextlib.nullcontext()
+
+
+class Timer:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+
+    # Named wall-clock timers and counters for the hot paths. Methods are
+    # registered up front but only wrapped while the profiler is enabled, so
+    # a disabled profiler leaves them untouched. Inline timer() blocks cost a
+    # flag check when disabled. Nested timers overlap in the report, e.g.
+    # env/step includes env/_step and env/_get_obs. On CUDA the learner timers
+    # measure launch time, not kernel time.
+
+    def __init__(self):
+        self.enabled = False
+        self.targets = []
+        self.originals = {}
+        self.trace = None
+        self.reset()
+
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.window_start = time.perf_counter()
+
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+        self.calls[name] += 1
+
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+
+    def register(self, owner, attribute, name=None):
+        # owner is a class (or module), attribute the method to time under name.
+        target = (owner, attribute, name or f"{owner.__name__}.{attribute}")
+
+        if target[:2] in [t[:2] for t in self.targets]:
+            return
+
+        self.targets.append(target)
+        if self.enabled:
+            self._wrap(*target)
+
+
+    def _wrap(self, owner, attribute, name):
+        original = owner.__dict__[attribute]
+        self.originals[(owner, attribute)] = original
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+
+        setattr(owner, attribute, timed)
+
+
+    def enable(self):
+        if self.enabled:
+            return
+
+        for target in self.targets:
+            self._wrap(*target)
+
+        self.enabled = True
+        self.reset()
+
+
+    def disable(self):
+        for (owner, attribute), original in self.originals.items():
+            setattr(owner, attribute, original)
+
+        self.originals = {}
+        self.enabled = False
+
+
+    def report(self, steps_counter="env_steps"):
+        # Breakdown of the window since the last reset(), slowest first.
+        elapsed = time.perf_counter() - self.window_start
+
+        timers = {name: {"total_ms": total * 1000,
+                         "calls": self.calls[name],
+                         "mean_us": total * 1e6 / max(self.calls[name], 1),
+                         "percent": 100 * total / max(elapsed, 1e-9)}
+                  for name, total in sorted(self.totals.items(), key=lambda item: -item[1])}
+
+        return {"elapsed_s": elapsed,
+                "steps_per_sec": self.counters[steps_counter] / max(elapsed, 1e-9),
+                "counters": dict(self.counters),
+                "timers": timers}
+
+
+    def format_report(self, report):
+        lines = [f"{'timer':<32}{'total ms':>12}{'calls':>10}{'mean us':>12}{'% wall':>9}"]
+
+        for name, timer in report["timers"].items():
+            lines.append(f"{name:<32}{timer['total_ms']:>12.1f}{timer['calls']:>10}{timer['mean_us']:>12.1f}{timer['percent']:>8.1f}%")
+
+        lines.append(f"Wall time: {report['elapsed_s']:.2f}s  Steps/sec: {report['steps_per_sec']:.1f}")
+
+        return "\n".join(lines)
+
+
+    def start_trace(self, kind="cprofile"):
+        # kind is "cprofile" or "torch", stop_trace() writes the result.
+        if kind == "cprofile":
+            self.trace = (kind, cProfile.Profile())
+            self.trace[1].enable()
+        elif kind == "torch":
+            import torch
+
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+            self.trace = (kind, torch.profiler.profile(activities=activities, record_shapes=True))
+            self.trace[1].start()
+        else:
+            raise ValueError(f"Unknown trace kind {kind}, expected cprofile or torch")
+
+
+    def stop_trace(self, path):
+        # Writes a .prof (cProfile, open with snakeviz or pstats) or a chrome trace .json (torch).
+        if self.trace is None:
+            return None
+
+        kind, trace = self.trace
+        self.trace = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if kind == "cprofile":
+            trace.disable()
+            path = f"{path}.prof"
+            trace.dump_stats(path)
+        else:
+            trace.stop()
+            path = f"{path}.json"
+            trace.export_chrome_trace(path)
+
+        return path
+
+
+profiler = Profiler()
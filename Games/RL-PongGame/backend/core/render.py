@@ -0,0 +1,29 @@
+from collections import OrderedDict
+
+
+class TextCache:
+
+    # font.render results keyed on (text, color). Scores only change a few
+    # times per game, so nearly every frame is a cache hit. The least recently
+    # used surface is dropped once max_size is reached.
+
+    def __init__(self, font, max_size=64):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+
+    def render(self, text, color):
+        key = (text, color)
+
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        surface = self.font.render(text, True, color)
+        self.surfaces[key] = surface
+
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+
+        return surface
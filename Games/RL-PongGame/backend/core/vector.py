@@ -0,0 +1,365 @@
+import os
+import pygame
+import numpy as np
+from backend.core.observation import ObservationRaster, encode_state
+from backend.core.physics import first_hit_array, first_exit_array, overlap_range
+
+
+class VectorPong:
+
+    # N headless Pong games stepped together. Every per-game field of Pong,
+    # Paddle and Ball lives in an (N,) array so one step() advances all games.
+
+    def __init__(self, num_envs, window_width=1280, window_height=960, step_repeat=4,
+                 bot_difficulty="hard", top_score=20, autoreset=True, seed=None, obs_mode="pixels"):
+
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.font.init()
+
+        self.num_envs = num_envs
+        self.window_width = window_width
+        self.window_height = window_height
+        self.step_repeat = step_repeat
+        self.bot_difficulty = bot_difficulty
+        self.top_score = top_score
+        self.autoreset = autoreset
+        # "state" returns (N, 1, STATE_DIM) float vectors instead of (N, 1, 84, 84) frames.
+        self.obs_mode = obs_mode
+
+        self.player_1_color = (50, 205, 50)
+        self.player_2_color = (138, 43, 226)
+
+        self.paddle_height = 120
+        self.paddle_width = 20
+        self.paddle_speed = 14
+
+        self.ball_height = 20
+        self.ball_width = 20
+        self.max_speed = 15
+
+        self.player_1_x = window_width - 2 * (window_width / 64)
+        self.player_2_x = window_width / 64
+
+        self.font = pygame.font.SysFont(None, 70)
+        self.raster = ObservationRaster(window_width, window_height)
+        self.score_masks = {1: np.zeros((0, 84, 84), dtype=bool), 2: np.zeros((0, 84, 84), dtype=bool)}
+
+        self.rng = np.random.default_rng(seed)
+
+        self.player_1_y = np.zeros(num_envs)
+        self.player_2_y = np.zeros(num_envs)
+        self.ball_x = np.zeros(num_envs)
+        self.ball_y = np.zeros(num_envs)
+        self.ball_vx = np.zeros(num_envs, dtype=np.int64)
+        self.ball_vy = np.zeros(num_envs, dtype=np.int64)
+        self.last_serve_left = np.zeros(num_envs, dtype=bool)
+        self.player_1_score = np.zeros(num_envs, dtype=np.int64)
+        self.player_2_score = np.zeros(num_envs, dtype=np.int64)
+
+        print(f"Creating {num_envs} vectorized Pong games")
+        print("Bot difficulty: ", self.bot_difficulty)
+
+        self.reset()
+
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+
+        self.player_1_score[mask] = 0
+        self.player_2_score[mask] = 0
+
+        self.player_1_y[mask] = (self.window_height / 2) - (self.paddle_height / 2)
+        self.player_2_y[mask] = (self.window_height / 2) - (self.paddle_height / 2)
+
+        self.last_serve_left[mask] = self.rng.random(self.num_envs)[mask] < 0.5
+        self.spawn(mask)
+
+        return self._get_obs(), {}
+
+
+    def spawn(self, mask):
+        self.ball_x[mask] = self.window_width / 2
+        self.ball_y[mask] = self.window_height / 2
+
+        speed = self.rng.choice([4, 5, 6], size=self.num_envs)
+
+        # Flip X velocity every spawn
+        self.last_serve_left[mask] = ~self.last_serve_left[mask]
+        self.ball_vx[mask] = np.where(self.last_serve_left, -speed, speed)[mask]
+
+        self.ball_vy[mask] = self.rng.choice([-3, -2, -1, 1, 2, 3], size=self.num_envs)[mask]
+
+
+    def random_sign(self):
+        return self.rng.choice([-1, 1], size=self.num_envs)
+
+
+    def get_bot_moves(self, player):
+        random_target = 0.1
+
+        player_y = self.player_1_y if player == 1 else self.player_2_y
+
+        random_move = self.rng.random(self.num_envs) <= random_target
+        random_action = self.rng.integers(0, 3, size=self.num_envs)
+
+        if(self.bot_difficulty == "easy"):
+            tracked = np.where(self.ball_vy > 0, 2, 1)
+        elif(self.bot_difficulty == "hard"):
+            tracked = np.where(self.ball_y > (player_y + 60), 2,
+                               np.where(self.ball_y < (player_y + 60), 1, 0))
+        else:
+            tracked = np.zeros(self.num_envs, dtype=np.int64)
+
+        return np.where(random_move, random_action, tracked)
+
+
+    def _score_masks(self, player, scores):
+        # Score text only changes a few times per game, so its 84x84 mask is
+        # rendered once per value and gathered per env.
+        table = self.score_masks[player]
+
+        if scores.max() >= len(table):
+            color = self.player_1_color if player == 1 else self.player_2_color
+            masks = []
+
+            for score in range(int(scores.max()) + 1):
+                obs = np.zeros((84, 84), dtype=np.uint8)
+                if player == 1:
+                    self.raster.draw_text(obs, self.font, f'Score: {score}', color,
+                                          (self.window_width / 2) + 20, 10)
+                else:
+                    self.raster.draw_text(obs, self.font, f'Score: {score}', color,
+                                          (self.window_width / 2) - 20, 10, align="right")
+                masks.append(obs != 0)
+
+            table = np.stack(masks)
+            self.score_masks[player] = table
+
+        return table[scores]
+
+
+    def _rect_masks(self, x, y, width, height):
+        # pygame.Rect truncates toward zero, the sample grids are sorted.
+        x = np.trunc(x).astype(np.int64)
+        y = np.trunc(y).astype(np.int64)
+
+        row_start = np.searchsorted(self.raster.rows, y)
+        row_end = np.searchsorted(self.raster.rows, y + height)
+        col_start = np.searchsorted(self.raster.cols, x)
+        col_end = np.searchsorted(self.raster.cols, x + width)
+
+        rows = np.arange(self.raster.obs_height)
+        cols = np.arange(self.raster.obs_width)
+
+        row_mask = (rows >= row_start[:, None]) & (rows < row_end[:, None])
+        col_mask = (cols >= col_start[:, None]) & (cols < col_end[:, None])
+
+        return row_mask[:, :, None] & col_mask[:, None, :]
+
+
+    def _get_obs(self):
+        if self.obs_mode == "state":
+            return encode_state(self.ball_x, self.ball_y, self.ball_vx, self.ball_vy, self.player_1_y, self.player_2_y,
+                                self.window_width, self.window_height, self.ball_width,
+                                self.paddle_height, self.max_speed)[:, None]
+
+        lit = self._score_masks(1, self.player_1_score) | self._score_masks(2, self.player_2_score)
+
+        lit |= self._rect_masks(np.full(self.num_envs, self.player_1_x), self.player_1_y,
+                                self.paddle_width, self.paddle_height)
+        lit |= self._rect_masks(np.full(self.num_envs, self.player_2_x), self.player_2_y,
+                                self.paddle_width, self.paddle_height)
+        lit |= self._rect_masks(self.ball_x, self.ball_y, self.ball_width, self.ball_height)
+
+        observation = lit.astype(np.uint8) * 255
+
+        return observation[:, None]
+
+
+    def _collides(self, x, y):
+        x = np.trunc(x)
+        y = np.trunc(y)
+
+        hits = np.zeros(self.num_envs, dtype=bool)
+
+        for paddle_x, paddle_y in ((self.player_1_x, self.player_1_y), (self.player_2_x, self.player_2_y)):
+            paddle_x = np.trunc(paddle_x)
+            paddle_y = np.trunc(paddle_y)
+
+            hits |= ((x < paddle_x + self.paddle_width) & (paddle_x < x + self.ball_width) &
+                     (y < paddle_y + self.paddle_height) & (paddle_y < y + self.ball_height))
+
+        return hits
+
+
+    def move_paddles(self, player_1_actions, player_2_actions):
+        for actions, paddle_y in ((player_1_actions, self.player_1_y), (player_2_actions, self.player_2_y)):
+            new_y = paddle_y + np.where(actions == 1, -self.paddle_speed,
+                                        np.where(actions == 2, self.paddle_speed, 0))
+            allowed = (0 <= new_y) & (new_y <= (self.window_height - self.paddle_height))
+            paddle_y[allowed] = new_y[allowed]
+
+
+    def _paddle_hits(self, x, y, step, pixels, vertical):
+        # First pixel at which each ball overlaps either paddle while moving
+        # along one axis, pixels + 1 when it does not.
+        hits = pixels + 1
+
+        for paddle_x, paddle_y in ((self.player_1_x, self.player_1_y), (self.player_2_x, self.player_2_y)):
+            x_lo, x_hi = overlap_range(np.trunc(paddle_x), self.paddle_width, self.ball_width)
+            y_lo, y_hi = overlap_range(np.trunc(paddle_y), self.paddle_height, self.ball_height)
+
+            if vertical:
+                hit = np.where((x_lo <= x) & (x <= x_hi), first_hit_array(y, step, pixels, y_lo, y_hi), pixels + 1)
+            else:
+                hit = np.where((y_lo <= y) & (y <= y_hi), first_hit_array(x, step, pixels, x_lo, x_hi), pixels + 1)
+
+            hits = np.minimum(hits, hit)
+
+        return hits
+
+
+    def move_balls(self):
+        # Ball.move in closed form for all games at once, same result and
+        # random draws as move_balls_stepwise().
+        if not (np.all(self.ball_x % 1 == 0) and np.all(self.ball_y % 1 == 0)):
+            return self.move_balls_stepwise()
+
+        x_step = np.where(self.ball_vx > 0, 1, -1)
+        y_step = np.where(self.ball_vy > 0, 1, -1)
+        y_sign = self.random_sign()
+        x_sign = self.random_sign()
+
+        early_collision_detected = self._collides(self.ball_x, self.ball_y)
+
+        y_pixels = np.abs(self.ball_vy)
+
+        paddle_hit = self._paddle_hits(self.ball_x, self.ball_y, y_step, y_pixels, vertical=True)
+        wall_hit = np.where(early_collision_detected, y_pixels + 1,
+                            first_exit_array(self.ball_y, y_step, y_pixels, 0, self.window_height - self.ball_height))
+
+        # The wall test runs before the paddle test on the same pixel.
+        wall = (wall_hit <= y_pixels) & (wall_hit <= paddle_hit)
+        paddle = ~wall & (paddle_hit <= y_pixels)
+
+        new_y = self.ball_y + y_step * np.where(wall, wall_hit, np.where(paddle, paddle_hit, y_pixels))
+
+        self.ball_vy = np.where(wall, np.clip(-self.ball_vy + y_sign, -self.max_speed, self.max_speed),
+                                np.where(paddle, np.clip(self.ball_vy + y_sign, -self.max_speed, self.max_speed), self.ball_vy))
+
+        x_pixels = np.abs(self.ball_vx)
+
+        paddle_hit = self._paddle_hits(self.ball_x, new_y, x_step, x_pixels, vertical=False)
+        paddle = ~early_collision_detected & (paddle_hit <= x_pixels)
+
+        new_x = self.ball_x + x_step * np.where(paddle, paddle_hit, x_pixels)
+
+        # Invert the ball direction and speed up the ball slightly
+        self.ball_vx = np.where(paddle, np.clip((self.ball_vx + x_step) * -1, -self.max_speed, self.max_speed), self.ball_vx)
+        self.ball_vy = np.where(paddle, np.clip(self.ball_vy + x_sign, -self.max_speed, self.max_speed), self.ball_vy)
+
+        self.ball_x = new_x
+        self.ball_y = new_y
+
+
+    def move_balls_stepwise(self):
+        # Reference per-pixel version of move_balls(), each game drops out of a
+        # loop once it collides or runs out of pixels.
+        x_step = np.where(self.ball_vx > 0, 1, -1)
+        y_step = np.where(self.ball_vy > 0, 1, -1)
+        y_sign = self.random_sign()
+        x_sign = self.random_sign()
+
+        new_x = self.ball_x.copy()
+        new_y = self.ball_y.copy()
+
+        early_collision_detected = self._collides(new_x, new_y)
+
+        y_pixels = np.abs(self.ball_vy)
+        active = y_pixels > 0
+
+        for i in range(int(y_pixels.max())):
+            active &= i < y_pixels
+            if not active.any():
+                break
+
+            new_y = np.where(active, new_y + y_step, new_y)
+
+            wall = active & ~early_collision_detected & ~((0 <= new_y) & (new_y <= (self.window_height - self.ball_height)))
+            self.ball_vy = np.where(wall, np.clip(-self.ball_vy + y_sign, -self.max_speed, self.max_speed), self.ball_vy)
+            active &= ~wall
+
+            paddle = active & self._collides(new_x, new_y)
+            self.ball_vy = np.where(paddle, np.clip(self.ball_vy + y_sign, -self.max_speed, self.max_speed), self.ball_vy)
+            active &= ~paddle
+
+        x_pixels = np.abs(self.ball_vx)
+        active = x_pixels > 0
+
+        for i in range(int(x_pixels.max())):
+            active &= i < x_pixels
+            if not active.any():
+                break
+
+            new_x = np.where(active, new_x + x_step, new_x)
+
+            paddle = active & ~early_collision_detected & self._collides(new_x, new_y)
+
+            # Invert the ball direction and speed up the ball slightly
+            self.ball_vx = np.where(paddle, np.clip((self.ball_vx + x_step) * -1, -self.max_speed, self.max_speed), self.ball_vx)
+            self.ball_vy = np.where(paddle, np.clip(self.ball_vy + x_sign, -self.max_speed, self.max_speed), self.ball_vy)
+            active &= ~paddle
+
+        self.ball_x = new_x
+        self.ball_y = new_y
+
+
+    def step(self, actions=None):
+        # actions is (N, 2) with one column per player, -1 lets the bot play that side.
+        if actions is None:
+            actions = np.full((self.num_envs, 2), -1)
+
+        actions = np.asarray(actions)
+
+        player_1_actions = np.where(actions[:, 0] < 0, self.get_bot_moves(1), actions[:, 0])
+        player_2_actions = np.where(actions[:, 1] < 0, self.get_bot_moves(2), actions[:, 1])
+
+        for i in range(self.step_repeat):
+            self.move_paddles(player_1_actions, player_2_actions)
+            self.move_balls()
+
+        observation = self._get_obs()
+
+        ball_center = self.ball_x + (self.ball_width / 2)
+
+        player_1_scored = ball_center < 0
+        player_2_scored = ball_center > self.window_width
+
+        self.player_1_score += player_1_scored
+        self.player_2_score += player_2_scored
+
+        player_1_reward = player_1_scored.astype(np.int64) - player_2_scored
+        player_2_reward = -player_1_reward
+
+        self.spawn(player_1_scored | player_2_scored)
+
+        done = (self.player_1_score >= self.top_score) | (self.player_2_score >= self.top_score)
+        truncated = done.copy()
+        info = {}
+
+        if self.autoreset and done.any():
+            info["final_observation"] = observation
+            info["_final_observation"] = done
+            info["final_player_1_score"] = self.player_1_score.copy()
+            info["final_player_2_score"] = self.player_2_score.copy()
+
+            observation = observation.copy()
+            reset_observation, _ = self.reset(done)
+            observation[done] = reset_observation[done]
+
+        return observation, player_1_reward, player_2_reward, done, truncated, info
+
+
+    def close(self):
+        pass
@@ -0,0 +1,94 @@
+# Parity and latency of the compiled inference path (training/inference.py)
+# against the eager Model, on real game observations.
+# Run from Games/RL-PongGame: python -m benchmarks.inference
+import time
+import torch
+from backend.core.game import Pong
+from training.frame_stack import FrameStack
+from training.inference import FoldedModel, InferenceModel
+from training.model import Model
+
+
+def collect_stacks(num_stacks, frame_stack=3, seed=0):
+    # uint8 stacks of a seeded bot-vs-bot game, the way get_action sees them.
+    env = Pong(player1="bot", player2="bot", render_mode="headless")
+    obs, _ = env.reset(seed=seed)
+    frames = FrameStack(1, frame_stack)
+    stack = frames.reset(obs[None])
+    stacks = []
+
+    for _ in range(num_stacks):
+        stacks.append(stack[0].clone())
+        obs, _, _, done, _, _ = env.step()
+        if done:
+            obs, _ = env.reset()
+            stack = frames.reset(obs[None])
+        else:
+            stack = frames.push(obs[None])
+
+    return torch.stack(stacks)
+
+
+def check_parity(model, compiled, stacks, batch_size):
+    max_error = 0.0
+    agreement = 0
+
+    with torch.no_grad():
+        for start in range(0, len(stacks) - batch_size + 1, batch_size):
+            x = stacks[start:start + batch_size]
+            reference = model(x)
+            q_values = compiled(x)
+
+            max_error = max(max_error, float((reference - q_values).abs().max()))
+            agreement += int((reference.argmax(dim=-1) == q_values.argmax(dim=-1)).sum())
+
+    return max_error, agreement / (len(stacks) // batch_size * batch_size)
+
+
+def time_per_call(fn, x, windows=5, min_time=0.1):
+    # Best of several windows, the other processes on a shared CPU only ever add time.
+    best = float("inf")
+
+    with torch.no_grad():
+        for _ in range(3):
+            fn(x)
+
+        for _ in range(windows):
+            calls = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < min_time:
+                fn(x)
+                calls += 1
+            best = min(best, (time.perf_counter() - start) / calls)
+
+    return best
+
+
+def main(batch_sizes=(1, 2, 64), threads=1):
+    torch.set_num_threads(threads)
+    torch.manual_seed(0)
+
+    model = Model(action_dim=3, hidden_dim=756, observation_shape=(3, 84, 84), obs_stack=3).eval()
+    folded = FoldedModel(model).eval()
+    compiled = InferenceModel(model)
+
+    stacks = collect_stacks(1024)
+
+    for batch_size in batch_sizes:
+        max_error, agreement = check_parity(model, compiled, stacks, batch_size)
+        print(f"batch {batch_size:>3}: max |q - q_eager| {max_error:.2e}, greedy action agreement {agreement:.2%}")
+
+    print(f"\n{'batch':>5}{'eager us':>12}{'folded us':>12}{'compiled us':>14}{'speedup':>10}")
+    for batch_size in batch_sizes:
+        x = stacks[:batch_size]
+
+        eager = time_per_call(model, x)
+        folded_time = time_per_call(folded, x)
+        compiled_time = time_per_call(compiled, x)
+
+        choice = compiled.choices[(tuple(x.shape), x.dtype)]
+        print(f"{batch_size:>5}{eager * 1e6:>12.1f}{folded_time * 1e6:>12.1f}{compiled_time * 1e6:>14.1f}{eager / compiled_time:>9.2f}x  ({choice})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Per-call latency of the observation pipeline on real game frames.
+# Run from Games/RL-PongGame: python -m benchmarks.observation
+import time
+import cv2
+import numpy as np
+import pygame
+import torch
+from backend.core.game import Pong
+from backend.core.observation import ObservationEncoder
+
+
+def legacy_obs(screen):
+    # The original Pong._get_obs pipeline.
+    screen_array = pygame.surfarray.pixels3d(screen)
+    screen_array = np.transpose(screen_array, (1, 0, 2))
+    downscaled_image = cv2.resize(screen_array, (84, 84), interpolation=cv2.INTER_NEAREST)
+    grayscale = cv2.cvtColor(downscaled_image, cv2.COLOR_RGB2GRAY)
+    grayscale[grayscale != 0] = 255
+    return torch.from_numpy(grayscale).float().unsqueeze(0)
+
+
+def collect_surfaces(num_frames, seed=0):
+    env = Pong(player1="bot", player2="bot", render_mode="rgb_array")
+    env.reset(seed=seed)
+    surfaces = []
+
+    for _ in range(num_frames):
+        obs, _, _, done, _, _ = env.step()
+        surfaces.append(env.screen.copy())
+        if done:
+            env.reset()
+
+    return surfaces
+
+
+def time_per_call(fn, surfaces, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for surface in surfaces:
+            fn(surface)
+    return (time.perf_counter() - start) / (repeats * len(surfaces))
+
+
+def main(num_frames=200, repeats=5):
+    surfaces = collect_surfaces(num_frames)
+
+    encoder = ObservationEncoder(1280, 960)
+    green_encoder = ObservationEncoder(1280, 960, channel=1)
+
+    mismatches = 0
+    green_mismatches = 0
+    for surface in surfaces:
+        reference = legacy_obs(surface)
+        mismatches += int((torch.from_numpy(encoder.encode(surface)).float() != reference).sum())
+        green_mismatches += int((torch.from_numpy(green_encoder.encode(surface)).float() != reference).sum())
+
+    print(f"Frames: {num_frames}")
+    print(f"Exact encoder mismatched pixels: {mismatches}")
+    print(f"Green channel encoder mismatched pixels: {green_mismatches}")
+
+    legacy = time_per_call(legacy_obs, surfaces, repeats)
+    exact = time_per_call(encoder.encode, surfaces, repeats)
+    green = time_per_call(green_encoder.encode, surfaces, repeats)
+
+    out = np.empty((len(surfaces), 1, 84, 84), dtype=np.uint8)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        encoder.encode_batch(surfaces, out=out)
+    batch = (time.perf_counter() - start) / (repeats * len(surfaces))
+
+    print(f"legacy cv2 pipeline: {legacy * 1e6:8.1f} us/frame")
+    print(f"encoder (exact):     {exact * 1e6:8.1f} us/frame  {legacy / exact:5.1f}x")
+    print(f"encoder (channel 1): {green * 1e6:8.1f} us/frame  {legacy / green:5.1f}x")
+    print(f"encode_batch:        {batch * 1e6:8.1f} us/frame  {legacy / batch:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
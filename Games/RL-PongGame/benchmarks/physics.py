@@ -0,0 +1,136 @@
+# Determinism check and timing of the closed-form ball physics against the
+# per-pixel reference implementations.
+# Run from Games/RL-PongGame: python -m benchmarks.physics
+import random
+import time
+import numpy as np
+from backend.core.assets import Ball, Paddle
+from backend.core.game import Pong
+from backend.core.vector import VectorPong
+
+
+def ball_state(ball):
+    return (ball.x, ball.y, int(ball.vx), int(ball.vy))
+
+
+def random_ball(rng):
+    # Paddles and ball placed anywhere, including overlapping and outside the court.
+    player_1_paddle = Paddle(x=1240.0, y=float(rng.randrange(0, 841)), player_color=(0, 0, 0), window_height=960)
+    player_2_paddle = Paddle(x=20.0, y=float(rng.randrange(0, 841)), player_color=(0, 0, 0), window_height=960)
+
+    ball = Ball(window_height=960, window_width=1280, height=20, width=20,
+                player_1_paddle=player_1_paddle, player_2_paddle=player_2_paddle)
+
+    near = rng.choice([player_1_paddle, player_2_paddle])
+    if rng.random() < 0.7:
+        ball.x = float(near.x + rng.randrange(-40, 41))
+        ball.y = float(near.y + rng.randrange(-40, 161))
+    else:
+        ball.x = float(rng.randrange(-30, 1300))
+        ball.y = float(rng.choice([rng.randrange(-2, 25), rng.randrange(915, 943), rng.randrange(0, 941)]))
+
+    ball.vx = rng.choice([-1, 1]) * rng.randrange(1, 16)
+    ball.vy = rng.randrange(-15, 16)
+    ball.rect = ball.rect.__class__(ball.x, ball.y, ball.width, ball.height)
+
+    return ball
+
+
+def check_random_balls(num_cases, seed=0):
+    mismatches = 0
+
+    for case in range(num_cases):
+        ball = random_ball(random.Random(seed * 1000003 + case))
+        reference = random_ball(random.Random(seed * 1000003 + case))
+
+        random.seed(case)
+        ball.move()
+        random.seed(case)
+        reference.move_stepwise()
+
+        mismatches += ball_state(ball) != ball_state(reference)
+
+    return mismatches
+
+
+def check_games(num_steps, seed=0):
+    # Full bot-vs-bot games with the same seed, one per implementation.
+    trajectories = []
+
+    for stepwise in (False, True):
+        move = Ball.move
+        if stepwise:
+            Ball.move = Ball.move_stepwise
+
+        try:
+            env = Pong(player1="bot", player2="bot", render_mode="headless")
+            env.reset(seed=seed)
+            trajectory = []
+
+            for _ in range(num_steps):
+                _, _, _, done, _, _ = env.step()
+                trajectory.append((*ball_state(env.ball), env.player_1_score, env.player_2_score))
+                if done:
+                    env.reset()
+        finally:
+            Ball.move = move
+
+        trajectories.append(trajectory)
+
+    return sum(a != b for a, b in zip(*trajectories))
+
+
+def check_vector(num_envs, num_steps, seed=0):
+    envs = [VectorPong(num_envs, seed=seed) for _ in range(2)]
+    envs[1].move_balls = envs[1].move_balls_stepwise
+
+    mismatches = 0
+    for _ in range(num_steps):
+        obs = [env.step()[0] for env in envs]
+        mismatches += int(not np.array_equal(obs[0], obs[1]))
+        mismatches += int(not all(np.array_equal(getattr(envs[0], name), getattr(envs[1], name))
+                                  for name in ("ball_x", "ball_y", "ball_vx", "ball_vy", "player_1_score", "player_2_score")))
+
+    return mismatches
+
+
+def time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    print(f"Random ball states mismatched: {check_random_balls(20000)} / 20000")
+    print(f"Pong steps mismatched: {check_games(20000)} / 20000")
+    print(f"VectorPong steps mismatched: {check_vector(64, 2000)} / 2000")
+
+    rng = random.Random(1)
+    balls = [random_ball(rng) for _ in range(2000)]
+    saved = [ball_state(ball) for ball in balls]
+
+    def run(method):
+        for ball, state in zip(balls, saved):
+            ball.x, ball.y, ball.vx, ball.vy = state
+            getattr(ball, method)()
+
+    analytic = time_per_call(lambda: run("move"), 5) / len(balls)
+    stepwise = time_per_call(lambda: run("move_stepwise"), 5) / len(balls)
+
+    print(f"Ball.move_stepwise: {stepwise * 1e6:6.2f} us/call")
+    print(f"Ball.move:          {analytic * 1e6:6.2f} us/call  {stepwise / analytic:4.1f}x")
+
+    env = VectorPong(256, seed=0)
+    analytic = time_per_call(env.step, 200)
+
+    env = VectorPong(256, seed=0)
+    env.move_balls = env.move_balls_stepwise
+    stepwise = time_per_call(env.step, 200)
+
+    print(f"VectorPong(256).step, stepwise balls: {256 / stepwise:8.0f} game steps/s")
+    print(f"VectorPong(256).step, analytic balls: {256 / analytic:8.0f} game steps/s  {stepwise / analytic:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+# Reproducible CPU benchmarks of the env, replay buffers, model, agent and a
+# short end-to-end training run. Every case is seeded, runs on one CPU thread
+# and reports the median time per call over several repeats. Results are
+# written as JSON and compared against a stored baseline. Timings are machine
+# specific, so no baseline is shipped (benchmarks/baseline.json is ignored by
+# git), record one locally before comparing.
+# Run from Games/RL-PongGame:
+#   python -m benchmarks.suite --save-baseline         record the current run as the baseline
+#   python -m benchmarks.suite                         full run, compared with benchmarks/baseline.json
+#   python -m benchmarks.suite --quick --only buffer   fewer sizes and repeats, one group
+# Exits with status 1 when a case is more than --threshold slower than its baseline.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import pygame
+import torch
+from backend.core.game import Pong
+from backend.core.observation import ObservationEncoder
+from backend.core.vector import VectorPong
+from training.buffer import ReplayBuffer, FrameReplayBuffer
+from training.frame_stack import FrameStack
+from training.model import Model
+from benchmarks.observation import collect_surfaces
+from benchmarks.physics import random_ball, ball_state
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+HIDDEN_DIM = 756
+
+# Sizes per group, (full, quick).
+SIZES = {"vector_envs": ((1, 16, 64, 256), (1, 64)),
+         "capacities": ((1000, 10000), (1000,)),
+         "frame_stacks": ((3, 4, 8), (3,)),
+         "batch_sizes": ((1, 32, 128), (1, 32)),
+         "games": ((1, 16, 64), (1, 16)),
+         "train_envs": ((1, 4), (1,))}
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+@contextlib.contextmanager
+def quiet():
+    # The envs and the agent print on construction and every episode.
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(fn, repeats, min_time):
+    # Median seconds per call. Each repeat runs fn often enough to take at least min_time.
+    fn()
+
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9)))
+
+    samples = [elapsed / calls]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        samples.append((time.perf_counter() - start) / calls)
+
+    return samples, calls
+
+
+def calibrate(repeats=5):
+    # A fixed mix of Python, NumPy and torch work. Comparing its time between
+    # two runs factors out how fast the machine is at the moment.
+    matrix = np.random.default_rng(0).random((128, 128))
+    conv = torch.nn.Conv2d(4, 32, kernel_size=8, stride=4)
+    x = torch.ones(8, 4, 84, 84)
+
+    def work():
+        sum(range(20000))
+        matrix @ matrix
+        with torch.no_grad():
+            conv(x)
+
+    samples, _ = measure(work, repeats, 0.2)
+    return statistics.median(samples) * 1e6
+
+
+def transitions(frame_stack, count, seed, episode_length=200):
+    # A pool of consecutive transitions of random binary frames, the way an
+    # episode reaches the buffer: next_state becomes the following state.
+    rng = np.random.default_rng(seed)
+    frames = FrameStack(1, frame_stack)
+
+    def frame():
+        return torch.from_numpy((rng.random((1, 1, 84, 84)) < 0.02).astype(np.uint8) * 255)
+
+    pool = []
+    state = frames.reset(frame())[0].clone()
+    for step in range(count):
+        next_state = frames.push(frame())[0].clone()
+        done = (step + 1) % episode_length == 0 or step == count - 1
+        pool.append((state, int(rng.integers(3)), float(rng.choice([-1.0, 0.0, 1.0])), next_state, done))
+        state = frames.reset(frame())[0].clone() if done else next_state
+
+    return pool
+
+
+def env_cases(quick, seed):
+    with quiet():
+        env = Pong(player1="ai", player2="bot", render_mode="headless", bot_difficulty="easy")
+    env.reset(seed=seed)
+    rng = random.Random(seed)
+
+    def pong_step():
+        done = env.step(player_1_action=rng.randrange(3))[3]
+        if done:
+            env.reset()
+
+    yield "env/pong_step", {"render_mode": "headless"}, pong_step, 1
+
+    with quiet():
+        surfaces = collect_surfaces(64, seed=seed)
+    encoder = ObservationEncoder(1280, 960)
+
+    def encode():
+        for surface in surfaces:
+            encoder.encode(surface)
+
+    yield "env/observation_encode", {"frames": len(surfaces)}, encode, len(surfaces)
+
+    balls = [random_ball(random.Random(seed * 1000003 + i)) for i in range(256)]
+    saved = [ball_state(ball) for ball in balls]
+
+    def ball_move():
+        for ball, state in zip(balls, saved):
+            ball.x, ball.y, ball.vx, ball.vy = state
+            ball.move()
+
+    yield "env/ball_move", {"balls": len(balls)}, ball_move, len(balls)
+
+    for num_envs in SIZES["vector_envs"][quick]:
+        with quiet():
+            envs = VectorPong(num_envs, bot_difficulty="easy", seed=seed)
+        actions = np.random.default_rng(seed).integers(0, 3, (1024, num_envs, 2))
+        actions[..., 1] = -1
+        counter = iter(range(10 ** 12))
+
+        def vector_step(envs=envs, actions=actions, counter=counter):
+            envs.step(actions[next(counter) % len(actions)])
+
+        yield f"env/vector_step/envs={num_envs}", {"num_envs": num_envs}, vector_step, num_envs
+
+
+def buffer_cases(quick, seed):
+    sizes = [(capacity, 4) for capacity in SIZES["capacities"][quick]]
+    sizes += [(1000, frame_stack) for frame_stack in SIZES["frame_stacks"][quick] if (1000, frame_stack) not in sizes]
+
+    for name, buffer_class in (("standard", ReplayBuffer), ("frame", FrameReplayBuffer)):
+        for capacity, frame_stack in sizes:
+            pool = transitions(frame_stack, 256, seed)
+            memory = buffer_class(max_size=capacity, input_shape=(frame_stack, 84, 84), n_actions=3,
+                                  input_device="cpu", output_device="cpu")
+            counter = iter(range(10 ** 12))
+
+            def store(memory=memory, pool=pool, counter=counter):
+                memory.store_transition(*pool[next(counter) % len(pool)])
+
+            params = {"buffer": name, "capacity": capacity, "frame_stack": frame_stack}
+            yield f"buffer/{name}/store/capacity={capacity}/stack={frame_stack}", params, store, 1
+
+            while memory.mem_ctr < capacity:
+                store()
+
+            for batch_size in SIZES["batch_sizes"][quick][1:]:
+                def sample(memory=memory, batch_size=batch_size):
+                    memory.sample_buffer(batch_size)
+
+                yield (f"buffer/{name}/sample/capacity={capacity}/stack={frame_stack}/batch={batch_size}",
+                       {**params, "batch_size": batch_size}, sample, batch_size)
+
+
+def model_cases(quick, seed):
+    for frame_stack in SIZES["frame_stacks"][quick]:
+        model = Model(action_dim=3, hidden_dim=HIDDEN_DIM, observation_shape=(frame_stack, 84, 84), obs_stack=frame_stack)
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
+
+        for batch_size in SIZES["batch_sizes"][quick]:
+            x = torch.from_numpy((np.random.default_rng(seed).random((batch_size, frame_stack, 84, 84)) < 0.02) * 255.0).float()
+
+            def forward(model=model, x=x):
+                with torch.no_grad():
+                    model(x)
+
+            params = {"frame_stack": frame_stack, "batch_size": batch_size, "hidden_dim": HIDDEN_DIM}
+            yield f"model/forward/stack={frame_stack}/batch={batch_size}", params, forward, batch_size
+
+            if batch_size == 1:
+                continue
+
+            def train_step(model=model, optimizer=optimizer, x=x):
+                loss = model(x).pow(2).mean()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            yield f"model/train_step/stack={frame_stack}/batch={batch_size}", params, train_step, batch_size
+
+
+def make_agent(**kwargs):
+    from training.agent import Agent
+
+    with quiet():
+        agent = Agent(hidden_layer=HIDDEN_DIM, eval_workers=0, metrics_backends=["memory"], **kwargs)
+    return agent
+
+
+def agent_cases(quick, seed):
+    for frame_stack in SIZES["frame_stacks"][quick]:
+        agent = make_agent(frame_stack=frame_stack, max_buffer_size=1000)
+        obs = torch.from_numpy((np.random.default_rng(seed).random((64, frame_stack, 84, 84)) < 0.02).astype(np.uint8) * 255)
+
+        def get_action(agent=agent, obs=obs):
+            agent.get_action(obs[0], player=1, eval_mode=True)
+
+        yield f"agent/get_action/stack={frame_stack}", {"frame_stack": frame_stack}, get_action, 1
+
+        for num_games in SIZES["games"][quick]:
+            def get_actions(agent=agent, obs=obs[:num_games]):
+                agent.get_actions(obs, eval_mode=True)
+
+            yield (f"agent/get_actions/stack={frame_stack}/games={num_games}",
+                   {"frame_stack": frame_stack, "num_games": num_games}, get_actions, num_games)
+
+
+def train_cases(quick, seed):
+    # A few short self-play episodes through Agent.train, timed per env step.
+    # Learning starts once the buffer holds 10 batches, after that every game
+    # step learns, so the vector runs are dominated by the learner.
+    episodes, max_episode_steps = (2, 200) if quick else (2, 250)
+
+    for num_envs in SIZES["train_envs"][quick]:
+        def train(num_envs=num_envs):
+            seed_everything(seed)
+            agent = make_agent(max_buffer_size=5000, max_episode_steps=max_episode_steps, epsilon=0.1,
+                               num_envs=num_envs, vector_env="numpy")
+            agent.env.reset(seed=seed)
+            if agent.envs is not None:
+                with quiet():
+                    agent.envs = VectorPong(num_envs, bot_difficulty="easy", seed=seed)
+
+            # Agent.train writes models/ and logs/ into the working directory.
+            cwd = os.getcwd()
+            with tempfile.TemporaryDirectory() as directory, quiet():
+                os.chdir(directory)
+                try:
+                    agent.train(episodes=episodes * num_envs, config={}, batch_size=32)
+                finally:
+                    os.chdir(cwd)
+
+            return agent.memory.mem_ctr
+
+        params = {"num_envs": num_envs, "episodes": episodes * num_envs, "max_episode_steps": max_episode_steps}
+        yield f"train/end_to_end/envs={num_envs}", params, train, None
+
+
+GROUPS = {"env": env_cases,
+          "buffer": buffer_cases,
+          "model": model_cases,
+          "agent": agent_cases,
+          "train": train_cases}
+
+
+def run(groups, quick=False, seed=0, repeats=5, min_time=0.2):
+    results = {}
+
+    for group in groups:
+        seed_everything(seed)
+
+        for name, params, fn, items in GROUPS[group](quick, seed):
+            seed_everything(seed)
+
+            if items is None:
+                # End-to-end cases run once per repeat and return how many items (env steps) they did.
+                samples = []
+                for _ in range(max(1, repeats // 2)):
+                    start = time.perf_counter()
+                    done = fn()
+                    samples.append((time.perf_counter() - start) / done)
+                calls, items = 1, 1
+            else:
+                samples, calls = measure(fn, repeats, min_time)
+
+            median = statistics.median(samples)
+            results[name] = {"group": group,
+                             "params": params,
+                             "median_us": median * 1e6,
+                             "min_us": min(samples) * 1e6,
+                             "max_us": max(samples) * 1e6,
+                             "calls_per_repeat": calls,
+                             "repeats": len(samples),
+                             "items_per_sec": items / median}
+
+            print(f"{name:<64}{median * 1e6:>14.1f} us{items / median:>14.0f} items/s")
+
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "threads": torch.get_num_threads()}
+
+
+def compare(results, baseline, threshold, scale=1.0):
+    # Cases slower than the baseline median by more than threshold (0.2 = 20%)
+    # are regressions. scale is how much slower the machine ran the
+    # calibration work than when the baseline was recorded.
+    regressions = []
+
+    print(f"\n{'case':<64}{'baseline us':>14}{'current us':>14}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<64}{'-':>14}{result['median_us']:>14.1f}{'new':>8}")
+            continue
+
+        ratio = result["median_us"] / (baseline[name]["median_us"] * scale)
+        status = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<64}{baseline[name]['median_us']:>14.1f}{result['median_us']:>14.1f}{ratio:>8.2f}{status}")
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pong RL benchmark suite")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma separated groups out of {','.join(GROUPS)}")
+    parser.add_argument("--quick", action="store_true", help="fewer sizes and shorter repeats")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--threads", type=int, default=1, help="torch CPU threads")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--no-normalize", action="store_true", help="compare raw times, without the calibration scale")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline as well")
+    args = parser.parse_args()
+
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    for group in groups:
+        if group not in GROUPS:
+            parser.error(f"Unknown group {group}, expected one of {', '.join(GROUPS)}")
+
+    # CPU only and single threaded, so runs on different machines measure the same work.
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    torch.set_num_threads(args.threads)
+
+    calibration_us = calibrate()
+    print(f"Calibration: {calibration_us:.1f} us")
+
+    results = run(groups, quick=args.quick, seed=args.seed, repeats=args.repeats,
+                  min_time=args.min_time / 4 if args.quick else args.min_time)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "environment": environment(),
+              "calibration_us": calibration_us,
+              "settings": {"groups": groups, "quick": args.quick, "seed": args.seed, "repeats": args.repeats,
+                           "min_time": args.min_time, "threads": args.threads},
+              "results": results}
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline["environment"]["processor"] != report["environment"]["processor"]:
+        print("Baseline was recorded on a different machine, ratios are only indicative")
+
+    scale = 1.0 if args.no_normalize else calibration_us / baseline["calibration_us"]
+    print(f"Machine speed against the baseline run: {1 / scale:.2f}x, baseline times are scaled by {scale:.2f}")
+
+    regressions = compare(results, baseline["results"], args.threshold, scale)
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) more than {args.threshold:.0%} slower than the baseline")
+        sys.exit(1)
+
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
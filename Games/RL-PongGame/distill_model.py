@@ -0,0 +1,138 @@
+"""
+Distill the trained PyTorch RL model into smaller students for browser and CPU play
+"""
+import json
+import os
+import sys
+import torch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from training.model import Model
+from training.buffer import load_buffer
+from training.inference import InferenceModel
+from training.evaluation import evaluate_policy
+from training.quantization import record_observations
+from training.distillation import (STUDENTS, DistillationData, collect_observations, distill, save_student,
+                                   count_parameters, pareto_front)
+from quantize_model import latency
+
+
+def distill_model(model_path="models/latest.pt", students=tuple(STUDENTS), source="rollouts", buffer_dir=None,
+                  num_obs=50000, steps=20000, dagger_rounds=1, dagger_obs=10000, eval_episodes=32,
+                  max_episode_steps=1000, hidden_layer=756, frame_stack=3, output_dir="models/students",
+                  export=None, seed=0):
+    """
+    Distill the model into each student, save them and report the size / speed / strength trade-off
+
+    Args:
+        model_path: Path to the trained PyTorch model (.pt file), the teacher
+        students: Names from training.distillation.STUDENTS
+        source: Where the training observations come from, "rollouts" or "buffer"
+        buffer_dir: Memory-mapped replay buffer (the buffer_dir of a training run) for "buffer"
+        export: Student to run through the ONNX export and deploy to frontend/pong_agent.onnx
+    """
+    torch.set_num_threads(1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Loading teacher from {model_path}...")
+    teacher_kwargs = {"action_dim": 3,
+                      "hidden_dim": hidden_layer,
+                      "observation_shape": (frame_stack, 84, 84),
+                      "obs_stack": frame_stack}
+    teacher = Model(**teacher_kwargs)
+    teacher.load_state_dict(torch.load(model_path, map_location="cpu"))
+    teacher.eval()
+
+    print(f"Collecting {num_obs} observations ({source})...")
+    buffer = load_buffer(buffer_dir) if source == "buffer" else None
+    data = DistillationData(teacher, teacher_kwargs["observation_shape"])
+    data.add(collect_observations(teacher, frame_stack, num_obs, source=source, buffer=buffer, seed=seed))
+
+    # The same unseen games for every row.
+    test_obs = record_observations(teacher, frame_stack, 256, seed=seed + 1)
+
+    rows = {}
+    models = {"teacher": (teacher, model_path)}
+
+    for name in students:
+        print(f"\nDistilling {name} {STUDENTS[name]}...")
+        student, student_kwargs, agreement = distill(teacher, teacher_kwargs, STUDENTS[name], data, steps,
+                                                     dagger_rounds=dagger_rounds, dagger_obs=dagger_obs, seed=seed)
+
+        path = os.path.join(output_dir, f"{name}.pt")
+        save_student(student, student_kwargs, path)
+        print(f"✅ Saved to {path} ({agreement:.1%} agreement with the teacher)")
+
+        models[name] = (student, path)
+        rows[name] = {"agreement": agreement}
+
+    rows = {"teacher": {"agreement": 1.0}, **rows}
+
+    for name, (model, path) in models.items():
+        policy = InferenceModel(model)
+        evaluation = evaluate_policy(policy, frame_stack, "hard", eval_episodes, max_episode_steps, seed=seed + 2)
+
+        rows[name].update({"path": path,
+                           "params": count_parameters(model),
+                           "latency_us": latency(policy, test_obs, 1) * 1e6,
+                           "mean_score": evaluation["all"]["mean_score"],
+                           "win_rate": evaluation["all"]["win_rate"],
+                           "eval_vs_hard_bot": evaluation["all"]})
+
+    front = pareto_front(rows)
+
+    print(f"\n{'model':<10}{'params':>11}{'b=1 us':>10}{'agreement':>11}{'score vs hard':>15}{'win rate':>10}  pareto")
+    for name, row in sorted(rows.items(), key=lambda item: item[1]["params"]):
+        print(f"{name:<10}{row['params']:>11,}{row['latency_us']:>10.0f}{row['agreement']:>10.1%}"
+              f"{row['mean_score']:>15.2f}{row['win_rate']:>9.1%}  {'*' if name in front else ''}")
+
+    report = {"teacher": model_path, "source": source, "num_obs": num_obs, "steps": steps,
+              "dagger_rounds": dagger_rounds, "models": rows, "pareto": front}
+
+    report_path = os.path.join(output_dir, "distillation_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+    if export is not None:
+        from export_to_onnx import build_onnx_artifacts
+        build_onnx_artifacts(models[export][0], frame_stack=frame_stack)
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distill the PyTorch RL model into smaller students")
+    parser.add_argument("--model", default="models/latest.pt", help="Path to the teacher PyTorch model")
+    parser.add_argument("--students", default=",".join(STUDENTS),
+                        help=f"Comma separated, from {', '.join(STUDENTS)}")
+    parser.add_argument("--source", default="rollouts", choices=["rollouts", "buffer"],
+                        help="Training observations, teacher games or a replay buffer")
+    parser.add_argument("--buffer-dir", default=None, help="buffer_dir of a training run, for --source buffer")
+    parser.add_argument("--num-obs", type=int, default=50000)
+    parser.add_argument("--steps", type=int, default=20000, help="Training steps per student")
+    parser.add_argument("--dagger-rounds", type=int, default=1, help="Rounds on the student's own games")
+    parser.add_argument("--dagger-obs", type=int, default=10000, help="Observations recorded per round")
+    parser.add_argument("--eval-episodes", type=int, default=32, help="Games against the hard bot per model")
+    parser.add_argument("--hidden-layer", type=int, default=756)
+    parser.add_argument("--frame-stack", type=int, default=3)
+    parser.add_argument("--output-dir", default="models/students")
+    parser.add_argument("--export", default=None, help="Student to export to frontend/pong_agent.onnx")
+
+    args = parser.parse_args()
+
+    students = args.students.split(",")
+    for name in students:
+        if name not in STUDENTS:
+            parser.error(f"Unknown student {name}, expected one of {', '.join(STUDENTS)}")
+    if args.export is not None and args.export not in students:
+        parser.error(f"--export {args.export} is not one of the distilled --students")
+
+    distill_model(args.model, students=students, source=args.source, buffer_dir=args.buffer_dir,
+                  num_obs=args.num_obs, steps=args.steps, dagger_rounds=args.dagger_rounds,
+                  dagger_obs=args.dagger_obs, eval_episodes=args.eval_episodes, hidden_layer=args.hidden_layer,
+                  frame_stack=args.frame_stack, output_dir=args.output_dir, export=args.export)
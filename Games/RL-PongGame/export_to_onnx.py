@@ -1,6 +1,10 @@
 """
 Export trained PyTorch RL model to ONNX format for browser inference
 """
+import inspect
+import shutil
+import time
+import numpy as np
 import torch
 import sys
 import os
@@ -10,42 +14,59 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from training.model import Model
 from training.agent import Agent
+from training.quantization import record_observations
 
-def export_model_to_onnx(model_path="models/latest.pt", output_path="frontend/pong_agent.onnx"):
-    """
-    Export the trained RL model to ONNX format
-    
-    Args:
-        model_path: Path to the trained PyTorch model (.pt file)
-        output_path: Path where ONNX model will be saved
-    """
+def load_model(model_path="models/latest.pt"):
     print(f"Loading model from {model_path}...")
-    
+
     # Create agent with same configuration as training (hidden_layer=756, frame_stack=3)
     agent = Agent(eval=True, frame_stack=3, hidden_layer=756)
-    
+
     # Load the trained weights
     agent.model.load_the_model(filename=model_path)
-    
+
     # Move model to CPU for ONNX export (required for compatibility)
     agent.model = agent.model.cpu()
     agent.model.eval()  # Set to evaluation mode
-    
+
     print(f"Model loaded successfully!")
     print(f"Model architecture: {agent.model}")
-    
+
+    return agent.model
+
+
+def export_model_to_onnx(model_path="models/latest.pt", output_path="frontend/pong_agent.onnx"):
+    """
+    Export the trained RL model to ONNX format
+
+    Args:
+        model_path: Path to the trained PyTorch model (.pt file)
+        output_path: Path where ONNX model will be saved
+    """
+    model = load_model(model_path)
+    export_module_to_onnx(model, output_path)
+
+    return model
+
+
+def export_module_to_onnx(model, output_path, frame_stack=3):
+    """
+    Export any Model-like module, (batch, frame_stack, 84, 84) frames in, Q-values out
+    """
     # Create dummy input matching the expected shape: (batch_size, frame_stack, height, width)
     # The model expects stacked grayscale frames (3 frames of 84x84)
-    dummy_input = torch.randn(1, 3, 84, 84)
-    
+    dummy_input = torch.randn(1, frame_stack, 84, 84)
     print(f"Dummy input shape: {dummy_input.shape}")
-    
+
     # Export to ONNX
     print(f"Exporting to ONNX format...")
-    
-    # Export with all data embedded in single file
+
+    # Newer torch defaults to the torch.export based exporter, which cannot
+    # target opset 14 and writes the weights to a separate .data file.
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
     torch.onnx.export(
-        agent.model,
+        model,
         dummy_input,
         output_path,
         export_params=True,
@@ -57,79 +78,208 @@ def export_model_to_onnx(model_path="models/latest.pt", output_path="frontend/po
             'input': {0: 'batch_size'},
             'action_logits': {0: 'batch_size'}
         },
-        verbose=False
+        verbose=False,
+        **export_kwargs
     )
-    
+
     print(f"✅ Model exported successfully to {output_path}")
-    
-    # Ensure no external data files are created and convert if needed
+
+    # Always re-save as a single file, onnx.load pulls in any external data
+    # (the browser fetches exactly one file)
     import onnx
     model = onnx.load(output_path)
-    
-    # Check if external data is used
-    has_external_data = any(
-        init.external_data for init in model.graph.initializer 
-        if hasattr(init, 'external_data') and init.external_data
-    )
-    
-    if has_external_data:
-        print("⚠️  Model has external data, converting to single file...")
-        # Convert external data to embedded
-        onnx.save_model(
-            model, 
-            output_path,
-            save_as_external_data=False
-        )
-        print("✓ Converted to single-file format")
-        # Reload to verify
-        model = onnx.load(output_path)
-    
+    onnx.save_model(model, output_path, save_as_external_data=False)
+
+    data_file = output_path + ".data"
+    if os.path.exists(data_file):
+        os.remove(data_file)
+        print(f"✓ Embedded {data_file} into {output_path}")
+
     # Get file size
     file_size = os.path.getsize(output_path)
     print(f"File size: {file_size / 1024:.2f} KB")
-    
+
     # Verify the export by loading it back
     print("\nVerifying ONNX model...")
-    import onnx
     onnx_model = onnx.load(output_path)
     onnx.checker.check_model(onnx_model)
     print("✅ ONNX model is valid!")
-    
-    # Test inference with ONNX Runtime
+
+
+def onnx_session(path, threads=1):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def optimize_onnx(input_path, output_path):
+    """
+    Graph-optimized copy (constant folding, redundant node removal). Only the
+    basic level is saved, the extended fusions are CPU provider specific and
+    would not load in onnxruntime-web.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    options.optimized_model_filepath = output_path
+    ort.InferenceSession(input_path, options, providers=["CPUExecutionProvider"])
+
+
+def quantize_onnx(input_path, output_path, calibration_obs):
+    """
+    Static int8 quantization (QDQ format, per channel weights) with activation
+    ranges calibrated on recorded frames
+    """
+    from onnxruntime.quantization import quantize_static, quant_pre_process, CalibrationDataReader, QuantFormat, QuantType
+
+    class FrameReader(CalibrationDataReader):
+
+        def __init__(self, observations, batch_size=32):
+            self.batches = iter([{"input": observations[i:i + batch_size]}
+                                 for i in range(0, len(observations), batch_size)])
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    preprocessed_path = output_path + ".pre.onnx"
+    quant_pre_process(input_path, preprocessed_path)
+
     try:
-        import onnxruntime as ort
-        print("\nTesting ONNX inference...")
-        sess = ort.InferenceSession(output_path)
-        
-        # Get input/output names
-        input_name = sess.get_inputs()[0].name
-        output_name = sess.get_outputs()[0].name
-        
-        print(f"Input name: {input_name}")
-        print(f"Output name: {output_name}")
-        
-        # Test inference
-        test_input = torch.randn(1, 3, 84, 84).numpy()
-        result = sess.run([output_name], {input_name: test_input})
-        print(f"Output shape: {result[0].shape}")
-        print(f"Sample output: {result[0]}")
-        
-        # Get action from logits
-        action = result[0].argmax()
-        print(f"Selected action: {action}")
-        print("✅ ONNX inference test passed!")
-        
-    except ImportError:
-        print("⚠️  onnxruntime not installed. Install with: pip install onnxruntime")
-        print("   (Optional - only needed for verification)")
+        quantize_static(preprocessed_path, output_path, FrameReader(calibration_obs),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(preprocessed_path)
+
+
+def convert_fp16(input_path, output_path):
+    """
+    fp16 weights and activations, the input and output stay float32 so
+    onnx_agent.js feeds it the same tensors
+    """
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = convert_float_to_float16(onnx.load(input_path), keep_io_types=True)
+    onnx.save_model(model, output_path)
+
+
+def onnx_latency(session, observation, min_time=0.5):
+    feeds = {session.get_inputs()[0].name: observation}
+
+    for _ in range(5):
+        session.run(None, feeds)
+
+    times = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        call_start = time.perf_counter()
+        session.run(None, feeds)
+        times.append(time.perf_counter() - call_start)
+
+    return float(np.median(times))
+
+
+def report_artifacts(model, artifacts, observations):
+    """
+    Size, onnxruntime CPU latency at batch 1 and greedy action agreement with
+    the PyTorch model over the same real observations
+    """
+    with torch.no_grad():
+        reference = model(torch.from_numpy(observations)).argmax(dim=-1).numpy()
+
+    rows = {}
+    for name, path in artifacts.items():
+        session = onnx_session(path)
+        input_name = session.get_inputs()[0].name
+
+        actions = np.concatenate([session.run(None, {input_name: observations[i:i + 256]})[0].argmax(axis=-1)
+                                  for i in range(0, len(observations), 256)])
+
+        rows[name] = {"path": path,
+                      "size_kb": os.path.getsize(path) / 1024,
+                      "latency_us": onnx_latency(session, observations[:1]) * 1e6,
+                      "agreement": float((actions == reference).mean())}
+
+    print(f"\n{'artifact':<11}{'size KB':>11}{'latency us':>13}{'agreement':>12}  path")
+    for name, row in rows.items():
+        print(f"{name:<11}{row['size_kb']:>11.1f}{row['latency_us']:>13.1f}{row['agreement']:>11.2%}  {row['path']}")
+
+    return rows
+
+
+def build_onnx_artifacts(model, output_path="frontend/pong_agent.onnx", frame_stack=3, int8=True, fp16=False,
+                         deploy="optimized", calibration_size=512, test_size=1024):
+    """
+    Export model and derive the optimized / int8 / fp16 variants next to
+    output_path (pong_agent.fp32.onnx, pong_agent.optimized.onnx, ...), report
+    on each and copy the deploy variant to output_path, the file the browser loads
+
+    Args:
+        model: Model-like module on CPU, e.g. a trained Model or a distilled student
+        deploy: Which artifact becomes output_path
+    """
+    model = model.cpu().eval()
+    base_path = os.path.splitext(output_path)[0]
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    artifacts = {"fp32": f"{base_path}.fp32.onnx"}
+    export_module_to_onnx(model, artifacts["fp32"], frame_stack=frame_stack)
+
+    artifacts["optimized"] = f"{base_path}.optimized.onnx"
+    optimize_onnx(artifacts["fp32"], artifacts["optimized"])
+
+    # Calibration and report frames come from different recorded games.
+    print(f"\nRecording observations from games against the hard bot...")
+    test_obs = record_observations(model, frame_stack, test_size, seed=1).float().numpy()
+
+    if int8:
+        calibration_obs = record_observations(model, frame_stack, calibration_size, seed=0).float().numpy()
+        artifacts["int8"] = f"{base_path}.int8.onnx"
+        quantize_onnx(artifacts["optimized"], artifacts["int8"], calibration_obs)
+
+    if fp16:
+        artifacts["fp16"] = f"{base_path}.fp16.onnx"
+        convert_fp16(artifacts["optimized"], artifacts["fp16"])
+
+    rows = report_artifacts(model, artifacts, test_obs)
+
+    if deploy not in artifacts:
+        raise ValueError(f"Cannot deploy {deploy}, built {', '.join(artifacts)}")
+
+    shutil.copyfile(artifacts[deploy], output_path)
+    print(f"\n✅ Deployed the {deploy} model to {output_path}")
+    print("   Browsers that cached the old model in IndexedDB keep it until the cache is cleared")
+
+    return rows
+
 
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description="Export PyTorch RL model to ONNX")
     parser.add_argument("--model", default="models/latest.pt", help="Path to PyTorch model")
+    parser.add_argument("--student", default=None, help="Distilled student (.pt from distill_model.py) to export instead")
     parser.add_argument("--output", default="frontend/pong_agent.onnx", help="Output ONNX path")
-    
+    parser.add_argument("--no-int8", action="store_true", help="Skip the int8 model")
+    parser.add_argument("--fp16", action="store_true", help="Also build an fp16 model")
+    parser.add_argument("--deploy", default="optimized", choices=["fp32", "optimized", "int8", "fp16"],
+                        help="Artifact copied to --output")
+    parser.add_argument("--calibration-size", type=int, default=512, help="Recorded frames for int8 calibration")
+
     args = parser.parse_args()
-    
-    export_model_to_onnx(args.model, args.output)
+
+    if args.student is not None:
+        from training.distillation import load_student
+        model, student_kwargs = load_student(args.student)
+        print(f"Loaded student from {args.student}: {student_kwargs}")
+    else:
+        model = load_model(args.model)
+
+    build_onnx_artifacts(model, args.output, int8=not args.no_int8, fp16=args.fp16, deploy=args.deploy,
+                         calibration_size=args.calibration_size)
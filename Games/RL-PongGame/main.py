@@ -6,6 +6,8 @@ from training.agent import Agent
 #env = Pong(render_mode="human", player1="human", player2="bot", bot_difficulty="hard")
 
 agent = Agent(eval=True, hidden_layer=756)
+#agent = Agent(eval=True, hidden_layer=756, quantized_model="models/latest_int8_static.pt")  # from quantize_model.py
+#agent = Agent(eval=True, student_model="models/students/small.pt")  # from distill_model.py
 
 #env = Pong(render_mode="human", player1="human", player2="ai", bot_difficulty="easy", ai_agent=agent)
 #env = Pong(render_mode="human", player1="ai", player2="human", bot_difficulty="easy", ai_agent=agent)
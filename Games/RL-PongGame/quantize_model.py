@@ -0,0 +1,138 @@
+"""
+Quantize the trained PyTorch RL model to int8 for CPU self-play and serving
+"""
+import json
+import os
+import sys
+import time
+import torch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from training.model import Model
+from training.buffer import load_buffer
+from training.evaluation import evaluate_policy
+from training.quantization import (quantize_dynamic_model, quantize_static_model, record_observations,
+                                   buffer_observations, save_quantized, load_quantized, action_agreement,
+                                   default_engine)
+
+
+def latency(policy, obs, batch_size, min_time=0.5):
+    x = obs[:batch_size]
+
+    with torch.no_grad():
+        for _ in range(3):
+            policy(x)
+
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            policy(x)
+            calls += 1
+
+    return (time.perf_counter() - start) / calls
+
+
+def quantize_model(model_path="models/latest.pt", modes=("dynamic", "static"), calibration="games",
+                   buffer_dir=None, calibration_size=2048, test_size=2048, eval_episodes=32,
+                   max_episode_steps=1000, hidden_layer=756, frame_stack=3, engine=None, output_dir="models"):
+    """
+    Quantize the model, save each variant next to it and report how close it stays to fp32
+
+    Args:
+        model_path: Path to the trained PyTorch model (.pt file)
+        modes: "dynamic" and/or "static"
+        calibration: Where the static calibration observations come from, "games" or "buffer"
+        buffer_dir: Memory-mapped replay buffer (the buffer_dir of a training run) for "buffer"
+    """
+    torch.set_num_threads(1)
+    engine = engine or default_engine()
+
+    print(f"Loading model from {model_path}...")
+    model = Model(action_dim=3, hidden_dim=hidden_layer, observation_shape=(frame_stack, 84, 84), obs_stack=frame_stack)
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    model.eval()
+
+    # Calibration and test observations come from different games.
+    if calibration == "buffer":
+        if buffer_dir is None:
+            raise ValueError("Calibration from a replay buffer needs --buffer-dir")
+        print(f"Sampling {calibration_size} calibration observations from the replay buffer in {buffer_dir}...")
+        calibration_obs = buffer_observations(load_buffer(buffer_dir), calibration_size)
+    else:
+        print(f"Recording {calibration_size} calibration observations from games against the hard bot...")
+        calibration_obs = record_observations(model, frame_stack, calibration_size, seed=0)
+
+    test_obs = record_observations(model, frame_stack, test_size, seed=1)
+
+    base_name = os.path.splitext(os.path.basename(model_path))[0]
+    report = {"model": model_path, "engine": engine, "calibration": calibration, "variants": {}}
+
+    variants = {"fp32": (model, model_path)}
+    for mode in modes:
+        print(f"\nQuantizing ({mode})...")
+        if mode == "dynamic":
+            qmodel = quantize_dynamic_model(model)
+        elif mode == "static":
+            qmodel = quantize_static_model(model, calibration_obs, engine=engine)
+        else:
+            raise ValueError(f"Unknown quantization mode {mode}, expected dynamic or static")
+
+        output_path = os.path.join(output_dir, f"{base_name}_int8_{mode}.pt")
+        save_quantized(qmodel, output_path, mode, frame_stack, engine=engine)
+        print(f"✅ Saved to {output_path}")
+
+        # Report on the saved file, the one Agent(eval=True, quantized_model=...) loads.
+        variants[mode] = (load_quantized(output_path)[0], output_path)
+
+    for name, (policy, path) in variants.items():
+        agreement, max_error = action_agreement(model, policy, test_obs)
+        evaluation = evaluate_policy(policy, frame_stack, "hard", eval_episodes, max_episode_steps, seed=2)
+
+        report["variants"][name] = {"path": path,
+                                    "size_kb": os.path.getsize(path) / 1024,
+                                    "action_agreement": agreement,
+                                    "max_q_error": max_error,
+                                    "latency_us_batch_1": latency(policy, test_obs, 1) * 1e6,
+                                    "latency_us_batch_64": latency(policy, test_obs, 64) * 1e6,
+                                    "eval_vs_hard_bot": evaluation["all"]}
+
+    print(f"\n{'variant':<10}{'size KB':>10}{'agreement':>11}{'max dq':>10}{'b=1 us':>10}{'b=64 us':>10}{'score vs hard':>18}{'win rate':>10}")
+    for name, row in report["variants"].items():
+        score = row["eval_vs_hard_bot"]
+        print(f"{name:<10}{row['size_kb']:>10.1f}{row['action_agreement']:>10.1%}{row['max_q_error']:>10.4f}"
+              f"{row['latency_us_batch_1']:>10.0f}{row['latency_us_batch_64']:>10.0f}"
+              f"{score['mean_score']:>11.2f} ± {score['mean_score_ci']:<5.2f}{score['win_rate']:>9.1%}")
+
+    report_path = os.path.join(output_dir, f"{base_name}_quantization_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quantize the PyTorch RL model to int8")
+    parser.add_argument("--model", default="models/latest.pt", help="Path to PyTorch model")
+    parser.add_argument("--mode", default="both", choices=["dynamic", "static", "both"])
+    parser.add_argument("--calibration", default="games", choices=["games", "buffer"],
+                        help="Static calibration data, recorded games or a replay buffer")
+    parser.add_argument("--buffer-dir", default=None, help="buffer_dir of a training run, for --calibration buffer")
+    parser.add_argument("--calibration-size", type=int, default=2048)
+    parser.add_argument("--eval-episodes", type=int, default=32, help="Games against the hard bot per variant")
+    parser.add_argument("--hidden-layer", type=int, default=756)
+    parser.add_argument("--frame-stack", type=int, default=3)
+    parser.add_argument("--engine", default=None, help="Quantized engine, x86, fbgemm or qnnpack (ARM)")
+    parser.add_argument("--output-dir", default="models")
+
+    args = parser.parse_args()
+
+    quantize_model(args.model, modes=("dynamic", "static") if args.mode == "both" else (args.mode,),
+                   calibration=args.calibration, buffer_dir=args.buffer_dir,
+                   calibration_size=args.calibration_size, eval_episodes=args.eval_episodes,
+                   hidden_layer=args.hidden_layer, frame_stack=args.frame_stack, engine=args.engine,
+                   output_dir=args.output_dir)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the game and training packages the way the scripts do, from Games/RL-PongGame.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
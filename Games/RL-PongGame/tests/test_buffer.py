@@ -0,0 +1,143 @@
+# Replay buffer checks against plain NumPy / ReplayBuffer references.
+import numpy as np
+import pytest
+import torch
+from training.buffer import ReplayBuffer, FrameReplayBuffer, PrioritizedReplayBuffer
+from training.segment_tree import SumMinTree
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 1000])
+def test_sum_tree_matches_numpy(capacity):
+    rng = np.random.default_rng(0)
+    tree = SumMinTree(capacity)
+    leaves = np.zeros(capacity)
+
+    for _ in range(50):
+        # Batches with repeated leaves, the last value of a leaf wins. Integer
+        # priorities keep every sum exact, so the prefix search has no rounding ties.
+        idx = rng.integers(0, capacity, size=rng.integers(1, 32))
+        values = rng.integers(0, 10, size=len(idx)).astype(np.float64)
+
+        tree.update(idx, values)
+        for i, value in zip(idx, values):
+            leaves[i] = value
+
+        assert tree.total() == leaves.sum()
+        np.testing.assert_array_equal(tree.get(np.arange(capacity)), leaves)
+
+        if leaves.sum() > 0:
+            mass = rng.random(64) * leaves.sum()
+            expected = np.searchsorted(np.cumsum(leaves), mass, side="right")
+            np.testing.assert_array_equal(tree.find_prefixsum(mass), expected)
+
+
+def test_sum_tree_min_ignores_zero_leaves():
+    tree = SumMinTree(10)
+    assert tree.min() == np.inf
+
+    tree.update([0, 3, 7], [5.0, 0.0, 2.0])
+    assert tree.min() == 2.0
+
+    # A leaf set back to 0 stops counting, as does an overwritten minimum.
+    tree.update([7, 3], [0.0, 4.0])
+    assert tree.min() == 4.0
+
+
+def test_prioritized_weights():
+    np.random.seed(0)
+    memory = PrioritizedReplayBuffer(ReplayBuffer(max_size=64, input_shape=(1, 4, 4), n_actions=3, input_device="cpu"),
+                                     alpha=0.6, beta=0.4, beta_annealing_steps=10)
+
+    num_stored = 40
+    for i in range(num_stored):
+        memory.store_transition(torch.full((1, 4, 4), i), 0, 0.0, torch.full((1, 4, 4), i + 1), False)
+
+    td_errors = np.random.random(num_stored) * 5
+    memory.update_priorities(np.arange(num_stored), td_errors)
+
+    for _ in range(3):
+        states, _, _, _, _, idx, weights = memory.sample_buffer(16)
+
+        priorities = (np.abs(td_errors) + memory.epsilon) ** memory.alpha
+        probabilities = priorities / priorities.sum()
+        max_weight = (num_stored * probabilities.min()) ** (-memory.beta)
+        expected = (num_stored * probabilities[idx]) ** (-memory.beta) / max_weight
+
+        np.testing.assert_allclose(weights.numpy(), expected, rtol=1e-5)
+        # The sampled slots hold the transitions their indices point at.
+        np.testing.assert_array_equal(states[:, 0, 0, 0].numpy(), idx)
+
+    assert memory.beta == pytest.approx(0.4 + 0.3 * 0.6)
+
+
+def test_prioritized_frame_buffer_samples_only_valid_slots():
+    np.random.seed(0)
+    torch.manual_seed(0)
+    memory = PrioritizedReplayBuffer(FrameReplayBuffer(max_size=50, input_shape=(3, 4, 4), n_actions=3, input_device="cpu"))
+
+    state = torch.zeros(3, 4, 4)
+    for t in range(400):
+        next_state = torch.cat([state[1:], torch.full((1, 4, 4), t % 251)])
+        done = t % 13 == 12
+        memory.store_transition(state, 0, 0.0, next_state, done, stream=0)
+        state = torch.zeros(3, 4, 4) if done else next_state
+
+        if t >= 30:
+            idx = memory.sample_indices(32)
+            assert memory.buffer.is_valid(torch.as_tensor(idx)).all()
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_frame_buffer_matches_replay_buffer(packed):
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+
+    frame_stack, num_streams, max_size = 3, 3, 200
+    memory = FrameReplayBuffer(max_size=max_size, input_shape=(frame_stack, 8, 8), n_actions=3, input_device="cpu",
+                               packed=packed)
+    # Keeps every transition, the stacks the frame buffer has to rebuild.
+    reference = ReplayBuffer(max_size=2000, input_shape=(frame_stack, 8, 8), n_actions=3, input_device="cpu")
+    reference_slot = {}
+
+    # Few distinct binary frames, so different streams often show identical states.
+    frames = [torch.from_numpy(rng.integers(0, 2, (8, 8)) * 255).to(torch.uint8) for _ in range(4)]
+
+    def new_game():
+        return torch.stack([frames[int(rng.integers(4))]] * frame_stack)
+
+    states = [new_game() for _ in range(num_streams)]
+    lengths = [0] * num_streams
+
+    # Streams interleave in random order, games end with done or are cut off
+    # (the stream simply starts a new game), 3x past max_size so the ring wraps.
+    for _ in range(3 * max_size):
+        stream = int(rng.integers(num_streams))
+        state = states[stream]
+        next_state = torch.cat([state[1:], frames[int(rng.integers(4))][None]])
+        done = rng.random() < 0.05
+        truncated = lengths[stream] >= 25
+
+        action = int(rng.integers(3))
+        reward = float(rng.integers(-1, 2))
+
+        idx = memory.store_transition(state, action, reward, next_state, done, stream=stream)
+        reference_slot[idx] = reference.store_transition(state, action, reward, next_state, done)
+
+        if done or truncated:
+            states[stream] = new_game()
+            lengths[stream] = 0
+        else:
+            states[stream] = next_state
+            lengths[stream] += 1
+
+    assert memory.mem_ctr > 2 * max_size
+
+    for _ in range(20):
+        idx = memory.sample_indices(32)
+        assert memory.is_valid(idx).all()
+
+        batch = memory.gather(idx)
+        expected = reference.gather(torch.tensor([reference_slot[int(i)] for i in idx]))
+
+        for name, value, expected_value in zip(("states", "actions", "rewards", "next_states", "dones"), batch, expected):
+            assert torch.equal(value, expected_value), name
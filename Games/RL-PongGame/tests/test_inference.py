@@ -0,0 +1,37 @@
+# The folded and compiled inference paths must match the eager Model on real game observations.
+import pytest
+import torch
+from training.inference import FoldedModel, InferenceModel
+from training.model import Model
+from benchmarks.inference import collect_stacks
+
+
+@pytest.fixture(scope="module")
+def models():
+    torch.manual_seed(0)
+    model = Model(action_dim=3, hidden_dim=756, observation_shape=(3, 84, 84), obs_stack=3).eval()
+
+    return model, FoldedModel(model).eval(), InferenceModel(model)
+
+
+@pytest.fixture(scope="module")
+def stacks():
+    return collect_stacks(128)
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+@pytest.mark.parametrize("path", ["folded", "compiled"])
+def test_matches_model(models, stacks, path, batch_size):
+    model, folded, compiled = models
+    fast = folded if path == "folded" else compiled
+
+    with torch.no_grad():
+        # Each batch size is checked on two batches, the compiled path caches a graph per shape.
+        for start in (0, batch_size):
+            x = stacks[start:start + batch_size]
+            reference = model(x)
+            q_values = fast(x)
+
+            assert q_values.shape == reference.shape
+            torch.testing.assert_close(q_values, reference, rtol=1e-4, atol=1e-4)
+            assert torch.equal(q_values.argmax(dim=-1), reference.argmax(dim=-1))
@@ -2,18 +2,29 @@ import torch
 from torch._C import device
 import torch.optim as optim
 import torch.nn.functional as F
-from training.buffer import ReplayBuffer
-from training.model import Model
+from training.buffer import ReplayBuffer, FrameReplayBuffer, PrioritizedReplayBuffer
+from training.model import build_model
+from training.inference import InferenceModel
+from training.quantization import load_quantized
+from training.distillation import load_student
 from backend.core.game import Pong
-from collections import deque
+from backend.core.vector import VectorPong
+from backend.core.async_vector import AsyncVectorPong
 import time
 import datetime
-import wandb
 import os
 import random
 import numpy as np
 import pygame
 from training.checkpoint import CheckpointPool
+from training.distributed import train_actor_learner
+from training.frame_stack import FrameStack
+from training.evaluation import EvaluationService
+from training.video import VideoRecorder
+from training.metrics import MetricsLogger, create_backends
+from backend.core.profiling import profiler
+from backend.core.observation import frame_spec, mirror_observation
+import copy
 
 class Agent():
 
@@ -28,7 +39,30 @@ class Agent():
                        epsilon=0,
                        min_epsilon=0,
                        epsilon_decay=0.995,
-                       checkpoint_pool=5
+                       checkpoint_pool=5,
+                       num_envs=1,
+                       vector_env="async",
+                       replay_buffer="standard",
+                       packed_frames=False,
+                       prioritized_replay=False,
+                       buffer_dir=None,
+                       prefetch_batches=0,
+                       num_actors=0,
+                       weight_sync_interval=400,
+                       publish_interval=100,
+                       eval_workers=0,
+                       eval_episodes=32,
+                       video_scale=0.5,
+                       video_frame_skip=1,
+                       metrics_backends=("wandb",),
+                       metrics_flush_every=100,
+                       profile=False,
+                       profile_window=None,
+                       profile_trace="cprofile",
+                       compiled_inference=True,
+                       quantized_model=None,
+                       student_model=None,
+                       obs_mode="pixels"
                        ):
         
         # # Use Apple Silicon MPS (Metal Performance Shaders) if available
@@ -43,17 +77,80 @@ class Agent():
             print("Using CPU backend")
 
         self.frame_stack = frame_stack
-        self.frames = deque(maxlen=self.frame_stack)
+
+        # obs_mode="state" plays on (frame_stack, STATE_DIM) stacks of ball and
+        # paddle coordinates with a StateModel MLP instead of 84x84 frames and the CNN.
+        self.obs_mode = obs_mode
+        self.frame_spec = frame_spec(obs_mode)
+        self.frames = FrameStack(1, self.frame_stack, **self.frame_spec)
+
+        # train() replaces this with a logger writing to metrics_backends
+        # (wandb, jsonl, csv, memory), until then metrics are dropped.
+        self.metrics = MetricsLogger([])
+        self.metrics_backends = metrics_backends
+        self.metrics_flush_every = metrics_flush_every
+
+        # Eval videos are streamed to videos/*.mp4 at this scale, keeping every video_frame_skip-th step.
+        self.video_scale = video_scale
+        self.video_frame_skip = video_frame_skip
+
+        self.model_kwargs = {"action_dim": 3,
+                             "hidden_dim": hidden_layer,
+                             "observation_shape": (frame_stack, *self.frame_spec["frame_shape"]),
+                             "obs_stack": frame_stack,
+                             "obs_mode": obs_mode}
+
+        # compiled_inference runs greedy actions on CPU through an InferenceModel
+        # (folded /255, channels_last, frozen graphs). Training keeps the eager
+        # model for its own actions since its weights change every step, and
+        # refreshes eval_policy from it at the start of every eval().
+        self.compiled_inference = compiled_inference and self.device == 'cpu' and obs_mode == "pixels"
 
         if eval:
-            self.model = Model(action_dim=3, hidden_dim=hidden_layer, observation_shape=(frame_stack, 84, 84), obs_stack=self.frame_stack).to(self.device)
-            self.model.load_the_model()
+            # A student written by distill_model.py brings its own architecture.
+            if student_model is not None:
+                self.model, self.model_kwargs = load_student(student_model, self.device)
+                if self.model_kwargs["obs_stack"] != frame_stack:
+                    raise ValueError(f"{student_model} takes {self.model_kwargs['obs_stack']} stacked frames, not {frame_stack}")
+                print(f"Loaded student from {student_model}")
+            else:
+                self.model = build_model(**self.model_kwargs).to(self.device)
+                self.model.load_the_model()
+                self.model.eval()
+            self.policy = InferenceModel(self.model) if self.compiled_inference else self.model
+
+            # An int8 model written by quantize_model.py takes over the greedy actions, on CPU.
+            if quantized_model is not None:
+                self.device = 'cpu'
+                self.policy, settings = load_quantized(quantized_model)
+                if settings["obs_stack"] != frame_stack:
+                    raise ValueError(f"{quantized_model} takes {settings['obs_stack']} stacked frames, not {frame_stack}")
+                print(f"Loaded {settings['mode']} int8 model from {quantized_model}")
+
+            # No checkpoint pool when serving, get_actions only runs the policy.
+            self.checkpoint_model = None
             self.epsilon = 0
             return
 
-        self.env = Pong(player1="ai", player2="bot", render_mode="rgb_array", bot_difficulty="easy")
-        self.eval_envs = [Pong(player1="ai", player2="bot", render_mode="rgb_array"),
-                          Pong(player1="bot", player2="ai", render_mode="rgb_array")]
+        if obs_mode == "state" and (num_actors > 0 or (num_envs > 1 and vector_env == "async")):
+            raise ValueError("obs_mode state runs with a single env or vector_env numpy, without actors")
+
+        self.env = Pong(player1="ai", player2="bot", render_mode="headless", bot_difficulty="easy", obs_mode=obs_mode)
+
+        # With num_envs > 1 training steps many games per iteration, either in
+        # worker processes ("async") or as one NumPy batch ("numpy").
+        self.envs = None
+        if num_envs > 1:
+            if vector_env == "async":
+                self.envs = AsyncVectorPong(num_envs, player1="ai", player2="bot",
+                                            render_mode="headless", bot_difficulty="easy")
+            elif vector_env == "numpy":
+                self.envs = VectorPong(num_envs, bot_difficulty="easy", obs_mode=obs_mode)
+            else:
+                raise ValueError(f"Unknown vector_env {vector_env}, expected async or numpy")
+
+        self.eval_envs = [Pong(player1="ai", player2="bot", render_mode="rgb_array", obs_mode=obs_mode),
+                          Pong(player1="bot", player2="ai", render_mode="rgb_array", obs_mode=obs_mode)]
 
         obs, info = self.env.reset()
 
@@ -61,15 +158,48 @@ class Agent():
 
         print(f"Creating agent with device {self.device}...")
 
-        self.memory = ReplayBuffer(max_size=max_buffer_size, input_shape=obs.shape, 
-                                   n_actions=self.env.action_space.n, input_device=self.device,
-                                   output_device=self.device) 
+        # "frame" stores each frame once and rebuilds the stacks at sample time (~6x less memory).
+        if replay_buffer == "standard":
+            buffer_class = ReplayBuffer
+        elif replay_buffer == "frame":
+            buffer_class = FrameReplayBuffer
+        else:
+            raise ValueError(f"Unknown replay_buffer {replay_buffer}, expected standard or frame")
+
+        # packed_frames keeps the binary frames at 1 bit per pixel (8x less memory).
+        # buffer_dir puts the buffer in memory-mapped files that a restarted run resumes from.
+        if obs_mode == "state":
+            # State stacks are a few floats, stored whole, the frame layouts only pay off for images.
+            self.memory = ReplayBuffer(max_size=max_buffer_size, input_shape=obs.shape,
+                                       n_actions=self.env.action_space.n, input_device=self.device,
+                                       output_device=self.device, storage_dir=buffer_dir,
+                                       dtype=self.frame_spec["dtype"])
+        else:
+            self.memory = buffer_class(max_size=max_buffer_size, input_shape=obs.shape, 
+                                       n_actions=self.env.action_space.n, input_device=self.device,
+                                       output_device=self.device, packed=packed_frames,
+                                       storage_dir=buffer_dir) 
+
+        self.prioritized_replay = prioritized_replay
+        if self.prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(self.memory)
 
-        self.model = Model(action_dim=3, hidden_dim=hidden_layer, observation_shape=obs.shape, obs_stack=self.frame_stack).to(self.device)
-        self.target_model = Model(action_dim=3, hidden_dim=hidden_layer, observation_shape=obs.shape, obs_stack=self.frame_stack).to(self.device)
+        self.prefetch_batches = prefetch_batches
+        self.batches = None
+
+        # num_actors > 0 switches train() to the actor/learner mode in training/distributed.py.
+        self.num_actors = num_actors
+        self.weight_sync_interval = weight_sync_interval
+        self.publish_interval = publish_interval
+
+        self.model = build_model(**self.model_kwargs).to(self.device)
+        self.target_model = build_model(**self.model_kwargs).to(self.device)
 
         self.target_model.load_state_dict(self.model.state_dict())
 
+        self.policy = self.model
+        self.eval_policy = InferenceModel(self.model) if self.compiled_inference else None
+
         self.checkpoint_pool = CheckpointPool(max_size=checkpoint_pool)
         self.checkpoint_pool.add(self.model, -100)
 
@@ -84,12 +214,41 @@ class Agent():
         self.epsilon_decay = epsilon_decay
         self.min_epsilon = min_epsilon
 
+        self.best_avg_score = -100
+
+        # eval_workers > 0 plays the periodic evals in EvaluationService worker
+        # processes, eval_episodes games each, while training carries on.
+        self.evaluator = None
+        if eval_workers > 0:
+            self.evaluator = EvaluationService(self.model_kwargs, num_workers=eval_workers,
+                                               num_episodes=eval_episodes, max_episode_steps=max_episode_steps)
+
+        # profile=True times the env, buffer and learner hot paths and prints a
+        # breakdown after every episode. profile_window=(start, end) also records
+        # a cProfile or torch profiler trace of episodes start..end-1 into profiles/.
+        self.profile_window = profile_window
+        self.profile_trace = profile_trace
+        if profile:
+            self.instrument()
+
 
     def eval(self, bot_difficulty="easy", record_video=False):
 
         for eval_env in self.eval_envs:
             eval_env.bot_difficulty = bot_difficulty
 
+        if self.eval_policy is not None:
+            self.eval_policy.refresh()
+            self.policy = self.eval_policy
+
+        try:
+            return self.play_eval_games(bot_difficulty, record_video)
+        finally:
+            self.policy = self.model
+
+
+    def play_eval_games(self, bot_difficulty, record_video):
+
         episode_reward = [0, 0]
 
         for player in range(2):
@@ -102,8 +261,12 @@ class Agent():
 
             episode_reward[player] = 0
 
-            frames = []
-            
+            recorder = None
+            if record_video:
+                recorder = VideoRecorder(f"videos/player_{player + 1}_vs_{bot_difficulty}_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.mp4",
+                                         (self.eval_envs[player].window_width, self.eval_envs[player].window_height),
+                                         fps=30, scale=self.video_scale, frame_skip=self.video_frame_skip)
+
             episode_steps = 0
 
             while not done and episode_steps < self.max_episode_steps:
@@ -117,23 +280,16 @@ class Agent():
                     action = self.get_action(obs, player=2, eval_mode=True)
                     next_obs, _, reward, done, truncated, info = self.eval_envs[player].step(player_2_action=action)
 
-                # Capture frame for video (RGB from pygame screen)
-                if record_video:
-                    screen_array = pygame.surfarray.array3d(self.eval_envs[player].screen)
-                    screen_array = np.transpose(screen_array, (1, 0, 2))  # Convert to (H, W, C)
-                    frames.append(screen_array)
+                if recorder is not None:
+                    recorder.add_frame(self.eval_envs[player].screen)
 
                 obs = self.process_observation(next_obs)
                 episode_reward[player] += reward
             
-            # Log video to wandb after episode completes
-            if record_video and len(frames) > 0:
-                video_array = np.array(frames)  # Shape: (T, H, W, C)
-                video_array = np.transpose(video_array, (0, 3, 1, 2))  # wandb expects (T, C, H, W)
-                wandb.log({
-                    f"eval_video/player_{player + 1}_vs_{bot_difficulty}": wandb.Video(video_array, fps=30, format="mp4")
-                })
-                frames = []  # Clear frames for next player
+            # Hand the finished file to the metrics backends after the episode completes
+            if recorder is not None:
+                video_path = recorder.close()
+                self.metrics.log_video(f"eval_video/player_{player + 1}_vs_{bot_difficulty}", video_path)
         
         return episode_reward[0], episode_reward[1]
 
@@ -144,24 +300,52 @@ class Agent():
         print("-" * 50)
 
 
+    def instrument(self):
+        hot_paths = [(Pong, "step", "env/step"),
+                     (Pong, "_step", "env/_step"),
+                     (Pong, "_get_obs", "env/_get_obs"),
+                     (VectorPong, "step", "env/vector_step"),
+                     (AsyncVectorPong, "step_wait", "env/async_step_wait"),
+                     (type(self), "process_observation", "agent/process_observation"),
+                     (type(self), "get_actions", "agent/get_actions"),
+                     (type(self), "get_action", "agent/get_action"),
+                     (type(self.memory), "store_transition", "buffer/store_transition"),
+                     (type(self), "sample_batch", "buffer/sample_batch"),
+                     (type(self), "learn", "learner/learn")]
+
+        for owner, attribute, name in hot_paths:
+            profiler.register(owner, attribute, name)
+
+        profiler.enable()
+
+
     def train(self, episodes, config, batch_size):
-        # Initialize wandb with config
-        wandb.init(
-            project="pong-rl",
-            name=f"dqn_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}",
-            config=config
-        )
+        self.metrics.close()
+        run_name = f"dqn_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        self.metrics = MetricsLogger(create_backends(self.metrics_backends, run_name, config),
+                                     flush_every=self.metrics_flush_every)
 
         if not os.path.exists('models'):
             os.makedirs('models')
 
+        if self.profile_window is not None and self.profile_window[0] == 0:
+            profiler.start_trace(self.profile_trace)
+
+        profiler.reset()
+
+        if self.num_actors > 0:
+            return train_actor_learner(self, episodes, batch_size, self.num_actors,
+                                       weight_sync_interval=self.weight_sync_interval,
+                                       publish_interval=self.publish_interval)
+
+        if self.envs is not None:
+            return self.train_vector(episodes, batch_size)
+
         total_steps = 0
         
         player_1_use_checkpoint = False
         player_2_use_checkpoint = True
 
-        best_avg_score = -100
-
         for episode in range(episodes):
 
             player_1_use_checkpoint, player_2_use_checkpoint = not player_1_use_checkpoint, not player_2_use_checkpoint
@@ -180,8 +364,9 @@ class Agent():
             
             while not done and episode_steps < self.max_episode_steps:
 
-                player_1_action = self.get_action(obs, player=1, checkpoint_model=player_1_use_checkpoint, episode=episode)
-                player_2_action = self.get_action(obs, player=2, checkpoint_model=player_2_use_checkpoint, episode=episode)
+                actions = self.get_actions(obs.unsqueeze(0), checkpoint_model=np.array([[player_1_use_checkpoint, player_2_use_checkpoint]]),
+                                           episode=episode)
+                player_1_action, player_2_action = int(actions[0, 0]), int(actions[0, 1])
 
                 player_1_reward = 0
                 player_2_reward = 0
@@ -191,11 +376,12 @@ class Agent():
                 next_obs = self.process_observation(next_obs)
 
                 if player_1_use_checkpoint:
-                    self.memory.store_transition(self.flip_obs(obs), player_2_action, player_2_reward, self.flip_obs(next_obs), done)
+                    self.memory.store_transition(self.flip_obs(obs), player_2_action, player_2_reward, self.flip_obs(next_obs), done, stream=0)
                 else:
-                    self.memory.store_transition(obs, player_1_action, player_1_reward, next_obs, done)
+                    self.memory.store_transition(obs, player_1_action, player_1_reward, next_obs, done, stream=0)
 
                 obs = next_obs
+                profiler.count("env_steps")
 
                 player_1_episode_reward += player_1_reward
                 player_2_episode_reward += player_2_reward
@@ -203,113 +389,379 @@ class Agent():
                 total_steps += 1
 
                 if self.memory.can_sample(batch_size):
+                    self.learn(batch_size, total_steps)
+
+            self.end_episode(episode, player_1_episode_reward, player_2_episode_reward, player_1_use_checkpoint)
+
+            episode_end_time = time.time()
+            episode_time = episode_end_time - episode_start_time
 
-                    observations, actions, rewards, next_observations, dones = self.memory.sample_buffer(batch_size)
+            print(f"Completed episode {episode} with Player 1 score {player_1_episode_reward}")
+            print(f"Completed episode {episode} with Player 2 score {player_2_episode_reward}")
+            print(f"Episode Time: {episode_time:1f} seconds")
+            print(f"Episode Steps: {episode_steps}")
+
+        self.finish_training()
+
+
+    def train_vector(self, episodes, batch_size):
+        # Same self-play loop as train(), but every env step advances all
+        # num_envs games. Each game runs its own episode, the learner takes one
+        # gradient step per game step so the replay ratio matches train().
+        num_envs = self.envs.num_envs
+
+        total_steps = 0
+        episode = 0
 
-                    actions = actions.unsqueeze(1).long()
-                    rewards = rewards.unsqueeze(1)
-                    dones = dones.unsqueeze(1).float()
+        player_1_use_checkpoint = np.arange(num_envs) % 2 == 0
+        self.checkpoint_model = self.checkpoint_pool.sample()
 
-                    q_values = self.model(observations)
-                    q_sa     = q_values.gather(1, actions)
+        player_1_episode_reward = np.zeros(num_envs)
+        player_2_episode_reward = np.zeros(num_envs)
+        episode_steps = np.zeros(num_envs, dtype=np.int64)
+        episode_start_time = np.full(num_envs, time.time())
 
-                    with torch.no_grad():
-                        next_actions = torch.argmax(
-                            self.model(next_observations), dim=1, keepdim=True
-                        )
+        frames = FrameStack(num_envs, self.frame_stack, **self.frame_spec)
 
-                        next_q = self.target_model(next_observations).gather(1, next_actions)
-                        targets = rewards + (1 - dones) * self.gamma * next_q
+        env_obs, info = self.envs.reset()
+        obs = frames.reset(env_obs)
 
-                    loss = F.mse_loss(q_sa, targets)
-                    wandb.log({"Stats/model_loss": loss.item(), "total_steps": total_steps})
+        while episode < episodes:
 
-                    self.optimizer.zero_grad()
-                    loss.backward()
-                    self.optimizer.step()
+            actions = self.get_actions(obs,
+                                       checkpoint_model=np.stack([player_1_use_checkpoint, ~player_1_use_checkpoint], axis=1),
+                                       episode=episode)
 
-                    if total_steps % self.target_update_interval == 0:
-                        self.target_model.load_state_dict(self.model.state_dict())
+            env_obs, player_1_reward, player_2_reward, done, truncated, info = self.envs.step(actions)
 
+            episode_steps += 1
+            player_1_episode_reward += player_1_reward
+            player_2_episode_reward += player_2_reward
 
-            if player_1_use_checkpoint:
-                latest_reward = player_2_episode_reward
-                checkpoint_reward = player_1_episode_reward
+            finished = done | truncated | (episode_steps >= self.max_episode_steps)
+
+            # Games that auto-reset end on their final frame, the reset frame starts their next stack below.
+            if "_final_observation" in info:
+                final = info["_final_observation"].reshape(-1, *[1] * (env_obs.ndim - 1))
+                next_obs = frames.push(np.where(final, info["final_observation"], env_obs))
             else:
-                latest_reward = player_1_episode_reward
-                checkpoint_reward = player_2_episode_reward
-
-            if(self.epsilon > self.min_epsilon):
-                self.epsilon *= self.epsilon_decay
-
-            wandb.log({
-                "Stats/Epsilon": self.epsilon,
-                "Training Score/Player 1 Training": player_1_episode_reward,
-                "Training Score/Player 2 Training": player_2_episode_reward,
-                "Training Score/Latest Policy": latest_reward,
-                "Training Score/Checkpoint Policy": checkpoint_reward,
-                "episode": episode
-            })
-
-            if episode > 0 and (episode % 20 == 0):
-                self.log_header("Eval run started...")
-                eval_env_list = ['easy', 'hard'] if episode < 400 else ['hard']
-
-                for difficulty in eval_env_list:
-                    # Record video every 100 episodes
-                    record_video = (episode % 100 == 0)
-                    player_1_score_v_bot, player_2_score_v_bot = self.eval(bot_difficulty=difficulty, record_video=record_video)
-                    wandb.log({
-                        f'Eval Score/Player 1 v. {difficulty} Bot': player_1_score_v_bot,
-                        f'Eval Score/Player 2 v. {difficulty} Bot': player_2_score_v_bot,
-                        "episode": episode
-                    })
-                    print(f"Player 1 v. {difficulty} Bot: {player_1_score_v_bot}")
-                    print(f"Player 2 v. {difficulty} Bot: {player_2_score_v_bot}")
-
-                print("Eval Run Finished. Saving the model...\n")
-                self.model.save_the_model()
-                print("Model Saved")
-
-                self.checkpoint_pool.report()
-
-                self.log_header("Eval run complete")
-
-            if episode > 0 and (episode % 100 == 0):
-                self.log_header("Checkpoint pool eval run started...")
-                player_v_bot_total = 0
-                eval_ep_count = 3
-
-                for i in range(eval_ep_count):
-                    player_1_score_v_bot, player_2_score_v_bot = self.eval(bot_difficulty="hard")
-                    player_v_bot_total += player_1_score_v_bot
-                    player_v_bot_total += player_2_score_v_bot
-
-                print(f"Player v bot total: {player_v_bot_total}")
-                player_v_bot_average = player_v_bot_total / (eval_ep_count * 2)
-
-                self.checkpoint_pool.add(self.model, player_v_bot_average)
-
-                if(player_v_bot_average >= best_avg_score):
-                    self.model.save_the_model(filename=f"models/model_best.pt")
-                    print(f"Saved new best model - Average score {player_v_bot_average} higher than {best_avg_score}")
-                    best_avg_score = player_v_bot_average
+                next_obs = frames.push(env_obs)
+
+            for i in range(num_envs):
+                if player_1_use_checkpoint[i]:
+                    self.memory.store_transition(self.flip_obs(obs[i]), actions[i, 1], player_2_reward[i], self.flip_obs(next_obs[i]), done[i], stream=i)
                 else:
-                    print(f"Failed to save new best model. {best_avg_score} higher than {player_v_bot_average}")
+                    self.memory.store_transition(obs[i], actions[i, 0], player_1_reward[i], next_obs[i], done[i], stream=i)
 
-                self.log_header("Checkpoint pool eval run finished")
+                total_steps += 1
+
+                if self.memory.can_sample(batch_size):
+                    self.learn(batch_size, total_steps)
+
+            obs = next_obs
+            profiler.count("env_steps", num_envs)
+
+            # Games cut off by max_episode_steps have not auto-reset inside the env.
+            cut_off = finished & ~(done | truncated)
+            if cut_off.any():
+                env_obs, _ = self.envs.reset(cut_off)
+
+            for i in np.flatnonzero(finished):
+                if episode >= episodes:
+                    break
+
+                self.end_episode(episode, player_1_episode_reward[i], player_2_episode_reward[i], player_1_use_checkpoint[i])
+
+                print(f"Completed episode {episode} (env {i}) with Player 1 score {player_1_episode_reward[i]}")
+                print(f"Completed episode {episode} (env {i}) with Player 2 score {player_2_episode_reward[i]}")
+                print(f"Episode Time: {time.time() - episode_start_time[i]:1f} seconds")
+                print(f"Episode Steps: {episode_steps[i]}")
+
+                episode += 1
+
+                player_1_use_checkpoint[i] = not player_1_use_checkpoint[i]
+                self.checkpoint_model = self.checkpoint_pool.sample()
+
+                player_1_episode_reward[i] = 0
+                player_2_episode_reward[i] = 0
+                episode_steps[i] = 0
+                episode_start_time[i] = time.time()
+
+            if finished.any():
+                obs = frames.reset(env_obs, finished)
+
+        self.envs.close()
+        self.finish_training()
+
+
+    def sample_batch(self, batch_size):
+        if self.prefetch_batches <= 0:
+            return self.memory.sample_buffer(batch_size)
+
+        # Batches are sampled on a background thread while the previous step runs.
+        if self.batches is None:
+            self.batches = self.memory.prefetch(batch_size, depth=self.prefetch_batches)
+
+        return next(self.batches)
+
+
+    def close_prefetcher(self):
+        if self.batches is not None:
+            self.batches.close()
+            self.batches = None
+
+
+    def learn(self, batch_size, total_steps):
+        if self.prioritized_replay:
+            observations, actions, rewards, next_observations, dones, indices, weights = self.sample_batch(batch_size)
+        else:
+            observations, actions, rewards, next_observations, dones = self.sample_batch(batch_size)
+
+        actions = actions.unsqueeze(1).long()
+        rewards = rewards.unsqueeze(1)
+        dones = dones.unsqueeze(1).float()
+
+        with profiler.timer("learner/forward"):
+            q_values = self.model(observations)
+            q_sa     = q_values.gather(1, actions)
+
+            with torch.no_grad():
+                next_actions = torch.argmax(
+                    self.model(next_observations), dim=1, keepdim=True
+                )
+
+                next_q = self.target_model(next_observations).gather(1, next_actions)
+                targets = rewards + (1 - dones) * self.gamma * next_q
+
+        if self.prioritized_replay:
+            # Importance-sampling weights correct for the non-uniform sampling.
+            td_errors = q_sa - targets
+            loss = (weights.unsqueeze(1) * td_errors.pow(2)).mean()
+            self.memory.update_priorities(indices, td_errors.squeeze(1))
+        else:
+            loss = F.mse_loss(q_sa, targets)
+
+        # Summed on the device and flushed in the background, no sync per step.
+        self.metrics.accumulate("Stats/model_loss", loss)
+        self.metrics.step({"total_steps": total_steps})
+
+        with profiler.timer("learner/backward"):
+            self.optimizer.zero_grad()
+            loss.backward()
+
+        with profiler.timer("learner/optimizer"):
+            self.optimizer.step()
+
+        if total_steps % self.target_update_interval == 0:
+            self.target_model.load_state_dict(self.model.state_dict())
+
+
+    def end_episode(self, episode, player_1_episode_reward, player_2_episode_reward, player_1_use_checkpoint):
+
+        if profiler.enabled:
+            report = profiler.report()
+            print(profiler.format_report(report))
+
+            metrics = {f"Profile/{name} ms": timer["total_ms"] for name, timer in report["timers"].items()}
+            metrics["Profile/steps_per_sec"] = report["steps_per_sec"]
+            metrics["episode"] = episode
+            self.metrics.log(metrics)
+
+            profiler.reset()
+
+        if self.profile_window is not None:
+            start, end = self.profile_window
+            if episode + 1 == start:
+                profiler.start_trace(self.profile_trace)
+            elif episode + 1 == end:
+                print(f"Profiler trace written to {profiler.stop_trace(f'profiles/episodes_{start}-{end}')}")
+
+        if player_1_use_checkpoint:
+            latest_reward = player_2_episode_reward
+            checkpoint_reward = player_1_episode_reward
+        else:
+            latest_reward = player_1_episode_reward
+            checkpoint_reward = player_2_episode_reward
+
+        if(self.epsilon > self.min_epsilon):
+            self.epsilon *= self.epsilon_decay
+
+        self.metrics.log({
+            "Stats/Epsilon": self.epsilon,
+            "Training Score/Player 1 Training": player_1_episode_reward,
+            "Training Score/Player 2 Training": player_2_episode_reward,
+            "Training Score/Latest Policy": latest_reward,
+            "Training Score/Checkpoint Policy": checkpoint_reward,
+            "episode": episode
+        })
+
+        if self.evaluator is not None:
+            self.log_eval_results(self.evaluator.poll())
+
+        if episode > 0 and (episode % 20 == 0):
+            self.log_header("Eval run started...")
+            eval_env_list = ['easy', 'hard'] if episode < 400 else ['hard']
+
+            for difficulty in eval_env_list:
+                # Record video every 100 episodes
+                record_video = (episode % 100 == 0)
+
+                if self.evaluator is not None:
+                    self.evaluator.submit(self.model, difficulty, tag=("eval", episode, None))
+                    if record_video:
+                        self.eval(bot_difficulty=difficulty, record_video=True)
+                    continue
+
+                player_1_score_v_bot, player_2_score_v_bot = self.eval(bot_difficulty=difficulty, record_video=record_video)
+                self.metrics.log({
+                    f'Eval Score/Player 1 v. {difficulty} Bot': player_1_score_v_bot,
+                    f'Eval Score/Player 2 v. {difficulty} Bot': player_2_score_v_bot,
+                    "episode": episode
+                })
+                print(f"Player 1 v. {difficulty} Bot: {player_1_score_v_bot}")
+                print(f"Player 2 v. {difficulty} Bot: {player_2_score_v_bot}")
+
+            print("Eval Run Finished. Saving the model...\n")
+            self.model.save_the_model()
+            self.memory.flush()
+            print("Model Saved")
+
+            self.checkpoint_pool.report()
+
+            self.log_header("Eval run complete")
+
+        if episode > 0 and (episode % 100 == 0):
+            if self.evaluator is not None:
+                # Scored in the background, the frozen copy joins the pool once the result is in.
+                self.evaluator.submit(self.model, "hard", tag=("checkpoint", episode, copy.deepcopy(self.model)))
+                return
+
+            self.log_header("Checkpoint pool eval run started...")
+            player_v_bot_total = 0
+            eval_ep_count = 3
+
+            for i in range(eval_ep_count):
+                player_1_score_v_bot, player_2_score_v_bot = self.eval(bot_difficulty="hard")
+                player_v_bot_total += player_1_score_v_bot
+                player_v_bot_total += player_2_score_v_bot
+
+            print(f"Player v bot total: {player_v_bot_total}")
+            player_v_bot_average = player_v_bot_total / (eval_ep_count * 2)
+
+            self.add_checkpoint(self.model, player_v_bot_average)
+
+            self.log_header("Checkpoint pool eval run finished")
+
+
+    def add_checkpoint(self, model, player_v_bot_average):
+        self.checkpoint_pool.add(model, player_v_bot_average)
+
+        if(player_v_bot_average >= self.best_avg_score):
+            model.save_the_model(filename="models/model_best_state.pt" if self.obs_mode == "state" else "models/model_best.pt")
+            print(f"Saved new best model - Average score {player_v_bot_average} higher than {self.best_avg_score}")
+            self.best_avg_score = player_v_bot_average
+        else:
+            print(f"Failed to save new best model. {self.best_avg_score} higher than {player_v_bot_average}")
+
+
+    def log_eval_results(self, results):
+        for result in results:
+            kind, episode, model = result["tag"]
+            difficulty = result["bot_difficulty"]
+
+            if kind == "checkpoint":
+                self.log_header(f"Checkpoint pool eval from episode {episode} finished")
+                stats = result["all"]
+                print(f"Player v bot average: {stats['mean_score']:.2f} ± {stats['mean_score_ci']:.2f} over {stats['episodes']} games")
+                self.add_checkpoint(model, stats["mean_score"])
+                continue
+
+            metrics = {"episode": episode}
+
+            for player in (1, 2):
+                stats = result[f"player_{player}"]
+                name = f"Player {player} v. {difficulty} Bot"
+
+                metrics[f"Eval Score/{name}"] = stats["mean_score"]
+                metrics[f"Eval Score CI/{name}"] = stats["mean_score_ci"]
+                metrics[f"Eval Win Rate/{name}"] = stats["win_rate"]
+                metrics[f"Eval Win Rate Low/{name}"] = stats["win_rate_low"]
+                metrics[f"Eval Win Rate High/{name}"] = stats["win_rate_high"]
+
+                print(f"{name} (episode {episode}): {stats['mean_score']:.2f} ± {stats['mean_score_ci']:.2f}, "
+                      f"win rate {stats['win_rate']:.2f} [{stats['win_rate_low']:.2f}, {stats['win_rate_high']:.2f}]")
+
+            self.metrics.log(metrics)
+
+
+    def finish_training(self):
+        if profiler.trace is not None:
+            print(f"Profiler trace written to {profiler.stop_trace('profiles/until_end')}")
+
+        self.close_prefetcher()
+
+        # Otherwise a buffer_dir only holds what was there at the last 20 episode checkpoint.
+        self.memory.flush()
+
+        self.finish_evals()
+        self.metrics.close()
+
+
+    def finish_evals(self):
+        # Waits for the evals still running so the last results get logged.
+        if self.evaluator is None:
+            return
+
+        self.log_eval_results(self.evaluator.poll(wait=True))
+        self.evaluator.close()
 
-            episode_end_time = time.time()
-            episode_time = episode_end_time - episode_start_time
 
-            print(f"Completed episode {episode} with Player 1 score {player_1_episode_reward}")
-            print(f"Completed episode {episode} with Player 2 score {player_2_episode_reward}")
-            print(f"Episode Time: {episode_time:1f} seconds")
-            print(f"Episode Steps: {episode_steps}")
-            
-                
     def flip_obs(self, obs):
-        return torch.flip(obs, dims=[2])
+        # Mirrors the width axis (or the x coordinates of state vectors), works
+        # for a single stack and for batches.
+        return mirror_observation(obs, self.obs_mode)
+
+
+    def get_actions(self, obs, checkpoint_model=None, episode=0, eval_mode=False):
+        # Actions for both players of N games at once. obs is (N, C, H, W) seen
+        # from player 1's side, checkpoint_model an (N, 2) bool array marking
+        # which player of each game uses the checkpoint network. Each network
+        # runs a single forward over all of its rows and the result comes back
+        # with one device sync as an (N, 2) int array.
+        num_games = obs.shape[0]
+
+        if checkpoint_model is None:
+            checkpoint_model = np.zeros((num_games, 2), dtype=bool)
+
+        # Rows 0..N-1 are player 1, rows N..2N-1 player 2 (mirrored).
+        use_checkpoint = np.concatenate([checkpoint_model[:, 0], checkpoint_model[:, 1]]).astype(bool)
+
+        explore = np.random.random(2 * num_games) < self.epsilon
+        explore &= np.where(use_checkpoint, episode < 1000, not eval_mode)
+
+        actions = np.random.randint(0, self.model_kwargs["action_dim"], size=2 * num_games)
+
+        obs = obs.to(self.device)
+        inputs = torch.cat([obs, self.flip_obs(obs)])
+
+        greedy = torch.zeros(2 * num_games, dtype=torch.int64, device=self.device)
+
+        with torch.no_grad():
+            for network, rows in ((self.policy, ~use_checkpoint & ~explore),
+                                  (self.checkpoint_model, use_checkpoint & ~explore)):
+                rows = np.flatnonzero(rows)
+
+                if len(rows) == 0:
+                    continue
+
+                rows = torch.from_numpy(rows).to(self.device)
+                q_values = network(inputs.index_select(0, rows))
+                greedy.index_copy_(0, rows, torch.argmax(q_values, dim=-1))
+
+        greedy = greedy.cpu().numpy()
+        actions = np.where(explore, actions, greedy)
+
+        return np.stack([actions[:num_games], actions[num_games:]], axis=1)
 
 
     def get_action(self, obs, player=2, checkpoint_model=False, episode=0, eval_mode=False):
@@ -327,30 +779,29 @@ class Agent():
             if(random.random() < self.epsilon) and (eval_mode == False):
                 action = self.env.action_space.sample()
             else:
-                q_values = self.model.forward(obs.unsqueeze(0).to(self.device))[0]
+                q_values = self.policy(obs.unsqueeze(0).to(self.device))[0]
                 action = torch.argmax(q_values, dim=-1).item()
 
         return action
 
 
-    def init_frame_stack(self, obs):
-        self.frames.clear()
-        for _ in range(self.frame_stack):
-            self.frames.append(obs)
-
-
-    def process_observation(self, obs, clear_stack=False):
-        obs = torch.tensor(obs, dtype=torch.float32)
+    def init_frame_stack(self, obs, frames=None):
+        if frames is None:
+            frames = self.frames
 
-        if(len(self.frames) < self.frame_stack):
-            self.init_frame_stack(obs)
+        return frames.reset(obs[None])[0]
 
-        if(clear_stack):
-            self.init_frame_stack(obs)
 
-        self.frames.append(obs)
+    def process_observation(self, obs, clear_stack=False, frames=None):
+        # Returns a uint8 (frame_stack, 84, 84) view into a preallocated ring,
+        # valid until the push after the next one. The actor/learner keeps one
+        # FrameStack per actor and passes it in. In state mode the view is a
+        # float32 (frame_stack, STATE_DIM) stack.
+        if frames is None:
+            frames = self.frames
 
-        obs_stacked = torch.cat(tuple(self.frames), dim=0)
+        if(clear_stack or not frames.started):
+            return self.init_frame_stack(obs, frames)
 
-        return obs_stacked
+        return frames.push(obs[None])[0]
 
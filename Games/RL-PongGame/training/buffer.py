@@ -1,64 +1,664 @@
 import torch
 import numpy as np
 import os
+import json
+import queue
+import threading
+from training.segment_tree import SumMinTree
+
+
+def resolve_input_device(input_device):
+    override = os.getenv("REPLAY_BUFFER_MEMORY")
+
+    if override in ["cpu", "cuda:0", "cuda:1", "mps"]:
+        print(f"Received replay buffer memory override to {override}")
+        return override
+
+    return input_device
+
+
+# Pong frames are binary (0 or 255), so packed storage keeps 1 bit per pixel.
+BIT_WEIGHTS = torch.tensor([128, 64, 32, 16, 8, 4, 2, 1], dtype=torch.uint8)
+
+
+def pack_frames(frames):
+    # (..., H, W) -> (..., H * W / 8) uint8
+    bits = (frames != 0).reshape(*frames.shape[:-2], -1, 8).to(torch.uint8)
+    return (bits * BIT_WEIGHTS.to(frames.device)).sum(dim=-1, dtype=torch.uint8)
+
+
+def unpack_frames(packed, frame_shape, dtype=torch.float32):
+    # (..., H * W / 8) -> (..., H, W) with values 0 or 255
+    bits = packed.unsqueeze(-1).bitwise_and(BIT_WEIGHTS.to(packed.device)) != 0
+    return bits.reshape(*packed.shape[:-1], *frame_shape).to(dtype) * 255
+
+
+def packed_shape(frame_shape):
+    pixels = int(np.prod(frame_shape))
+
+    if pixels % 8 != 0:
+        raise ValueError(f"Packed storage needs a pixel count divisible by 8, got {frame_shape}")
+
+    return (pixels // 8,)
+
+
+TORCH_TO_NUMPY = {
+    torch.uint8: np.uint8,
+    torch.int64: np.int64,
+    torch.float32: np.float32,
+    torch.bool: np.bool_,
+}
+
+
+class BufferStorage:
+
+    # Allocates the arrays of a replay buffer, either as plain device tensors or,
+    # with storage_dir set, as np.memmap files next to a small JSON header that
+    # holds mem_ctr. A later run pointed at the same directory resumes with the
+    # buffer warm, and buffers larger than RAM go through the page cache.
+
+    def __init__(self, storage_dir, layout, device):
+        self.storage_dir = storage_dir
+        self.layout = layout
+        self.memmaps = []
+        self.mem_ctr = 0
+
+        # Host-side buffers stage sampled batches in pinned memory for async copies to the GPU.
+        self.pin_memory = str(device) == 'cpu' and torch.cuda.is_available()
+
+        if self.storage_dir is None:
+            return
+
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+        header_path = os.path.join(self.storage_dir, "header.json")
+
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+
+            if header["layout"] != self.layout:
+                raise ValueError(f"Replay buffer in {self.storage_dir} was written with {header['layout']}, "
+                                 f"not {self.layout}. Use another directory or delete it.")
+
+            self.mem_ctr = header["mem_ctr"]
+            print(f"Resuming replay buffer from {self.storage_dir} with {self.mem_ctr} stored transitions")
+
+
+    def allocate(self, name, shape, dtype, device):
+        if self.storage_dir is None:
+            return torch.zeros(shape, dtype=dtype, device=device)
+
+        path = os.path.join(self.storage_dir, f"{name}.bin")
+        mode = "r+" if os.path.exists(path) else "w+"
+
+        array = np.memmap(path, dtype=TORCH_TO_NUMPY[dtype], mode=mode, shape=tuple(shape))
+        self.memmaps.append(array)
+
+        return torch.from_numpy(array)
+
+
+    def take(self, memory, idx):
+        if self.storage_dir is None and not self.pin_memory:
+            return memory[idx]
+
+        # One copy out of the page cache into (pinned) staging memory, sorted
+        # indices keep the reads close to sequential.
+        out = torch.empty((idx.numel(), *memory.shape[1:]), dtype=memory.dtype, pin_memory=self.pin_memory)
+        torch.index_select(memory, 0, idx.reshape(-1), out=out)
+
+        return out.reshape(*idx.shape, *memory.shape[1:])
+
+
+    def flush(self, mem_ctr):
+        if self.storage_dir is None:
+            return
+
+        for array in self.memmaps:
+            array.flush()
+
+        header_path = os.path.join(self.storage_dir, "header.json")
+
+        with open(header_path + ".tmp", "w") as f:
+            json.dump({"layout": self.layout, "mem_ctr": mem_ctr}, f)
+
+        os.replace(header_path + ".tmp", header_path)
+
 
 class ReplayBuffer:
 
     def __init__(self, max_size, input_shape, n_actions,
-                 input_device, output_device='cpu', frame_stack=3):
+                 input_device, output_device='cpu', frame_stack=3, packed=False, storage_dir=None,
+                 dtype=torch.uint8):
         
         self.mem_size = max_size
-        self.mem_ctr  = 0
-
-        override = os.getenv("REPLAY_BUFFER_MEMORY")
 
-        if override in ["cpu", "cuda:0", "cuda:1", "mps"]:
-            print(f"Received replay buffer memory override to {override}")
-            self.input_device = override
-        else:
-            self.input_device = input_device
+        # Memory-mapped storage always lives on the host.
+        self.input_device = resolve_input_device(input_device) if storage_dir is None else 'cpu'
 
         self.output_device = output_device
 
-        self.state_memory = torch.zeros((max_size, *input_shape), dtype=torch.uint8, device=self.input_device)
-        self.next_state_memory = torch.zeros((max_size, *input_shape), dtype=torch.uint8, device=self.input_device)
+        # uint8 holds 0/255 frames, dtype=torch.float32 the (frame_stack, STATE_DIM)
+        # state vectors of obs_mode="state", ~72 bytes per state instead of ~21 KB.
+        self.dtype = dtype
+        if packed and self.dtype != torch.uint8:
+            raise ValueError("Packed storage only holds binary uint8 frames")
+
+        layout = {"buffer": "ReplayBuffer", "max_size": max_size, "input_shape": list(input_shape), "packed": packed}
+        if self.dtype != torch.uint8:
+            layout["dtype"] = str(self.dtype).replace("torch.", "")
 
-        self.action_memory = torch.zeros(max_size, dtype=torch.int64, device=self.input_device)
-        self.reward_memory = torch.zeros(max_size, dtype=torch.float32, device=self.input_device)
-        self.terminal_memory = torch.zeros(max_size, dtype=torch.bool, device=self.input_device)
+        self.storage = BufferStorage(storage_dir, layout, self.input_device)
+        self.mem_ctr  = self.storage.mem_ctr
+
+        # Held while writing so a prefetch thread never samples a half-written slot.
+        self.lock = threading.RLock()
+
+        self.packed = packed
+        self.frame_shape = tuple(input_shape[1:])
+
+        if self.packed:
+            stored_shape = (input_shape[0], *packed_shape(self.frame_shape))
+        else:
+            stored_shape = tuple(input_shape)
+
+        self.state_memory = self.storage.allocate("state", (max_size, *stored_shape), self.dtype, self.input_device)
+        self.next_state_memory = self.storage.allocate("next_state", (max_size, *stored_shape), self.dtype, self.input_device)
+
+        self.action_memory = self.storage.allocate("action", (max_size,), torch.int64, self.input_device)
+        self.reward_memory = self.storage.allocate("reward", (max_size,), torch.float32, self.input_device)
+        self.terminal_memory = self.storage.allocate("terminal", (max_size,), torch.bool, self.input_device)
 
 
     def can_sample(self, batch_size: int) -> bool:
         return self.mem_ctr >= batch_size * 10
     
 
-    def store_transition(self, state, action, reward, next_state, done):
-        idx = self.mem_ctr % self.mem_size
+    def store_transition(self, state, action, reward, next_state, done, stream=None):
+        # stream only matters to FrameReplayBuffer, accepted so callers need not care.
+        with self.lock:
+            idx = self.mem_ctr % self.mem_size
+
+            state = torch.as_tensor(state, dtype=self.dtype, device=self.input_device)
+            next_state = torch.as_tensor(next_state, dtype=self.dtype, device=self.input_device)
+
+            if self.packed:
+                state = pack_frames(state)
+                next_state = pack_frames(next_state)
 
-        self.state_memory[idx] = torch.as_tensor(state, dtype=torch.uint8, device=self.input_device)
-        self.next_state_memory[idx] = torch.as_tensor(next_state, dtype=torch.uint8, device=self.input_device)
+            self.state_memory[idx] = state
+            self.next_state_memory[idx] = next_state
 
-        self.action_memory[idx] = int(action)
-        self.reward_memory[idx] = float(reward)
-        self.terminal_memory[idx] = bool(done)
+            self.action_memory[idx] = int(action)
+            self.reward_memory[idx] = float(reward)
+            self.terminal_memory[idx] = bool(done)
         
-        self.mem_ctr += 1
+            self.mem_ctr += 1
+
+            return idx
+
+
+    def sample_indices(self, batch_size):
+        max_mem = min(self.mem_ctr, self.mem_size)
+
+        batch = torch.randint(0, max_mem, (batch_size,), device=self.input_device, dtype=torch.int64)
+
+        if self.storage.storage_dir is not None:
+            batch = batch.sort().values
+
+        return batch
+
+
+    def is_valid(self, batch):
+        return torch.ones(len(batch), dtype=torch.bool, device=self.input_device)
+
+
+    def gather(self, batch):
+        take = self.storage.take
+
+        if self.packed:
+            # Move the packed bytes and unpack the whole batch on the output device.
+            states      = unpack_frames(take(self.state_memory, batch).to(self.output_device, non_blocking=True), self.frame_shape)
+            next_states = unpack_frames(take(self.next_state_memory, batch).to(self.output_device, non_blocking=True), self.frame_shape)
+        else:
+            states      = take(self.state_memory, batch).to(self.output_device, dtype=torch.float32, non_blocking=True)
+            next_states = take(self.next_state_memory, batch).to(self.output_device, dtype=torch.float32, non_blocking=True)
+
+        rewards     = take(self.reward_memory, batch).to(self.output_device, non_blocking=True)
+        dones       = take(self.terminal_memory, batch).to(self.output_device, non_blocking=True)
+        actions     = take(self.action_memory, batch).to(self.output_device, non_blocking=True)
+
+        return states, actions, rewards, next_states, dones
 
         
     def sample_buffer(self, batch_size):
+        return self.gather(self.sample_indices(batch_size))
+
+
+    def flush(self):
+        with self.lock:
+            self.storage.flush(self.mem_ctr)
+
+
+    def prefetch(self, batch_size, depth=2):
+        return BatchPrefetcher(self, batch_size, depth)
+
+
+class FrameReplayBuffer:
+
+    # Stores every 84x84 frame once instead of twice per stacked slot. Each
+    # transition slot holds the newest frame of next_state plus a pointer to the
+    # slot holding the frame before it, so state / next_state are rebuilt at
+    # sample time by walking frame_stack pointers back. Transitions of one game
+    # must be stored in order (next_state becomes the following state), several
+    # games can be interleaved as long as each is stored under its own stream
+    # id (env index, actor id).
+
+    def __init__(self, max_size, input_shape, n_actions,
+                 input_device, output_device='cpu', frame_stack=3, max_open_chains=64, packed=False,
+                 storage_dir=None):
+
+        self.mem_size = max_size
+
+        # Memory-mapped storage always lives on the host.
+        self.input_device = resolve_input_device(input_device) if storage_dir is None else 'cpu'
+        self.output_device = output_device
+
+        self.storage = BufferStorage(storage_dir, {"buffer": "FrameReplayBuffer", "max_size": max_size,
+                                                   "input_shape": list(input_shape), "packed": packed},
+                                     self.input_device)
+        self.mem_ctr  = self.storage.mem_ctr
+
+        # Held while writing so a prefetch thread never samples a half-written slot.
+        self.lock = threading.RLock()
+
+        self.frame_stack = input_shape[0]
+        self.max_open_chains = max_open_chains
+
+        self.packed = packed
+        self.frame_shape = tuple(input_shape[1:])
+
+        stored_shape = packed_shape(self.frame_shape) if self.packed else self.frame_shape
+
+        self.frame_memory = self.storage.allocate("frame", (max_size, *stored_shape), torch.uint8, self.input_device)
+
+        # Absolute index (mem_ctr at write time) of the previous frame in the same game.
+        self.prev_memory = self.storage.allocate("prev", (max_size,), torch.int64, self.input_device)
+        # Slots that only carry the first frames of a game are never sampled.
+        self.transition_memory = self.storage.allocate("transition", (max_size,), torch.bool, self.input_device)
+
+        self.action_memory = self.storage.allocate("action", (max_size,), torch.int64, self.input_device)
+        self.reward_memory = self.storage.allocate("reward", (max_size,), torch.float32, self.input_device)
+        self.terminal_memory = self.storage.allocate("terminal", (max_size,), torch.bool, self.input_device)
+
+        # stream -> (last next_state, slot of its newest frame) for games still in progress.
+        self.open_chains = {}
+
+
+    def can_sample(self, batch_size: int) -> bool:
+        return self.mem_ctr >= batch_size * 10
+
+
+    def _write_frame(self, frame, prev):
+        idx = self.mem_ctr % self.mem_size
+
+        self.frame_memory[idx] = pack_frames(frame) if self.packed else frame
+        self.prev_memory[idx] = self.mem_ctr if prev is None else prev
+        self.transition_memory[idx] = False
+
+        self.mem_ctr += 1
+
+        return self.mem_ctr - 1
+
+
+    def _find_chain(self, state, stream):
+        chain = self.open_chains.pop(stream, None)
+
+        # The stream's game continues unless it was cut off (max_episode_steps) and a new one started.
+        if chain is not None and torch.equal(chain[0], state):
+            return chain[1]
+
+        # First transition of a game, the frames of its state go in first.
+        prev = None
+        for frame in state:
+            prev = self._write_frame(frame, prev)
+
+        return prev
+
+
+    def store_transition(self, state, action, reward, next_state, done, stream=None):
+        with self.lock:
+            state = torch.as_tensor(state, device=self.input_device).to(torch.uint8)
+            next_state = torch.as_tensor(next_state, device=self.input_device).to(torch.uint8)
+
+            prev = self._find_chain(state, stream)
+            slot = self._write_frame(next_state[-1], prev)
+
+            idx = slot % self.mem_size
+
+            self.transition_memory[idx] = True
+            self.action_memory[idx] = int(action)
+            self.reward_memory[idx] = float(reward)
+            self.terminal_memory[idx] = bool(done)
+
+            if not done:
+                self.open_chains[stream] = (next_state.clone(), slot)
+
+                if len(self.open_chains) > self.max_open_chains:
+                    del self.open_chains[next(iter(self.open_chains))]
+
+            return idx
+
+
+    def _chains(self, slots):
+        # slots[:, 0] is the sampled transition, slots[:, j] the frame j steps before it.
+        chain = [slots]
+        for _ in range(self.frame_stack):
+            chain.append(self.prev_memory[chain[-1] % self.mem_size])
+
+        return torch.stack(chain, dim=1)
+
+
+    def absolute_slots(self, idx):
+        # Absolute write counter of the frames currently held in ring slots idx.
+        return self.mem_ctr - 1 - ((self.mem_ctr - 1 - idx) % self.mem_size)
+
+
+    def is_valid(self, idx):
+        # Frame-only slots and transitions whose earlier frames were already
+        # overwritten cannot be sampled.
+        oldest = max(0, self.mem_ctr - self.mem_size)
+        chains = self._chains(self.absolute_slots(idx))
+
+        return self.transition_memory[idx] & (chains >= oldest).all(dim=1)
+
+
+    def sample_indices(self, batch_size):
         max_mem = min(self.mem_ctr, self.mem_size)
-        
-        batch   = torch.randint(0, max_mem, (batch_size,), device=self.input_device, dtype=torch.int64)
 
-        states      = self.state_memory[batch].to(self.output_device, dtype=torch.float32)
-        next_states = self.next_state_memory[batch].to(self.output_device, dtype=torch.float32)
-        rewards     = self.reward_memory[batch].to(self.output_device)
-        dones       = self.terminal_memory[batch].to(self.output_device)
-        actions     = self.action_memory[batch].to(self.output_device)
+        idx = torch.empty(batch_size, dtype=torch.int64, device=self.input_device)
+        missing = torch.ones(batch_size, dtype=torch.bool, device=self.input_device)
+
+        # Rejection sampling, invalid slots are drawn again.
+        while missing.any():
+            count = int(missing.sum())
+            idx[missing] = torch.randint(0, max_mem, (count,), device=self.input_device, dtype=torch.int64)
+            missing = ~self.is_valid(idx)
+
+        if self.storage.storage_dir is not None:
+            idx = idx.sort().values
+
+        return idx
+
+
+    def gather(self, idx):
+        chains = self._chains(self.absolute_slots(idx))
+
+        take = self.storage.take
+
+        frames = take(self.frame_memory, chains % self.mem_size)
+        frames = torch.flip(frames, dims=[1])  # oldest frame first
+
+        if self.packed:
+            frames = unpack_frames(frames.to(self.output_device, non_blocking=True), self.frame_shape)
+        else:
+            frames = frames.to(self.output_device, dtype=torch.float32, non_blocking=True)
+
+        states      = frames[:, :-1]
+        next_states = frames[:, 1:]
+        rewards     = take(self.reward_memory, idx).to(self.output_device, non_blocking=True)
+        dones       = take(self.terminal_memory, idx).to(self.output_device, non_blocking=True)
+        actions     = take(self.action_memory, idx).to(self.output_device, non_blocking=True)
 
         return states, actions, rewards, next_states, dones
 
 
+    def sample_buffer(self, batch_size):
+        return self.gather(self.sample_indices(batch_size))
+
+
+    def flush(self):
+        with self.lock:
+            self.storage.flush(self.mem_ctr)
+
+
+    def prefetch(self, batch_size, depth=2):
+        return BatchPrefetcher(self, batch_size, depth)
+
+
+class PrioritizedReplayBuffer:
+
+    # Proportional prioritized replay on top of a ReplayBuffer or
+    # FrameReplayBuffer. Priorities live in a sum/min segment tree indexed by
+    # the wrapped buffer's ring slots, new transitions get the current max
+    # priority and learn() feeds back TD errors through update_priorities.
+
+    def __init__(self, buffer, alpha=0.6, beta=0.4, beta_annealing_steps=1000000, epsilon=1e-6):
+        self.buffer = buffer
+
+        self.alpha = alpha
+        self.beta_start = beta
+        self.beta = beta
+        self.beta_annealing_steps = beta_annealing_steps
+        self.epsilon = epsilon
+
+        # Shares the wrapped buffer's lock, the tree and the slots change together.
+        self.lock = buffer.lock
+
+        self.tree = SumMinTree(buffer.mem_size)
+        self.max_priority = 1.0
+        self.sample_count = 0
+
+        # Priorities are not persisted, a resumed buffer starts out uniform.
+        stored = min(buffer.mem_ctr, buffer.mem_size)
+        if stored > 0:
+            valid = buffer.is_valid(torch.arange(stored, device=buffer.input_device)).cpu().numpy()
+            self.tree.update(np.arange(stored), valid.astype(np.float64))
+
+
+    @property
+    def mem_ctr(self):
+        return self.buffer.mem_ctr
+
+
+    @property
+    def mem_size(self):
+        return self.buffer.mem_size
+
+
+    @property
+    def output_device(self):
+        return self.buffer.output_device
+
+
+    def can_sample(self, batch_size: int) -> bool:
+        return self.buffer.can_sample(batch_size)
+
+
+    def flush(self):
+        self.buffer.flush()
+
+
+    def prefetch(self, batch_size, depth=2):
+        return BatchPrefetcher(self, batch_size, depth)
+
+
+    def store_transition(self, state, action, reward, next_state, done, stream=None):
+        with self.lock:
+            start = self.buffer.mem_ctr
+
+            idx = self.buffer.store_transition(state, action, reward, next_state, done, stream)
+
+            # Every slot written by this call (frame-only slots included) drops its
+            # old priority, only the transition itself becomes sampleable.
+            written = np.arange(start, self.buffer.mem_ctr) % self.buffer.mem_size
+            self.tree.update(written, np.zeros(len(written)))
+            self.tree.update([idx], [self.max_priority ** self.alpha])
+
+            return idx
+
+
+    def sample_indices(self, batch_size):
+        # Stratified proportional sampling, one draw per equal slice of the mass.
+        total = self.tree.total()
+        segment = total / batch_size
+
+        mass = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        idx = self.tree.find_prefixsum(mass)
+
+        # Rejection sampling like FrameReplayBuffer, invalid slots are drawn again.
+        while True:
+            valid = self.tree.get(idx) > 0
+            valid &= self.buffer.is_valid(torch.as_tensor(idx, device=self.buffer.input_device)).cpu().numpy()
+
+            if valid.all():
+                return idx
+
+            # Transitions whose frames were overwritten lose their priority for good.
+            self.tree.update(idx[~valid], np.zeros((~valid).sum()))
+
+            total = self.tree.total()
+            if total <= 0:
+                raise RuntimeError("No valid transitions left to sample")
+
+            idx[~valid] = self.tree.find_prefixsum(np.random.random((~valid).sum()) * total)
+
+
+    def sample_buffer(self, batch_size):
+        idx = self.sample_indices(batch_size)
+
+        self.sample_count += 1
+        fraction = min(1.0, self.sample_count / self.beta_annealing_steps)
+        self.beta = self.beta_start + fraction * (1.0 - self.beta_start)
+
+        stored = min(self.buffer.mem_ctr, self.buffer.mem_size)
+        total = self.tree.total()
+
+        probabilities = self.tree.get(idx) / total
+        max_weight = (stored * self.tree.min() / total) ** (-self.beta)
+        weights = (stored * probabilities) ** (-self.beta) / max_weight
+
+        states, actions, rewards, next_states, dones = self.buffer.gather(torch.as_tensor(idx, device=self.buffer.input_device))
+
+        weights = torch.as_tensor(weights, dtype=torch.float32, device=self.buffer.output_device)
+
+        return states, actions, rewards, next_states, dones, idx, weights
+
+
+    def update_priorities(self, idx, td_errors):
+        if torch.is_tensor(td_errors):
+            td_errors = td_errors.detach().abs().cpu().numpy()
+
+        priorities = np.abs(td_errors) + self.epsilon
+
+        with self.lock:
+            self.tree.update(idx, priorities ** self.alpha)
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+
+
+class BatchPrefetcher:
+
+    # Iterator that keeps up to `depth` sampled batches ready on a background
+    # thread while the learner runs its gradient step. On CUDA the host to
+    # device copies run on a side stream and next() makes the current stream
+    # wait for them. close() stops the thread.
+
+    def __init__(self, buffer, batch_size, depth=2):
+        self.buffer = buffer
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(maxsize=depth)
+        self.stop_event = threading.Event()
+
+        output_device = torch.device(buffer.output_device)
+        self.stream = torch.cuda.Stream(device=output_device) if output_device.type == "cuda" else None
+
+        self.thread = threading.Thread(target=self._run, name="replay-prefetch", daemon=True)
+        self.thread.start()
+
+
+    def _run(self):
+        try:
+            while not self.stop_event.is_set():
+                with self.buffer.lock:
+                    if self.stream is not None:
+                        with torch.cuda.stream(self.stream):
+                            batch = self.buffer.sample_buffer(self.batch_size)
+                            ready = torch.cuda.Event()
+                            ready.record(self.stream)
+                    else:
+                        batch = self.buffer.sample_buffer(self.batch_size)
+                        ready = None
+
+                self._put((batch, ready))
+
+        except Exception as e:
+            self._put((e, None))
+
+
+    def _put(self, item):
+        # Gives up once close() was called, the consumer may never take from a full queue again.
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        if self.stop_event.is_set():
+            raise StopIteration
+
+        batch, ready = self.queue.get()
+
+        if isinstance(batch, Exception):
+            raise batch
+
+        if ready is not None:
+            current = torch.cuda.current_stream()
+            current.wait_event(ready)
+
+            # The batch was allocated on the side stream, without this the caching allocator could
+            # hand its memory to the next prefetched batch while the learner still reads it.
+            for tensor in batch:
+                if isinstance(tensor, torch.Tensor) and tensor.is_cuda:
+                    tensor.record_stream(current)
+
+        return batch
+
+
+    def close(self):
+        self.stop_event.set()
+
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+        self.thread.join(timeout=5)
+
+
+def load_buffer(storage_dir, device='cpu'):
+    # Reopens a memory-mapped buffer written with buffer_dir, e.g. for offline tools.
+    header_path = os.path.join(storage_dir, "header.json")
+
+    if not os.path.exists(header_path):
+        raise FileNotFoundError(f"No replay buffer header at {header_path}")
 
+    with open(header_path) as f:
+        layout = json.load(f)["layout"]
 
+    if layout["buffer"] == "ReplayBuffer":
+        return ReplayBuffer(max_size=layout["max_size"], input_shape=tuple(layout["input_shape"]), n_actions=3,
+                            input_device=device, output_device=device, packed=layout["packed"],
+                            storage_dir=storage_dir, dtype=getattr(torch, layout.get("dtype", "uint8")))
 
+    return FrameReplayBuffer(max_size=layout["max_size"], input_shape=tuple(layout["input_shape"]), n_actions=3,
+                             input_device=device, output_device=device, packed=layout["packed"],
+                             storage_dir=storage_dir)
@@ -0,0 +1,193 @@
+import json
+import os
+import torch
+import torch.nn.functional as F
+from training.model import Model
+from training.buffer import pack_frames, unpack_frames
+from training.quantization import record_observations, buffer_observations
+
+
+# Policy distillation of a trained Model (the teacher) into smaller Models
+# (students) for browser and CPU play. Students fit the teacher's Q-values
+# on observations from the teacher's games or a replay buffer, optionally
+# followed by rounds on observations from the student's own games, where
+# its mistakes take it. A student is saved as its state_dict plus a .json
+# with its model kwargs, load it with load_student().
+
+
+# Architectures tried by distill_model.py, kwargs over the teacher's Model kwargs.
+STUDENTS = {
+    "medium": {"channels": (32, 64, 64), "hidden_dim": 256},
+    "small": {"channels": (16, 32, 32), "hidden_dim": 128},
+    "half_res": {"channels": (32, 64, 64), "hidden_dim": 256, "downsample": 2},
+    "tiny": {"channels": (16, 32, 32), "hidden_dim": 64, "downsample": 2},
+}
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+class DistillationData:
+
+    # Observations kept bit-packed (the frames are binary, 8x less memory)
+    # with the teacher's Q-values for each, computed once as they are added.
+
+    def __init__(self, teacher, obs_shape, batch_size=256):
+        self.teacher = teacher
+        self.obs_shape = obs_shape
+        self.batch_size = batch_size
+
+        self.packed = []
+        self.q_values = []
+
+
+    def __len__(self):
+        return sum(len(q) for q in self.q_values)
+
+
+    def add(self, observations):
+        # observations is a (N, obs_stack, 84, 84) uint8 tensor.
+        with torch.no_grad():
+            for start in range(0, len(observations), self.batch_size):
+                obs = observations[start:start + self.batch_size]
+                self.packed.append(pack_frames(obs))
+                self.q_values.append(self.teacher(obs).float())
+
+
+    def split(self, fraction, seed=0):
+        # Indices of a (train, validation) split.
+        order = torch.randperm(len(self), generator=torch.Generator().manual_seed(seed))
+        num_val = int(len(self) * fraction)
+
+        return order[num_val:], order[:num_val]
+
+
+    def compact(self):
+        # One tensor each, so batch() does not concatenate on every call.
+        if len(self.packed) > 1:
+            self.packed = [torch.cat(self.packed)]
+            self.q_values = [torch.cat(self.q_values)]
+
+
+    def batch(self, idx):
+        # Unpacked float observations (0 or 255) and the teacher's Q-values.
+        self.compact()
+        return unpack_frames(self.packed[0][idx], self.obs_shape[1:]), self.q_values[0][idx]
+
+
+def distillation_loss(student_q, teacher_q, temperature=0.1, q_weight=1.0):
+    # KL between the teacher's and student's action distributions at the given
+    # temperature, which is what decides the greedy action, plus an MSE on the
+    # Q-values themselves so the student can be fine-tuned with DQN afterwards.
+    kl = F.kl_div(F.log_softmax(student_q / temperature, dim=-1),
+                  F.softmax(teacher_q / temperature, dim=-1), reduction="batchmean")
+
+    return kl + q_weight * F.mse_loss(student_q, teacher_q)
+
+
+def evaluate_agreement(student, data, idx, batch_size=1024):
+    agree = 0
+
+    with torch.no_grad():
+        for start in range(0, len(idx), batch_size):
+            obs, teacher_q = data.batch(idx[start:start + batch_size])
+            agree += int((student(obs).argmax(dim=-1) == teacher_q.argmax(dim=-1)).sum())
+
+    return agree / max(len(idx), 1)
+
+
+def train_student(student, data, steps, batch_size=256, learning_rate=0.001, temperature=0.1, q_weight=1.0,
+                  val_fraction=0.1, log_interval=1000, seed=0):
+    # Returns the agreement with the teacher's greedy action on held out observations.
+    train_idx, val_idx = data.split(val_fraction, seed=seed)
+
+    optimizer = torch.optim.Adam(student.parameters(), lr=learning_rate)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, steps)
+    generator = torch.Generator().manual_seed(seed)
+
+    student.train()
+    for step in range(1, steps + 1):
+        idx = train_idx[torch.randint(len(train_idx), (batch_size,), generator=generator)]
+        obs, teacher_q = data.batch(idx)
+
+        loss = distillation_loss(student(obs), teacher_q, temperature, q_weight)
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        scheduler.step()
+
+        if(step % log_interval == 0):
+            print(f"  step {step}/{steps}  loss {loss.item():.4f}")
+
+    student.eval()
+
+    return evaluate_agreement(student, data, val_idx)
+
+
+def collect_observations(teacher, obs_stack, num_obs, source="rollouts", buffer=None, seed=0):
+    # "rollouts" plays the teacher against the hard bot, "buffer" samples a ReplayBuffer.
+    if source == "buffer":
+        if buffer is None:
+            raise ValueError("Distilling from a replay buffer needs a buffer")
+        return buffer_observations(buffer, num_obs)
+
+    if source == "rollouts":
+        return record_observations(teacher, obs_stack, num_obs, seed=seed)
+
+    raise ValueError(f"Unknown distillation source {source}, expected rollouts or buffer")
+
+
+def distill(teacher, teacher_kwargs, student_config, data, steps, dagger_rounds=0, dagger_obs=0,
+            seed=0, **train_kwargs):
+    # Trains a student on data, then for each dagger round adds observations
+    # from the student's own games (labelled by the teacher) and trains again
+    # for half the steps. data grows in place, so students distilled after
+    # this one also see those observations.
+    torch.manual_seed(seed)
+
+    student_kwargs = {**teacher_kwargs, **student_config}
+    student = Model(**student_kwargs)
+
+    agreement = train_student(student, data, steps, seed=seed, **train_kwargs)
+
+    for dagger_round in range(dagger_rounds):
+        print(f"  dagger round {dagger_round + 1}: {agreement:.1%} agreement, recording {dagger_obs} observations")
+        data.add(record_observations(student, teacher_kwargs["obs_stack"], dagger_obs, seed=seed + 100 + dagger_round))
+        agreement = train_student(student, data, steps // 2, seed=seed + dagger_round + 1, **train_kwargs)
+
+    return student, student_kwargs, agreement
+
+
+def save_student(student, student_kwargs, path):
+    torch.save(student.state_dict(), path)
+
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(student_kwargs, f, indent=2)
+
+
+def load_student(path, device='cpu'):
+    # The Model and its kwargs, read from the .json next to the weights.
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        student_kwargs = json.load(f)
+
+    student_kwargs["observation_shape"] = tuple(student_kwargs["observation_shape"])
+    student_kwargs["channels"] = tuple(student_kwargs["channels"])
+
+    student = Model(**student_kwargs)
+    student.load_state_dict(torch.load(path, map_location=device))
+    student.eval()
+
+    return student.to(device), student_kwargs
+
+
+def pareto_front(rows, keys=(("params", min), ("latency_us", min), ("win_rate", max))):
+    # Names of the rows no other row matches or beats on every key and strictly beats on one.
+    def dominates(a, b):
+        better_or_equal = all((a[k] <= b[k]) if best is min else (a[k] >= b[k]) for k, best in keys)
+        strictly = any((a[k] < b[k]) if best is min else (a[k] > b[k]) for k, best in keys)
+        return better_or_equal and strictly
+
+    return [name for name, row in rows.items()
+            if not any(dominates(other, row) for other_name, other in rows.items() if other_name != name)]
@@ -0,0 +1,310 @@
+import queue
+import random
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from training.model import build_model
+from training.inference import InferenceModel
+from training.frame_stack import FrameStack
+from backend.core.profiling import profiler
+
+
+def run_actor(actor_id, model_kwargs, shared_model, weights_lock, weights_version, shared_pool, pool_count,
+              pool_version, transitions, stop_event, shared_epsilon, max_episode_steps, sync_interval, chunk_size, seed):
+    # Imported in the worker so the learner never builds a Pong for it.
+    from backend.core.game import Pong
+
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    env = Pong(player1="ai", player2="ai", render_mode="headless")
+    env.reset(seed=seed)
+
+    model = build_model(**model_kwargs)
+    model.eval()
+    policy = InferenceModel(model)
+    local_version = -1
+
+    # Local copies of the learner's checkpoint pool, one side of every game
+    # plays a checkpoint like in Agent.train.
+    opponents = [build_model(**model_kwargs) for _ in shared_pool]
+    opponent_policies = [InferenceModel(opponent.eval()) for opponent in opponents]
+    local_pool_version = -1
+    local_pool_count = 0
+
+    frames = FrameStack(1, model_kwargs["obs_stack"])
+
+    def act(obs, player_1_use_checkpoint, opponent):
+        # Player 2 sees the mirrored stack.
+        inputs = [obs, torch.flip(obs, dims=[-1])]
+        networks = [opponent, policy] if player_1_use_checkpoint else [policy, opponent]
+
+        with torch.no_grad():
+            greedy = [int(torch.argmax(network(x.unsqueeze(0)), dim=-1)) for network, x in zip(networks, inputs)]
+
+        return [random.randint(0, 2) if random.random() < epsilon else action for action in greedy]
+
+    chunk = []
+    steps = 0
+    player_1_use_checkpoint = (actor_id % 2 == 0)
+
+    try:
+        while not stop_event.is_set():
+            if pool_version.value != local_pool_version:
+                with weights_lock:
+                    local_pool_count = pool_count.value
+                    for opponent, shared in zip(opponents[:local_pool_count], shared_pool):
+                        opponent.load_state_dict(shared.state_dict())
+                    local_pool_version = pool_version.value
+
+                for opponent_policy in opponent_policies[:local_pool_count]:
+                    opponent_policy.refresh()
+
+            # The learner's decayed epsilon, updated after every episode like in Agent.train.
+            epsilon = shared_epsilon.value
+
+            player_1_use_checkpoint = not player_1_use_checkpoint
+            opponent = random.choice(opponent_policies[:local_pool_count])
+
+            obs, info = env.reset()
+            frame = obs.numpy().astype(np.uint8)
+            state = frames.reset(frame)[0]
+            chunk.append(("reset", frame, player_1_use_checkpoint))
+
+            done = False
+            episode_steps = 0
+            player_1_episode_reward = 0
+            player_2_episode_reward = 0
+
+            while not done and episode_steps < max_episode_steps and not stop_event.is_set():
+
+                if steps % sync_interval == 0 and weights_version.value != local_version:
+                    with weights_lock:
+                        model.load_state_dict(shared_model.state_dict())
+                        local_version = weights_version.value
+
+                    policy.refresh()
+
+                player_1_action, player_2_action = act(state, player_1_use_checkpoint, opponent)
+
+                next_obs, player_1_reward, player_2_reward, done, truncated, info = env.step(player_1_action=player_1_action,
+                                                                                             player_2_action=player_2_action)
+
+                frame = next_obs.numpy().astype(np.uint8)
+                state = frames.push(frame)[0]
+
+                chunk.append(("step", frame, player_1_action, player_2_action, player_1_reward, player_2_reward, done))
+
+                player_1_episode_reward += player_1_reward
+                player_2_episode_reward += player_2_reward
+                episode_steps += 1
+                steps += 1
+
+                if len(chunk) >= chunk_size:
+                    transitions.put((actor_id, chunk))
+                    chunk = []
+
+            chunk.append(("episode", player_1_episode_reward, player_2_episode_reward, episode_steps))
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transitions.cancel_join_thread()
+
+
+class ThroughputCounter:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+
+    def add(self, n=1):
+        self.count += n
+
+    def rate(self):
+        # Events per second since the last call, then starts a new window.
+        now = time.perf_counter()
+        rate = self.count / max(now - self.start, 1e-9)
+        self.start = now
+        self.count = 0
+        return rate
+
+
+def train_actor_learner(agent, episodes, batch_size, num_actors, weight_sync_interval=400,
+                        publish_interval=100, chunk_size=50, queue_size=256, log_interval=10, drain_chunks=4):
+    # Actors play self-play Pong in their own processes with a copy of the
+    # model and ship frames plus actions in chunks. The calling process is the
+    # learner: it rebuilds the frame stacks, fills the replay buffer, runs
+    # gradient steps without waiting on the envs and publishes its weights to
+    # the actors every publish_interval updates. As in Agent.train one side
+    # of each game plays a model sampled from the checkpoint pool, the pool is
+    # mirrored to the actors whenever it changes. Actors explore with the
+    # agent's epsilon, decayed per finished episode as in Agent.train. At most
+    # drain_chunks chunks are stored between gradient steps, the bounded queue
+    # then holds the actors back when they produce faster than the learner.
+    ctx = mp.get_context("spawn")
+
+    model_kwargs = agent.model_kwargs
+
+    shared_model = build_model(**model_kwargs)
+    shared_model.load_state_dict({k: v.cpu() for k, v in agent.model.state_dict().items()})
+    shared_model.share_memory()
+
+    shared_pool = [build_model(**model_kwargs).share_memory() for _ in range(agent.checkpoint_pool.max_size)]
+    pool_count = ctx.Value("i", 0)
+    pool_version = ctx.Value("i", 0)
+
+    weights_lock = ctx.Lock()
+    weights_version = ctx.Value("i", 0)
+    transitions = ctx.Queue(maxsize=queue_size)
+    stop_event = ctx.Event()
+    shared_epsilon = ctx.Value("d", agent.epsilon)
+
+    published_pool = []
+
+    def publish_pool():
+        # Copies the checkpoint pool into the shared slots if it changed since the last call.
+        nonlocal published_pool
+
+        models = [model for _, model in agent.checkpoint_pool.pool]
+        if [id(model) for model in models] == published_pool:
+            return
+
+        with weights_lock:
+            for shared, model in zip(shared_pool, models):
+                shared.load_state_dict({k: v.cpu() for k, v in model.state_dict().items()})
+            pool_count.value = len(models)
+            pool_version.value += 1
+
+        published_pool = [id(model) for model in models]
+
+    publish_pool()
+
+    actors = []
+    for actor_id in range(num_actors):
+        actor = ctx.Process(target=run_actor,
+                            args=(actor_id, model_kwargs, shared_model, weights_lock, weights_version, shared_pool,
+                                  pool_count, pool_version, transitions, stop_event, shared_epsilon,
+                                  agent.max_episode_steps, weight_sync_interval, chunk_size, random.randrange(2 ** 31)),
+                            daemon=True)
+        actor.start()
+        actors.append(actor)
+
+    actor_frames = [FrameStack(1, agent.frame_stack) for _ in range(num_actors)]
+    actor_obs = [None] * num_actors
+    actor_use_checkpoint = [False] * num_actors
+
+    env_steps = ThroughputCounter()
+    updates_rate = ThroughputCounter()
+    last_log = time.perf_counter()
+
+    episode = 0
+    total_steps = 0
+    updates = 0
+
+    def store(actor_id, records):
+        nonlocal episode, total_steps
+
+        frames = actor_frames[actor_id]
+
+        for record in records:
+            if record[0] == "reset":
+                actor_obs[actor_id] = agent.process_observation(record[1], clear_stack=True, frames=frames)
+                actor_use_checkpoint[actor_id] = record[2]
+
+            elif record[0] == "step":
+                _, frame, player_1_action, player_2_action, player_1_reward, player_2_reward, done = record
+
+                obs = actor_obs[actor_id]
+                next_obs = agent.process_observation(frame, frames=frames)
+
+                # Only the side that played the latest policy is stored, like Agent.train.
+                if actor_use_checkpoint[actor_id]:
+                    agent.memory.store_transition(agent.flip_obs(obs), player_2_action, player_2_reward, agent.flip_obs(next_obs), done,
+                                                  stream=actor_id)
+                else:
+                    agent.memory.store_transition(obs, player_1_action, player_1_reward, next_obs, done, stream=actor_id)
+
+                actor_obs[actor_id] = next_obs
+                total_steps += 1
+                env_steps.add()
+                profiler.count("env_steps")
+
+            elif record[0] == "episode" and episode < episodes:
+                _, player_1_episode_reward, player_2_episode_reward, episode_steps = record
+
+                agent.end_episode(episode, player_1_episode_reward, player_2_episode_reward, actor_use_checkpoint[actor_id])
+                shared_epsilon.value = agent.epsilon
+                print(f"Completed episode {episode} (actor {actor_id}) with Player 1 score {player_1_episode_reward}")
+                print(f"Completed episode {episode} (actor {actor_id}) with Player 2 score {player_2_episode_reward}")
+                print(f"Episode Steps: {episode_steps}")
+
+                episode += 1
+
+    try:
+        while episode < episodes:
+
+            # Store up to drain_chunks chunks per gradient step, block only while
+            # the buffer is too small to learn from.
+            drained = 0
+            try:
+                while episode < episodes:
+                    block = not agent.memory.can_sample(batch_size)
+                    if not block and drained >= drain_chunks:
+                        break
+
+                    actor_id, records = transitions.get(block=block, timeout=1.0 if block else None)
+                    store(actor_id, records)
+                    drained += 1
+            except queue.Empty:
+                pass
+
+            # end_episode (or a finished background eval) may have changed the pool.
+            publish_pool()
+
+            if episode >= episodes:
+                break
+
+            if not agent.memory.can_sample(batch_size):
+                continue
+
+            updates += 1
+            agent.learn(batch_size, updates)
+            updates_rate.add()
+
+            if updates % publish_interval == 0:
+                with weights_lock:
+                    shared_model.load_state_dict(agent.model.state_dict())
+                    weights_version.value += 1
+
+            if time.perf_counter() - last_log >= log_interval:
+                steps_per_sec = env_steps.rate()
+                updates_per_sec = updates_rate.rate()
+                last_log = time.perf_counter()
+
+                agent.metrics.log({"Stats/env_steps_per_sec": steps_per_sec,
+                           "Stats/updates_per_sec": updates_per_sec,
+                           "Stats/weights_version": weights_version.value,
+                           "total_steps": total_steps})
+                print(f"Env steps/sec: {steps_per_sec:.1f} Updates/sec: {updates_per_sec:.1f} "
+                      f"Weights version: {weights_version.value}")
+
+    finally:
+        stop_event.set()
+
+        # Unblock actors stuck on a full queue before joining them.
+        try:
+            while True:
+                transitions.get_nowait()
+        except queue.Empty:
+            pass
+
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+
+        agent.finish_training()
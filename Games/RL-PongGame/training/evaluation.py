@@ -0,0 +1,146 @@
+import concurrent.futures
+import math
+import multiprocessing as mp
+import random
+import numpy as np
+import torch
+from training.model import build_model
+from training.inference import InferenceModel
+from training.frame_stack import FrameStack
+from backend.core.observation import frame_spec, mirror_observation
+
+
+def mean_interval(values, z=1.96):
+    # Mean and the half width of its normal confidence interval.
+    values = np.asarray(values, dtype=np.float64)
+
+    if len(values) < 2:
+        return float(values.mean()) if len(values) else 0.0, 0.0
+
+    return float(values.mean()), float(z * values.std(ddof=1) / math.sqrt(len(values)))
+
+
+def wilson_interval(wins, n, z=1.96):
+    # Win rate with its Wilson score interval, stays inside [0, 1] even at 0 or n wins.
+    if n == 0:
+        return 0.0, 0.0, 0.0
+
+    p = wins / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+
+    return p, centre - half_width, centre + half_width
+
+
+def summarize(scores):
+    mean_score, mean_score_ci = mean_interval(scores)
+    win_rate, win_rate_low, win_rate_high = wilson_interval(int((scores > 0).sum()), len(scores))
+
+    return {"episodes": len(scores),
+            "mean_score": mean_score,
+            "mean_score_ci": mean_score_ci,
+            "win_rate": win_rate,
+            "win_rate_low": win_rate_low,
+            "win_rate_high": win_rate_high}
+
+
+def evaluate_policy(policy, obs_stack, bot_difficulty, num_episodes, max_episode_steps, seed, obs_mode="pixels"):
+    # Greedy games against the bot, all in one VectorPong. Even games play
+    # as player 1, odd games as player 2 on the mirrored screen like
+    # Agent.eval. A game scores the points it won minus the points it lost.
+    # policy maps a (N, obs_stack, 84, 84) uint8 batch (or (N, obs_stack,
+    # STATE_DIM) floats for obs_mode="state") to Q-values.
+    from backend.core.vector import VectorPong
+
+    envs = VectorPong(num_episodes, bot_difficulty=bot_difficulty, autoreset=False, seed=seed, obs_mode=obs_mode)
+    frames = FrameStack(num_episodes, obs_stack, **frame_spec(obs_mode))
+
+    env_obs, info = envs.reset()
+    obs = frames.reset(env_obs)
+
+    player_2 = np.arange(num_episodes) % 2 == 1
+    mirrored = torch.from_numpy(player_2).reshape(-1, *[1] * (obs.dim() - 1))
+
+    scores = np.zeros(num_episodes)
+    active = np.ones(num_episodes, dtype=bool)
+
+    for _ in range(max_episode_steps):
+        with torch.no_grad():
+            q_values = policy(torch.where(mirrored, mirror_observation(obs, obs_mode), obs))
+            greedy = torch.argmax(q_values, dim=-1).numpy()
+
+        actions = np.stack([np.where(player_2, -1, greedy), np.where(player_2, greedy, -1)], axis=1)
+
+        env_obs, player_1_reward, player_2_reward, done, truncated, info = envs.step(actions)
+
+        scores += np.where(player_2, player_2_reward, player_1_reward) * active
+        active &= ~(done | truncated)
+
+        if not active.any():
+            break
+
+        obs = frames.push(env_obs)
+
+    return {"bot_difficulty": bot_difficulty,
+            "player_1": summarize(scores[~player_2]),
+            "player_2": summarize(scores[player_2]),
+            "all": summarize(scores)}
+
+
+def run_evaluation(model_kwargs, state_dict, bot_difficulty, num_episodes, max_episode_steps, seed):
+    torch.set_num_threads(1)
+
+    obs_mode = model_kwargs.get("obs_mode", "pixels")
+
+    model = build_model(**model_kwargs)
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    policy = InferenceModel(model) if obs_mode == "pixels" else model
+
+    return evaluate_policy(policy, model_kwargs["obs_stack"], bot_difficulty,
+                           num_episodes, max_episode_steps, seed, obs_mode=obs_mode)
+
+
+class EvaluationService:
+
+    # Evaluates frozen copies of the weights in worker processes while
+    # training keeps going. submit() snapshots the model and returns at once,
+    # poll() hands back the results that have finished, in submission order,
+    # each with the tag it was submitted with.
+
+    def __init__(self, model_kwargs, num_workers=1, num_episodes=32, max_episode_steps=1000):
+        self.model_kwargs = model_kwargs
+        self.num_episodes = num_episodes
+        self.max_episode_steps = max_episode_steps
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers,
+                                                               mp_context=mp.get_context("spawn"))
+        self.pending = []
+
+
+    def submit(self, model, bot_difficulty, tag=None):
+        state_dict = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+
+        future = self.executor.submit(run_evaluation, self.model_kwargs, state_dict, bot_difficulty,
+                                      self.num_episodes, self.max_episode_steps, random.randrange(2 ** 31))
+        self.pending.append((future, tag))
+
+
+    def poll(self, wait=False):
+        results = []
+
+        while self.pending and (wait or self.pending[0][0].done()):
+            future, tag = self.pending.pop(0)
+
+            result = future.result()
+            result["tag"] = tag
+            results.append(result)
+
+        return results
+
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pending = []
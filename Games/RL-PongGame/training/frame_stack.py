@@ -0,0 +1,58 @@
+import torch
+
+
+class FrameStack:
+
+    # Preallocated frame stacks for N games pushed in lockstep. Frames go
+    # into a ring of frame_stack + 1 slots, each written twice (slot and
+    # slot + ring_size) so the newest frame_stack frames are always one
+    # contiguous slice. view() returns that slice without copying. It stays
+    # valid for one further push, so a (state, next_state) pair can be
+    # stored together without cloning. Frames are uint8 images by default,
+    # frame_shape=(STATE_DIM,) with dtype=torch.float32 stacks state vectors.
+
+    def __init__(self, num_envs, frame_stack, frame_shape=(84, 84), device='cpu', dtype=torch.uint8):
+        self.num_envs = num_envs
+        self.frame_stack = frame_stack
+        self.ring_size = frame_stack + 1
+
+        self.frames = torch.zeros((num_envs, 2 * self.ring_size, *frame_shape), dtype=dtype, device=device)
+        self.pos = 0
+        self.started = False
+
+
+    def _as_frames(self, obs):
+        # Accepts (N, 1, H, W) or (N, H, W), numpy or torch, uint8 or 0/255 floats.
+        obs = torch.as_tensor(obs, device=self.frames.device)
+        return obs.reshape(self.num_envs, *self.frames.shape[2:])
+
+
+    def view(self):
+        end = self.pos + self.ring_size + 1
+        return self.frames[:, end - self.frame_stack:end]
+
+
+    def push(self, obs):
+        frames = self._as_frames(obs)
+
+        self.pos = (self.pos + 1) % self.ring_size
+
+        self.frames[:, self.pos] = frames
+        self.frames[:, self.pos + self.ring_size] = frames
+
+        return self.view()
+
+
+    def reset(self, obs, mask=None):
+        # Fills the whole history of the selected games with their first frame.
+        frames = self._as_frames(obs)
+
+        if mask is None:
+            self.frames[:] = frames.unsqueeze(1)
+        else:
+            idx = torch.as_tensor(mask, device=self.frames.device).nonzero().flatten()
+            self.frames[idx] = frames[idx].unsqueeze(1)
+
+        self.started = True
+
+        return self.view()
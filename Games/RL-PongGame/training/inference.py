@@ -0,0 +1,141 @@
+import copy
+import time
+import warnings
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class FoldedModel(nn.Module):
+
+    # Model with the x / 255 input scaling folded into conv1's weights, so a
+    # uint8 stack goes straight in without a scaled float copy. Activations
+    # run channels_last, the layout the CPU conv kernels prefer.
+
+    def __init__(self, model):
+        super(FoldedModel, self).__init__()
+
+        self.conv1 = copy.deepcopy(model.conv1)
+        self.conv2 = copy.deepcopy(model.conv2)
+        self.conv3 = copy.deepcopy(model.conv3)
+        self.fc1 = copy.deepcopy(model.fc1)
+        self.output = copy.deepcopy(model.output)
+        self.downsample = model.downsample
+
+        self.to(memory_format=torch.channels_last)
+        self.fold(model)
+
+
+    def fold(self, model):
+        # Copies model's weights in place.
+        # conv1(x / 255) == conv1'(x) with conv1'.weight = conv1.weight / 255, the bias is unchanged.
+        with torch.no_grad():
+            for name in ("conv1", "conv2", "conv3", "fc1", "output"):
+                getattr(self, name).load_state_dict(getattr(model, name).state_dict())
+
+            self.conv1.weight.div_(255)
+
+
+    def forward(self, x):
+
+        x = x.float().contiguous(memory_format=torch.channels_last)
+
+        # Pooling is linear, so it commutes with the folded scaling.
+        if(self.downsample > 1):
+            x = F.avg_pool2d(x, self.downsample)
+
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
+        x = F.relu(self.conv3(x))
+
+        x = x.reshape(x.size(0), -1) # flatten, back to NCHW order.
+
+        x = F.relu(self.fc1(x))
+
+        return self.output(x)
+
+
+class InferenceModel:
+
+    # Fast CPU forward for weights that stay fixed between calls (eval, human
+    # play, actors). The first call with a new input shape builds candidate
+    # graphs of the FoldedModel: a frozen TorchScript graph and the same graph
+    # after optimize_for_inference, which fuses each conv with its ReLU into
+    # MKLDNN kernels. Whichever of these and the eager FoldedModel runs fastest
+    # is cached for that shape (the fused kernels win on some CPUs and lose on others).
+    # Shapes past max_graphs run the FoldedModel. Call refresh() after the
+    # source model's weights change, it drops the cached graphs but keeps the
+    # choices, so the next call only rebuilds the graph that won.
+
+    def __init__(self, model, max_graphs=8, tune_calls=5):
+        self.model = model
+        self.max_graphs = max_graphs
+        self.tune_calls = tune_calls
+
+        self.folded = FoldedModel(model).eval()
+        self.graphs = {}
+        self.choices = {}
+
+
+    def refresh(self):
+        self.folded.fold(self.model)
+        self.graphs = {}
+
+
+    def time_call(self, graph, x):
+        best = float("inf")
+
+        for _ in range(self.tune_calls):
+            start = time.perf_counter()
+            graph(x)
+            best = min(best, time.perf_counter() - start)
+
+        return best
+
+
+    def build(self, name, x):
+        if name == "eager":
+            return self.folded
+
+        # Newer torch warns that TorchScript is deprecated, torch.compile needs a C++ toolchain at runtime.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            graph = torch.jit.freeze(torch.jit.trace(self.folded, x))
+
+            if name == "fused":
+                graph = torch.jit.optimize_for_inference(graph)
+
+        # The profiling executor specialises a graph over its first calls.
+        for _ in range(2):
+            graph(x)
+
+        return graph
+
+
+    def compile(self, x, key):
+        if key in self.choices:
+            return self.choices[key], self.build(self.choices[key], x)
+
+        candidates = {name: self.build(name, x) for name in ("eager", "frozen", "fused")}
+        name = min(candidates, key=lambda name: self.time_call(candidates[name], x))
+
+        return name, candidates[name]
+
+
+    def __call__(self, x):
+        key = (tuple(x.shape), x.dtype)
+
+        with torch.no_grad():
+            graph = self.graphs.get(key)
+
+            if graph is None:
+                if len(self.graphs) >= self.max_graphs:
+                    return self.folded(x)
+
+                self.choices[key], graph = self.compile(x, key)
+                self.graphs[key] = graph
+
+            return graph(x)
+
+
+    forward = __call__
@@ -0,0 +1,216 @@
+import csv
+import json
+import os
+import queue
+import threading
+import time
+import torch
+
+
+class WandbBackend:
+
+    def __init__(self, project, name, config):
+        # Imported here so training runs without wandb installed.
+        import wandb
+
+        self.wandb = wandb
+        self.wandb.init(project=project, name=name, config=config)
+
+
+    def write(self, metrics):
+        self.wandb.log(metrics)
+
+
+    def write_video(self, name, path, extra):
+        self.wandb.log({name: self.wandb.Video(path, format="mp4"), **extra})
+
+
+    def close(self):
+        self.wandb.finish()
+
+
+class JsonlBackend:
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a")
+
+
+    def write(self, metrics):
+        self.file.write(json.dumps({"time": time.time(), **metrics}) + "\n")
+        self.file.flush()
+
+
+    def write_video(self, name, path, extra):
+        self.write({name: path, **extra})
+
+
+    def close(self):
+        self.file.close()
+
+
+class CsvBackend:
+
+    # Long format (time, metric, value) so rows with different keys share one header.
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(["time", "metric", "value"])
+
+
+    def write(self, metrics):
+        now = time.time()
+        self.writer.writerows([now, name, value] for name, value in metrics.items())
+        self.file.flush()
+
+
+    def write_video(self, name, path, extra):
+        self.write({name: path, **extra})
+
+
+    def close(self):
+        self.file.close()
+
+
+class MemoryBackend:
+
+    def __init__(self):
+        self.rows = []
+
+
+    def write(self, metrics):
+        self.rows.append(metrics)
+
+
+    def write_video(self, name, path, extra):
+        self.rows.append({name: path, **extra})
+
+
+    def close(self):
+        pass
+
+
+def create_backends(names, run_name, config, project="pong-rl", log_dir="logs"):
+    backends = []
+
+    for name in names:
+        if name == "wandb":
+            try:
+                backends.append(WandbBackend(project, run_name, config))
+            except ImportError:
+                print("wandb is not installed, skipping the wandb metrics backend")
+        elif name == "jsonl":
+            backends.append(JsonlBackend(os.path.join(log_dir, f"{run_name}.jsonl")))
+        elif name == "csv":
+            backends.append(CsvBackend(os.path.join(log_dir, f"{run_name}.csv")))
+        elif name == "memory":
+            backends.append(MemoryBackend())
+        else:
+            raise ValueError(f"Unknown metrics backend {name}, expected wandb, jsonl, csv or memory")
+
+    if not backends:
+        print(f"No metrics backend available, logging to {log_dir}/{run_name}.jsonl")
+        backends.append(JsonlBackend(os.path.join(log_dir, f"{run_name}.jsonl")))
+
+    return backends
+
+
+class MetricsLogger:
+
+    # Per-step scalars (the loss) are summed on their own device with
+    # accumulate(), so the training loop never waits on .item(). Every
+    # flush_every steps or flush_seconds their means go to a background
+    # thread, which does the device sync and the backend writes. log() sends
+    # one-off rows (episode stats, evals) down the same queue.
+
+    def __init__(self, backends, flush_every=100, flush_seconds=10.0):
+        self.backends = backends
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+
+        self.sums = {}
+        self.counts = {}
+        self.steps = 0
+        self.extra = {}
+        self.last_flush = time.perf_counter()
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            kind, metrics, extra = item
+
+            try:
+                if kind == "video":
+                    for backend in self.backends:
+                        backend.write_video(metrics[0], metrics[1], extra)
+                    continue
+
+                row = {name: value.item() if torch.is_tensor(value) else value for name, value in metrics.items()}
+                row.update(extra)
+
+                for backend in self.backends:
+                    backend.write(row)
+            except Exception as e:
+                print(f"Metrics backend failed: {e}")
+
+
+    def accumulate(self, name, value):
+        if torch.is_tensor(value):
+            value = value.detach()
+
+        # Out of place so a flushed sum is never modified afterwards.
+        self.sums[name] = self.sums[name] + value if name in self.sums else value
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+    def step(self, extra=None):
+        # Call once per training step, extra (e.g. total_steps) goes with the flushed row.
+        self.steps += 1
+        self.extra = extra or {}
+
+        if self.steps >= self.flush_every or time.perf_counter() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+
+    def flush(self, extra=None):
+        if self.sums:
+            means = {name: total / self.counts[name] for name, total in self.sums.items()}
+            self.queue.put(("scalars", means, self.extra if extra is None else extra))
+
+        self.sums = {}
+        self.counts = {}
+        self.steps = 0
+        self.last_flush = time.perf_counter()
+
+
+    def log(self, metrics):
+        self.queue.put(("scalars", dict(metrics), {}))
+
+
+    def log_video(self, name, path, extra=None):
+        self.queue.put(("video", (name, path), extra or {}))
+
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+        for backend in self.backends:
+            backend.close()
@@ -1,11 +1,13 @@
 from sys import exc_info
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
 class Model(nn.Module):
 
-    def __init__(self, action_dim, hidden_dim=256, observation_shape=None, obs_stack=4) -> None:
+    def __init__(self, action_dim, hidden_dim=256, observation_shape=None, obs_stack=4,
+                 channels=(32, 64, 64), downsample=1) -> None:
         super(Model, self).__init__()
 
         # 3 Conv Layers
@@ -13,10 +15,14 @@ class Model(nn.Module):
         # out_channels 32, kernal size 8, stride 4
         # 32, 64, k=4, s=2
         # 64, 64, k=3, s=1
+        # channels and downsample (average pooling of the input, 2 -> 42x42)
+        # shrink it for distilled students, see training/distillation.py.
+
+        self.downsample = downsample
 
-        self.conv1 = nn.Conv2d(in_channels=obs_stack, out_channels=32, kernel_size=8, stride=4)
-        self.conv2 = nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, stride=2)
-        self.conv3 = nn.Conv2d(in_channels=64, out_channels=64, kernel_size=3, stride=1)
+        self.conv1 = nn.Conv2d(in_channels=obs_stack, out_channels=channels[0], kernel_size=8, stride=4)
+        self.conv2 = nn.Conv2d(in_channels=channels[0], out_channels=channels[1], kernel_size=4, stride=2)
+        self.conv3 = nn.Conv2d(in_channels=channels[1], out_channels=channels[2], kernel_size=3, stride=1)
 
         conv_output_size = self.calculate_conv_output(observation_shape)
 
@@ -27,6 +33,8 @@ class Model(nn.Module):
 
     def calculate_conv_output(self, observation_shape):
         x = torch.zeros(1, *observation_shape)
+        if(self.downsample > 1):
+            x = F.avg_pool2d(x, self.downsample)
         x = F.relu(self.conv1(x))
         x = F.relu(self.conv2(x))
         x = F.relu(self.conv3(x))
@@ -48,6 +56,9 @@ class Model(nn.Module):
 
         x = x / 255
 
+        if(self.downsample > 1):
+            x = F.avg_pool2d(x, self.downsample)
+
         x = F.relu(self.conv1(x))
         x = F.relu(self.conv2(x))
         x = F.relu(self.conv3(x))
@@ -78,6 +89,46 @@ class Model(nn.Module):
         except FileNotFoundError:
             print(f"No weights file found at {filename}")
 
-    
-        
+
+class StateModel(nn.Module):
+
+    # MLP for obs_mode="state", takes (batch, obs_stack, STATE_DIM) stacks of
+    # ball and paddle coordinates instead of 84x84 frames.
+
+    weights_init = Model.weights_init
+
+    def __init__(self, action_dim, hidden_dim=256, observation_shape=None, obs_stack=4) -> None:
+        super(StateModel, self).__init__()
+
+        self.fc1 = nn.Linear(int(np.prod(observation_shape)), hidden_dim)
+        self.fc2 = nn.Linear(hidden_dim, hidden_dim)
+        self.output = nn.Linear(hidden_dim, action_dim)
+
+        self.apply(self.weights_init)
+
+    def forward(self, x):
+
+        x = x.float().reshape(x.size(0), -1) # flatten the stack.
+
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+
+        return self.output(x)
+
+
+    # Saved apart from the pixel model so the two never overwrite each other.
+    def save_the_model(self, filename='models/latest_state.pt'):
+        Model.save_the_model(self, filename)
+
+
+    def load_the_model(self, filename='models/latest_state.pt'):
+        Model.load_the_model(self, filename)
+
+
+def build_model(obs_mode="pixels", **model_kwargs):
+    # The network for obs_mode, Agent.model_kwargs go straight in.
+    if obs_mode == "state":
+        return StateModel(**model_kwargs)
+
+    return Model(**model_kwargs)
 
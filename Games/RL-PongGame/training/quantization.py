@@ -0,0 +1,193 @@
+import contextlib
+import copy
+import json
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import QuantStub, DeQuantStub, get_default_qconfig, prepare, convert, fuse_modules, quantize_dynamic
+from training.frame_stack import FrameStack
+
+
+# Post-training int8 quantization of Model for CPU inference. "dynamic"
+# quantizes the weights of fc1 and output and the activations on the fly,
+# "static" quantizes every layer with activation ranges calibrated on real
+# observations. Both are saved as TorchScript with their settings, load them
+# with load_quantized() or Agent(eval=True, quantized_model=path).
+
+
+@contextlib.contextmanager
+def quiet_deprecations():
+    # torch.ao.quantization and TorchScript warn about their deprecation on every call.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        yield
+
+
+class QuantizableModel(nn.Module):
+
+    # Model with ReLU modules to fuse into the convs and fc1, and stubs
+    # marking where the int8 part of the graph starts and ends.
+
+    def __init__(self, model):
+        super(QuantizableModel, self).__init__()
+
+        self.conv1 = copy.deepcopy(model.conv1)
+        self.conv2 = copy.deepcopy(model.conv2)
+        self.conv3 = copy.deepcopy(model.conv3)
+        self.fc1 = copy.deepcopy(model.fc1)
+        self.output = copy.deepcopy(model.output)
+        self.downsample = model.downsample
+
+        self.relu1 = nn.ReLU()
+        self.relu2 = nn.ReLU()
+        self.relu3 = nn.ReLU()
+        self.relu4 = nn.ReLU()
+
+        self.quant = QuantStub()
+        self.dequant = DeQuantStub()
+
+
+    def forward(self, x):
+
+        x = self.quant(x.float() / 255)
+
+        if(self.downsample > 1):
+            x = F.avg_pool2d(x, self.downsample)
+
+        x = self.relu1(self.conv1(x))
+        x = self.relu2(self.conv2(x))
+        x = self.relu3(self.conv3(x))
+
+        x = x.reshape(x.size(0), -1) # flatten.
+
+        x = self.relu4(self.fc1(x))
+
+        return self.dequant(self.output(x))
+
+
+def default_engine():
+    engines = torch.backends.quantized.supported_engines
+    return "x86" if "x86" in engines else "fbgemm" if "fbgemm" in engines else "qnnpack"
+
+
+def quantize_dynamic_model(model):
+    model = copy.deepcopy(model).cpu().eval()
+
+    with quiet_deprecations():
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_model(model, calibration_obs, engine=None, batch_size=256):
+    # calibration_obs is a (N, obs_stack, 84, 84) uint8 tensor of observations
+    # the model will see, the observers record the activation ranges over it.
+    engine = engine or default_engine()
+    torch.backends.quantized.engine = engine
+
+    qmodel = QuantizableModel(model).cpu().eval()
+    qmodel.qconfig = get_default_qconfig(engine)
+
+    with quiet_deprecations(), torch.no_grad():
+        fuse_modules(qmodel, [["conv1", "relu1"], ["conv2", "relu2"], ["conv3", "relu3"], ["fc1", "relu4"]], inplace=True)
+        prepare(qmodel, inplace=True)
+
+        for start in range(0, len(calibration_obs), batch_size):
+            qmodel(calibration_obs[start:start + batch_size])
+
+        convert(qmodel, inplace=True)
+
+    return qmodel
+
+
+def buffer_observations(buffer, num_obs, batch_size=256):
+    # States sampled uniformly from a ReplayBuffer or FrameReplayBuffer.
+    batches = []
+
+    while sum(len(batch) for batch in batches) < num_obs:
+        states = buffer.sample_buffer(min(batch_size, num_obs))[0]
+        batches.append(states.cpu().to(torch.uint8))
+
+    return torch.cat(batches)[:num_obs]
+
+
+def record_observations(policy, obs_stack, num_obs, bot_difficulty="hard", num_envs=16, epsilon=0.1, seed=0):
+    # Stacks from games of policy against the bot, half of them played as
+    # player 2 on the mirrored screen, i.e. exactly the inputs policy gets
+    # during play. epsilon random actions keep the games from repeating.
+    from backend.core.vector import VectorPong
+
+    rng = np.random.default_rng(seed)
+    envs = VectorPong(num_envs, bot_difficulty=bot_difficulty, seed=seed)
+    frames = FrameStack(num_envs, obs_stack)
+
+    env_obs, info = envs.reset()
+    obs = frames.reset(env_obs)
+
+    player_2 = np.arange(num_envs) % 2 == 1
+    mirrored = torch.from_numpy(player_2)[:, None, None, None]
+
+    recorded = []
+    while len(recorded) * num_envs < num_obs:
+        inputs = torch.where(mirrored, torch.flip(obs, dims=[-1]), obs)
+        recorded.append(inputs.clone())
+
+        with torch.no_grad():
+            greedy = torch.argmax(policy(inputs), dim=-1).numpy()
+
+        greedy = np.where(rng.random(num_envs) < epsilon, rng.integers(0, 3, num_envs), greedy)
+        actions = np.stack([np.where(player_2, -1, greedy), np.where(player_2, greedy, -1)], axis=1)
+
+        env_obs, player_1_reward, player_2_reward, done, truncated, info = envs.step(actions)
+
+        obs = frames.push(env_obs)
+        if (done | truncated).any():
+            obs = frames.reset(env_obs, done | truncated)
+
+    return torch.cat(recorded)[:num_obs]
+
+
+def save_quantized(qmodel, path, mode, obs_stack, engine=None):
+    example = torch.zeros((1, obs_stack, 84, 84), dtype=torch.uint8)
+    settings = {"mode": mode, "engine": engine or torch.backends.quantized.engine, "obs_stack": obs_stack}
+
+    with quiet_deprecations(), torch.no_grad():
+        traced = torch.jit.trace(qmodel, example)
+        torch.jit.save(traced, path, _extra_files={"quantization.json": json.dumps(settings)})
+
+
+def load_quantized(path):
+    # Returns the TorchScript model and the settings it was saved with.
+    extra_files = {"quantization.json": ""}
+
+    with quiet_deprecations():
+        qmodel = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+
+    settings = json.loads(extra_files["quantization.json"])
+
+    # The int8 kernels have to come from the engine the weights were packed for.
+    if settings["engine"] in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = settings["engine"]
+
+    qmodel.eval()
+
+    return qmodel, settings
+
+
+def action_agreement(reference, candidate, observations, batch_size=256):
+    # Share of observations where both pick the same greedy action, and the largest Q-value difference.
+    agree = 0
+    max_error = 0.0
+
+    with torch.no_grad():
+        for start in range(0, len(observations), batch_size):
+            x = observations[start:start + batch_size]
+            reference_q = reference(x)
+            candidate_q = candidate(x)
+
+            agree += int((reference_q.argmax(dim=-1) == candidate_q.argmax(dim=-1)).sum())
+            max_error = max(max_error, float((reference_q - candidate_q).abs().max()))
+
+    return agree / len(observations), max_error
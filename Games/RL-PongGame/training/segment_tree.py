@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class SumMinTree:
+
+    # Array-backed binary segment tree over `capacity` leaves keeping both the
+    # sum and the min of the leaf values. Node i has children 2i and 2i + 1,
+    # leaves start at self.size. Updates and prefix-sum searches take a batch of
+    # indices and walk the tree level by level, so the work is O(batch * log N)
+    # NumPy ops with no per-item Python loop.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+
+        self.depth = int(np.log2(self.size))
+
+        self.sum_tree = np.zeros(2 * self.size, dtype=np.float64)
+        self.min_tree = np.full(2 * self.size, np.inf, dtype=np.float64)
+
+
+    def update(self, idx, values):
+        idx = np.asarray(idx, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        # Keep the last value when the same leaf shows up twice in a batch.
+        idx, last = np.unique(idx[::-1], return_index=True)
+        values = values[::-1][last]
+
+        nodes = idx + self.size
+        self.sum_tree[nodes] = values
+        # Empty leaves (priority 0) must not drag the minimum down.
+        self.min_tree[nodes] = np.where(values > 0, values, np.inf)
+
+        # Duplicate parents just recompute the same value, no need to dedupe.
+        for _ in range(self.depth):
+            nodes = nodes // 2
+            self.sum_tree[nodes] = self.sum_tree[2 * nodes] + self.sum_tree[2 * nodes + 1]
+            self.min_tree[nodes] = np.minimum(self.min_tree[2 * nodes], self.min_tree[2 * nodes + 1])
+
+
+    def get(self, idx):
+        return self.sum_tree[np.asarray(idx, dtype=np.int64) + self.size]
+
+
+    def total(self):
+        return self.sum_tree[1]
+
+
+    def min(self):
+        return self.min_tree[1]
+
+
+    def find_prefixsum(self, mass):
+        # For every mass, the leaf where the running sum of leaf values passes it.
+        mass = np.array(mass, dtype=np.float64)
+        nodes = np.ones(len(mass), dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = mass >= self.sum_tree[left]
+
+            mass = np.where(go_right, mass - self.sum_tree[left], mass)
+            nodes = np.where(go_right, left + 1, left)
+
+        return np.minimum(nodes - self.size, self.capacity - 1)
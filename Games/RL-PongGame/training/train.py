@@ -13,43 +13,102 @@ max_buffer_size = 200000
 target_update_interval = 10000
 checkpoint_pool = 5
 hidden_layer = 756
+obs_mode = "pixels"  # "state" trains an MLP on ball / paddle coordinates, with num_envs > 1 needs vector_env = "numpy"
+num_envs = 1
+vector_env = "async"
+replay_buffer = "standard"  # "frame" stores each frame once
+packed_frames = False  # bit-packs the binary frames, 8x less replay memory
+prioritized_replay = False
+buffer_dir = None  # e.g. "replay" to keep the buffer on disk and resume it
+prefetch_batches = 0  # > 0 samples batches on a background thread
+num_actors = 0  # > 0 runs actor processes with a separate learner loop
+weight_sync_interval = 400
+publish_interval = 100
+eval_workers = 0  # > 0 runs the periodic evals in background processes
+eval_episodes = 32
+video_scale = 0.5
+video_frame_skip = 1
+metrics_backends = ["wandb", "jsonl"]  # also "csv", runs offline without wandb installed
+profile = False
+profile_window = None  # e.g. (10, 12) writes a trace of episodes 10 and 11 to profiles/
+profile_trace = "cprofile"  # or "torch"
 
-start_time = time.perf_counter()
-
-# Create config dict for wandb
-config = {
-    "episodes": episodes,
-    "max_episode_steps": max_episode_steps,
-    "batch_size": batch_size,
-    "learning_rate": learning_rate,
-    "epsilon": epsilon,
-    "min_epsilon": min_epsilon,
-    "epsilon_decay": epsilon_decay,
-    "gamma": gamma,
-    "max_buffer_size": max_buffer_size,
-    "target_update_interval": target_update_interval,
-    "checkpoint_pool": checkpoint_pool,
-    "hidden_layer": hidden_layer,
-    "algorithm": "DQN"
-}
-
-agent = Agent(hidden_layer=hidden_layer,
-              learning_rate=learning_rate,
-              gamma=gamma,
-              max_buffer_size=max_buffer_size,
-              target_update_interval=target_update_interval,
-              max_episode_steps=max_episode_steps,
-              epsilon=epsilon,
-              min_epsilon=min_epsilon,
-              epsilon_decay=epsilon_decay,
-              checkpoint_pool=checkpoint_pool)
-
-agent.train(episodes=episodes,
-            config=config,
-            batch_size=batch_size)
-
-end_time = time.perf_counter()
-
-elapsed_time = end_time - start_time
-
-print(f"Training run completed in {elapsed_time} seconds.")
+# Guarded so the env worker processes (num_envs > 1) can import this module safely.
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+
+    # Create config dict for wandb
+    config = {
+        "episodes": episodes,
+        "max_episode_steps": max_episode_steps,
+        "batch_size": batch_size,
+        "learning_rate": learning_rate,
+        "epsilon": epsilon,
+        "min_epsilon": min_epsilon,
+        "epsilon_decay": epsilon_decay,
+        "gamma": gamma,
+        "max_buffer_size": max_buffer_size,
+        "target_update_interval": target_update_interval,
+        "checkpoint_pool": checkpoint_pool,
+        "hidden_layer": hidden_layer,
+        "obs_mode": obs_mode,
+        "num_envs": num_envs,
+        "vector_env": vector_env,
+        "replay_buffer": replay_buffer,
+        "packed_frames": packed_frames,
+        "prioritized_replay": prioritized_replay,
+        "buffer_dir": buffer_dir,
+        "prefetch_batches": prefetch_batches,
+        "num_actors": num_actors,
+        "weight_sync_interval": weight_sync_interval,
+        "publish_interval": publish_interval,
+        "eval_workers": eval_workers,
+        "eval_episodes": eval_episodes,
+        "video_scale": video_scale,
+        "video_frame_skip": video_frame_skip,
+        "metrics_backends": metrics_backends,
+        "profile": profile,
+        "profile_window": profile_window,
+        "profile_trace": profile_trace,
+        "algorithm": "DQN"
+    }
+
+    agent = Agent(hidden_layer=hidden_layer,
+                  learning_rate=learning_rate,
+                  gamma=gamma,
+                  max_buffer_size=max_buffer_size,
+                  target_update_interval=target_update_interval,
+                  max_episode_steps=max_episode_steps,
+                  epsilon=epsilon,
+                  min_epsilon=min_epsilon,
+                  epsilon_decay=epsilon_decay,
+                  checkpoint_pool=checkpoint_pool,
+                  num_envs=num_envs,
+                  vector_env=vector_env,
+                  replay_buffer=replay_buffer,
+                  packed_frames=packed_frames,
+                  prioritized_replay=prioritized_replay,
+                  buffer_dir=buffer_dir,
+                  prefetch_batches=prefetch_batches,
+                  num_actors=num_actors,
+                  weight_sync_interval=weight_sync_interval,
+                  publish_interval=publish_interval,
+                  eval_workers=eval_workers,
+                  eval_episodes=eval_episodes,
+                  video_scale=video_scale,
+                  video_frame_skip=video_frame_skip,
+                  metrics_backends=metrics_backends,
+                  profile=profile,
+                  profile_window=profile_window,
+                  profile_trace=profile_trace,
+                  obs_mode=obs_mode)
+
+    agent.train(episodes=episodes,
+                config=config,
+                batch_size=batch_size)
+
+    end_time = time.perf_counter()
+
+    elapsed_time = end_time - start_time
+
+    print(f"Training run completed in {elapsed_time} seconds.")
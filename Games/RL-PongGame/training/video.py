@@ -0,0 +1,99 @@
+import os
+import queue
+import threading
+import cv2
+import pygame
+
+
+class VideoRecorder:
+
+    # Streams frames of a pygame surface into an mp4 on a background thread.
+    # add_frame() only scales the surface down and copies the small frame into
+    # a bounded queue, the writer thread encodes it. Memory stays at
+    # queue_size small frames however long the episode runs.
+
+    def __init__(self, path, frame_size, fps=30, scale=0.5, frame_skip=1, queue_size=32):
+        self.path = path
+        self.frame_skip = max(1, frame_skip)
+        self.frame_count = 0
+        self.written = 0
+
+        width, height = frame_size
+        self.size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+        self.scaled = pygame.Surface(self.size)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Skipped frames are dropped, not duplicated, so the file plays at fps / frame_skip.
+        self.fps = fps / self.frame_skip
+
+        # H.264 plays in browsers and wandb, OpenCV builds without an encoder for it get mp4v.
+        for codec in ("avc1", "mp4v"):
+            self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), self.fps, self.size)
+            if self.writer.isOpened():
+                break
+            self.writer.release()
+        else:
+            raise RuntimeError(f"Could not open a video writer for {path}")
+
+        self.codec = codec
+        if codec != "avc1":
+            print(f"OpenCV has no H.264 encoder, {path} is mp4v and may not play in a browser")
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+
+                # surfarray is (W, H, RGB), the writer wants (H, W, BGR).
+                self.writer.write(cv2.cvtColor(frame.transpose(1, 0, 2), cv2.COLOR_RGB2BGR))
+                self.written += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.writer.release()
+
+
+    def add_frame(self, surface):
+        self.frame_count += 1
+        if (self.frame_count - 1) % self.frame_skip != 0:
+            return
+
+        pygame.transform.scale(surface, self.size, self.scaled)
+        frame = pygame.surfarray.array3d(self.scaled)
+
+        # A writer that died stops draining the queue, never block on it.
+        while True:
+            if self.error is not None:
+                raise self.error
+            if not self.thread.is_alive():
+                raise RuntimeError(f"Video writer for {self.path} stopped")
+
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+    def close(self):
+        # Waits for the queued frames, returns the path of the finished file.
+        if self.thread.is_alive():
+            self.frames.put(None)
+            self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.path